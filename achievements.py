@@ -0,0 +1,133 @@
+import json
+import os
+
+import numpy as np
+
+from visits_bitset import popcount
+
+# Рядом с модулем, а не в текущем каталоге: ядро запускается и из скриптов
+ACHIEVEMENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "achievements.json")
+
+
+class Rule:
+    """Правило достижения: сколько посещённых мест, подходящих под условие, нужно набрать.
+
+    Типы правил в конфиге:
+      count  — любые места;
+      rating — места с рейтингом не ниже min_rating;
+      region — места внутри bbox [west, south, east, north].
+    min — порог числа мест или "all" (все подходящие места каталога).
+    """
+
+    def __init__(self, config):
+        self.id = config["id"]
+        self.title = config["title"]
+        self.image = config.get("image")
+        self.type = config["type"]
+        self.min_rating = config.get("min_rating")
+        self.bbox = config.get("bbox")
+        self.min = config["min"]
+        if self.type not in ("count", "rating", "region"):
+            raise ValueError(f"Неизвестный тип правила {self.type!r} у достижения {self.id!r}")
+
+    def matches(self, location):
+        if self.type == "rating":
+            return location.rating >= self.min_rating
+        if self.type == "region":
+            west, south, east, north = self.bbox
+            return west <= location.longitude <= east and south <= location.latitude <= north
+        return True
+
+
+class AchievementEngine:
+    """Инкрементальная проверка достижений, не зависящая от Qt.
+
+    Для каждого места заранее известно, от каких правил оно зависит, поэтому
+    посещение пересчитывает только эти правила. Состояние пользователя —
+    счётчик подходящих мест по каждому правилу и множество открытых достижений.
+    """
+
+    def __init__(self, rules, locations):
+        self.progress = {}
+        self.unlocked = {}
+        self.load(rules, locations)
+
+    @classmethod
+    def from_config(cls, locations, path=ACHIEVEMENTS_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls([Rule(config) for config in json.load(f)], locations)
+
+    def load(self, rules, locations):
+        """Задаёт правила и каталог мест; состояние пользователей нужно пересчитать."""
+        self.rules = list(rules)
+        self.by_id = {rule.id: rule for rule in self.rules}
+        self.num_places = max((location.id for location in locations), default=0)
+        # Индекс место → правила, на которые влияет его посещение
+        self.place_rules = {}
+        matching = [[] for _ in self.rules]
+        for location in locations:
+            dependent = [i for i, rule in enumerate(self.rules) if rule.matches(location)]
+            if dependent:
+                self.place_rules[location.id] = dependent
+            for i in dependent:
+                matching[i].append(location.id)
+        self.matching = [np.array(ids, dtype=np.int64) for ids in matching]
+        self.thresholds = np.array(
+            [len(ids) if rule.min == "all" else rule.min for rule, ids in zip(self.rules, matching)],
+            dtype=np.int64,
+        )
+        self.progress = {}
+        self.unlocked = {}
+
+    def _state(self, user):
+        if user not in self.progress:
+            self.progress[user] = np.zeros(len(self.rules), dtype=np.int64)
+            self.unlocked[user] = set()
+        return self.progress[user]
+
+    def record_visit(self, user, place):
+        """Учитывает новое посещение; возвращает только что открытые правила."""
+        progress = self._state(user)
+        unlocked = self.unlocked[user]
+        newly = []
+        for i in self.place_rules.get(place, ()):
+            progress[i] += 1
+            rule = self.rules[i]
+            if rule.id not in unlocked and progress[i] >= self.thresholds[i] > 0:
+                unlocked.add(rule.id)
+                newly.append(rule)
+        return newly
+
+    def record_visits(self, user, places):
+        newly = []
+        for place in places:
+            newly.extend(self.record_visit(user, place))
+        return newly
+
+    def evaluate_all(self, matrix):
+        """Пересчитывает всех пользователей VisitMatrix одним проходом по правилам.
+
+        Для правила строится битовая маска подходящих мест, и счётчики всех
+        пользователей получаются как popcount(строки & маска).
+        """
+        if matrix.num_places < self.num_places:
+            raise ValueError("В матрице посещений меньше мест, чем в каталоге")
+        rows = matrix.bits[:len(matrix)]
+        counts = np.zeros((len(matrix), len(self.rules)), dtype=np.int64)
+        for i, ids in enumerate(self.matching):
+            mask = np.zeros(matrix.words, dtype=np.uint64)
+            np.bitwise_or.at(mask, ids >> 6, np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64)))
+            counts[:, i] = popcount(rows & mask)
+        reached = (counts >= self.thresholds) & (self.thresholds > 0)
+        for row, user in enumerate(matrix.names):
+            self.progress[user] = counts[row]
+            self.unlocked[user] = {self.rules[i].id for i in np.flatnonzero(reached[row])}
+        return counts
+
+    def unlocked_rules(self, user):
+        """Открытые достижения пользователя в порядке конфига."""
+        unlocked = self.unlocked.get(user, ())
+        return [rule for rule in self.rules if rule.id in unlocked]
+
+    def unlocked_titles(self, user):
+        return [rule.title for rule in self.unlocked_rules(user)]
@@ -0,0 +1,359 @@
+"""Серверный режим без GUI: JSON API для многих пользователей поверх locations.db.
+
+    python api_server.py --host 0.0.0.0 --port 8080
+
+    GET  /api/locations?bbox=w,s,e,n[&limit=N]   места в прямоугольнике
+    GET  /api/markers?bbox=w,s,e,n&zoom=z         кластеры и маркеры (как у карты)
+    GET  /api/regions?bbox=w,s,e,n&zoom=z         сводки по ячейкам geohash для мелких масштабов
+    POST /api/users/<user>/visits                 {"places": [id, ...]} — отметить посещения
+    GET  /api/users/<user>/progress               число мест, процент и достижения
+    GET  /api/users/<user>/achievements           все правила с отметкой открытия
+    GET  /api/users/<user>/friends                прогресс друзей
+    GET  /api/users/<user>/recommendations[?k=N]  где были друзья, а пользователь нет
+    PUT  /api/users/<user>/friends/<friend>       добавить друга (взаимно)
+    GET  /api/leaderboard[?k=N]                   первые k пользователей по числу мест
+    GET  /api/places/<id>/visitors[?limit=N&offset=M]  кто посетил место, по страницам
+
+Запросы обрабатываются тем же многопоточным сервером, что раздаёт карту.
+Чтения из SQLite идут через пул соединений, посещения пишутся в журнал
+(visit_log.py) с фоновой записью. Прогресс и достижения пользователя
+кэшируются в памяти и сбрасываются при его новых посещениях; рейтинг,
+посетители мест и рекомендации берутся из VisitIndex (visit_index.py).
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from achievements import AchievementEngine
+from clustering import MarkerClusterer
+from instrumentation import tracer
+from location_store import DB_PATH, LocationStore
+from map_server import STATIC_ROOT, AssetCache, MapRequestHandler, MapServer, _guess_type, parse_bbox
+from regions import RegionStats
+from visit_index import VisitIndex
+from visit_log import VisitLog
+
+POOL_SIZE = 8
+MAX_LOCATIONS = 5000  # мест в одном ответе /api/locations
+VISITORS_PAGE = 100  # посетителей в ответе /api/places/<id>/visitors без limit
+MAX_BODY_SIZE = 1024 * 1024
+
+USER_PATH = re.compile(r"^/api/users/([^/]+)/(progress|achievements|friends|recommendations|visits)$")
+VISITORS_PATH = re.compile(r"^/api/places/(\d+)/visitors$")
+FRIEND_PATH = re.compile(r"^/api/users/([^/]+)/friends/([^/]+)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS friendships (
+    user TEXT NOT NULL,
+    friend TEXT NOT NULL,
+    PRIMARY KEY (user, friend)
+);
+"""
+
+
+class StorePool:
+    """Пул LocationStore: каждый поток берёт своё соединение и возвращает его после запроса."""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self._stores = queue.Queue()
+        for _ in range(size):
+            self._stores.put(LocationStore(path, check_same_thread=False))
+
+    @contextmanager
+    def store(self):
+        store = self._stores.get()
+        try:
+            yield store
+        finally:
+            self._stores.put(store)
+
+    def close(self):
+        while not self._stores.empty():
+            self._stores.get_nowait().close()
+
+
+class TravelService:
+    """Состояние всех пользователей: посещения, друзья, достижения и кэш их сводок."""
+
+    def __init__(self, db_path=DB_PATH, pool_size=POOL_SIZE):
+        self.pool = StorePool(db_path, pool_size)
+        with self.pool.store() as store:
+            store.seed_defaults()
+            store.conn.executescript(SCHEMA)
+            locations = store.all()
+            self.total_places = store.count()
+            # id мест не обязаны идти подряд: посещения проверяются по самим id каталога
+            self.place_ids = frozenset(location.id for location in locations)
+            friendships = store.conn.execute("SELECT user, friend FROM friendships ORDER BY rowid").fetchall()
+        self.clusterer = MarkerClusterer(locations)
+        self.visit_log = VisitLog(db_path)
+        self.visits = self.visit_log.load(max(self.place_ids, default=0))
+        self.index = VisitIndex(self.visits)
+        self.regions = RegionStats(locations, self.visits.place_counts)
+        self.achievements = AchievementEngine.from_config(locations)
+        self.achievements.evaluate_all(self.visits)
+        self.friends = {}
+        for user, friend in friendships:
+            self.friends.setdefault(user, []).append(friend)
+        # Запись (посещения, дружба) и заполнение кэша — под одной блокировкой;
+        # готовые сводки читаются из словаря без неё
+        self._lock = threading.Lock()
+        self._summaries = {}
+
+    def close(self):
+        self.visit_log.close(self.visits)
+        self.pool.close()
+
+    def locations_in_bounds(self, west, south, east, north, limit=MAX_LOCATIONS):
+        with self.pool.store() as store:
+            return [location._asdict() for location in store.in_bounds(south, west, north, east, limit)]
+
+    def record_visits(self, user, places):
+        """Отмечает посещения; возвращает новые места и только что открытые достижения."""
+        places = [place for place in dict.fromkeys(places) if place in self.place_ids]
+        with self._lock:
+            added = self.index.visit_many(user, places)
+            if added:
+                self.visit_log.record_many(user, added)
+                self.regions.record_visits(added)
+            unlocked = self.achievements.record_visits(user, added)
+            self._summaries.pop(user, None)
+        return {"added": added, "unlocked": [rule.title for rule in unlocked]}
+
+    def progress(self, user):
+        summary = self._summaries.get(user)
+        if summary is None:
+            with self._lock:
+                visited = self.visits.count(user)
+                summary = {
+                    "user": user,
+                    "visited": visited,
+                    "total": self.total_places,
+                    "percent": round(visited / self.total_places * 100, 1) if self.total_places else 0.0,
+                    "achievements": self.achievements.unlocked_titles(user),
+                }
+                self._summaries[user] = summary
+        # Место в рейтинге меняется от чужих посещений, поэтому в кэш сводки не входит
+        return dict(summary, rank=self.rank(user))
+
+    def rank(self, user):
+        with self._lock:
+            return self.index.rank(user)
+
+    def leaderboard(self, k):
+        with self._lock:
+            return [{"user": user, "visited": count} for user, count in self.index.top(k)]
+
+    def place_visitors(self, place, offset=0, limit=VISITORS_PAGE):
+        with self._lock:
+            return self.index.place_visitors(place, offset, limit)
+
+    def recommendations(self, user, k):
+        with self._lock:
+            ranked = self.index.recommendations(user, list(self.friends.get(user, ())), k)
+        with self.pool.store() as store:
+            locations = {location.id: location for location in store.get_many([place for place, _ in ranked])}
+        return [dict(locations[place]._asdict(), friends=friends) for place, friends in ranked if place in locations]
+
+    def achievement_list(self, user):
+        unlocked = {rule.id for rule in self.achievements.unlocked_rules(user)}
+        return [
+            {"id": rule.id, "title": rule.title, "unlocked": rule.id in unlocked}
+            for rule in self.achievements.rules
+        ]
+
+    def friends_progress(self, user):
+        return [self.progress(friend) for friend in self.friends.get(user, ())]
+
+    def add_friend(self, user, friend):
+        """Добавляет взаимную дружбу; False, если она уже была."""
+        if user == friend:
+            raise ValueError("Нельзя добавить в друзья самого себя")
+        with self._lock:
+            if friend in self.friends.get(user, ()):
+                return False
+            self.friends.setdefault(user, []).append(friend)
+            self.friends.setdefault(friend, []).append(user)
+            with self.pool.store() as store, store.conn:
+                store.conn.executemany(
+                    "INSERT OR IGNORE INTO friendships (user, friend) VALUES (?, ?)",
+                    [(user, friend), (friend, user)],
+                )
+        return True
+
+
+class ApiRequestHandler(MapRequestHandler):
+    """Обработчик карты с добавленными маршрутами /api/locations и /api/users/..."""
+
+    def __init__(self, *args, service=None, **kwargs):
+        self.service = service
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        user = USER_PATH.match(url.path)
+        if url.path == "/api/locations":
+            with tracer.span("api.locations"):
+                self.send_locations(parse_qs(url.query))
+        elif url.path == "/api/leaderboard":
+            with tracer.span("api.leaderboard"):
+                k = self.query_limit(parse_qs(url.query), 10)
+                if k is not None:
+                    self.send_json(self.service.leaderboard(k))
+        elif VISITORS_PATH.match(url.path):
+            with tracer.span("api.visitors"):
+                self.send_visitors(int(VISITORS_PATH.match(url.path).group(1)), parse_qs(url.query))
+        elif user and user.group(2) != "visits":
+            with tracer.span(f"api.{user.group(2)}"):
+                self.send_user(user.group(2), unquote(user.group(1)), parse_qs(url.query))
+        else:
+            super().do_GET()
+
+    def send_user(self, resource, name, query):
+        if resource == "progress":
+            self.send_json(self.service.progress(name))
+        elif resource == "achievements":
+            self.send_json(self.service.achievement_list(name))
+        elif resource == "recommendations":
+            k = self.query_limit(query, 20)
+            if k is not None:
+                self.send_json(self.service.recommendations(name, k))
+        else:
+            self.send_json(self.service.friends_progress(name))
+
+    def do_POST(self):
+        with tracer.span("api.visits"):
+            self.post_visits()
+
+    def post_visits(self):
+        user = USER_PATH.match(urlsplit(self.path).path)
+        if not user or user.group(2) != "visits":
+            self.send_error(404, explain="Неизвестный адрес API")
+            return
+        body = self.read_json()
+        if body is None:
+            return
+        places = body.get("places", [body["place"]] if "place" in body else None)
+        # bool — подкласс int: true из JSON не должен стать местом 1
+        if not isinstance(places, list) or not all(type(place) is int for place in places):
+            self.send_error(400, explain='Ожидается {"places": [id, ...]} или {"place": id}')
+            return
+        self.send_json(self.service.record_visits(unquote(user.group(1)), places))
+
+    def do_PUT(self):
+        with tracer.span("api.friend"):
+            self.put_friend()
+
+    def put_friend(self):
+        match = FRIEND_PATH.match(urlsplit(self.path).path)
+        if not match:
+            self.send_error(404, explain="Неизвестный адрес API")
+            return
+        self.read_body()
+        try:
+            created = self.service.add_friend(unquote(match.group(1)), unquote(match.group(2)))
+        except ValueError as error:
+            self.send_error(400, explain=str(error))
+            return
+        self.send_json({"created": created}, status=201 if created else 200)
+
+    def send_visitors(self, place, query):
+        limit = self.query_limit(query, VISITORS_PAGE, "limit")
+        offset = self.query_limit(query, 0, "offset", minimum=0, maximum=None) if limit is not None else None
+        if offset is not None:
+            self.send_json(self.service.place_visitors(place, offset, limit))
+
+    def query_limit(self, query, default, name="k", minimum=1, maximum=MAX_LOCATIONS):
+        """Числовой параметр name из запроса (minimum..maximum); при ошибке отправляет 400 и возвращает None."""
+        try:
+            value = int(query.get(name, [default])[0])
+        except ValueError:
+            value = minimum - 1
+        if value < minimum or maximum is not None and value > maximum:
+            bounds = f"от {minimum} до {maximum}" if maximum is not None else f"не меньше {minimum}"
+            self.send_error(400, explain=f"Параметр {name} должен быть числом {bounds}")
+            return None
+        return value
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_SIZE:
+            self.send_error(413, explain="Слишком большое тело запроса")
+            return None
+        return self.rfile.read(length)
+
+    def read_json(self):
+        body = self.read_body()
+        if body is None:
+            return None
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self.send_error(400, explain="Тело запроса должно быть JSON-объектом")
+            return None
+        return payload
+
+    def send_locations(self, query):
+        bbox = parse_bbox(query)
+        if bbox is None:
+            self.send_error(400, explain="Ожидается параметр bbox=west,south,east,north")
+            return
+        limit = self.query_limit(query, MAX_LOCATIONS, "limit")
+        if limit is not None:
+            self.send_json(self.service.locations_in_bounds(*bbox, limit))
+
+
+class ApiServer(MapServer):
+    # Сотни клиентов подключаются одновременно
+    request_queue_size = 1024
+
+
+def start_api_server(service, host="localhost", port=8080, static_root=None):
+    """Запускает API-сервер в фоновом потоке; фактический адрес — в server.url.
+
+    Файлы карты (только STATIC_FILES из map_server) берутся из static_root,
+    по умолчанию — из каталога программы, а не из текущего, где может лежать база.
+    """
+    static_root = os.path.abspath(static_root or STATIC_ROOT)
+    handler = partial(
+        ApiRequestHandler, service=service, clusterer=service.clusterer, regions=service.regions,
+        assets=AssetCache(_guess_type), directory=static_root,
+    )
+    server = ApiServer((host, port), handler)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"API сервер запущен на {server.url}", flush=True)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON API карты путешествий для многих пользователей.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080, help="0 — любой свободный порт")
+    parser.add_argument("--pool", type=int, default=POOL_SIZE, help="соединений SQLite в пуле")
+    args = parser.parse_args()
+
+    service = TravelService(args.db, args.pool)
+    server = start_api_server(service, args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
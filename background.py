@@ -0,0 +1,169 @@
+"""Фоновые задания для GUI и контроль того, насколько GUI-поток занят.
+
+TaskRunner выполняет функции в пуле потоков и возвращает результат в GUI-поток
+сигналом. Задания с одним ключом сливаются: пока одно выполняется, в очереди
+держится только самое новое, а delay_ms откладывает запуск, так что серия
+быстрых запросов даёт одну пересборку. Результат запуска, после которого
+пришёл более новый запрос или отмена, отбрасывается.
+
+StallMonitor измеряет самую долгую блокировку цикла событий за взаимодействие.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
+
+from instrumentation import tracer
+
+# Задержки GUI-потока длиннее этой печатаются в консоль
+STALL_WARN_MS = 50
+
+
+class TaskRunner(QObject):
+    # key, номер запроса, результат, исключение
+    _finished = Signal(str, int, object, object)
+
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="travel-task")
+        self.generation = {}  # ключ -> номер последнего запроса
+        self.pending = {}     # ключ -> (номер, job), ещё не запущено
+        self.running = {}     # ключ -> Future
+        self.callbacks = {}   # (ключ, номер) -> (on_result, on_error)
+        self.timers = {}
+        # Сигнал испускается в потоке пула, а обрабатывается в GUI-потоке
+        self._finished.connect(self._on_finished, Qt.QueuedConnection)
+
+    def submit(self, key, job, on_result=None, on_error=None, delay_ms=0):
+        """Ставит job (функцию без аргументов) в очередь под ключом key; возвращает номер запроса.
+
+        job должен работать со снимком данных, снятым в GUI-потоке: он
+        выполняется параллельно с обработкой событий.
+        """
+        generation = self.generation.get(key, 0) + 1
+        self.generation[key] = generation
+        superseded = self.pending.get(key)
+        if superseded is not None:
+            # Заменённый запрос уже не запустится, и его колбэки никто не снимет
+            self.callbacks.pop((key, superseded[0]), None)
+        self.pending[key] = (generation, job)
+        self.callbacks[(key, generation)] = (on_result, on_error)
+        if delay_ms > 0:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = QTimer(self)
+                timer.setSingleShot(True)
+                timer.timeout.connect(partial(self._start, key))
+            timer.start(delay_ms)  # Повторный запрос в окне задержки сдвигает запуск
+        else:
+            self._start(key)
+        return generation
+
+    def cancel(self, key):
+        """Снимает ожидающий запрос; результат уже идущего будет отброшен."""
+        self.generation[key] = self.generation.get(key, 0) + 1
+        pending = self.pending.pop(key, None)
+        if pending is not None:
+            self.callbacks.pop((key, pending[0]), None)
+        if key in self.timers:
+            self.timers[key].stop()
+        future = self.running.get(key)
+        if future is not None:
+            future.cancel()
+
+    def shutdown(self):
+        for key in list(self.generation):
+            self.cancel(key)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def is_busy(self, key):
+        return key in self.running or key in self.pending
+
+    def _start(self, key):
+        # Не больше одного выполнения на ключ: очередной запрос стартует после текущего
+        if key in self.running or key not in self.pending:
+            return
+        generation, job = self.pending.pop(key)
+        future = self.executor.submit(_run_job, key, job)
+        self.running[key] = future
+        future.add_done_callback(partial(self._emit, key, generation))
+
+    def _emit(self, key, generation, future):
+        if future.cancelled():
+            self._finished.emit(key, generation, None, None)
+        elif future.exception() is not None:
+            self._finished.emit(key, generation, None, future.exception())
+        else:
+            self._finished.emit(key, generation, future.result(), None)
+
+    def _on_finished(self, key, generation, result, error):
+        self.running.pop(key, None)
+        on_result, on_error = self.callbacks.pop((key, generation), (None, None))
+        if generation == self.generation.get(key):
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+                else:
+                    print(f"Фоновая задача {key} завершилась с ошибкой: {error!r}")
+            elif on_result is not None:
+                on_result(result)
+        timer = self.timers.get(key)
+        if key in self.pending and not (timer and timer.isActive()):
+            self._start(key)
+
+
+def _run_job(key, job):
+    with tracer.span(f"task.{key}"):
+        return job()
+
+
+class StallMonitor(QObject):
+    """Худшая задержка GUI-потока за одно взаимодействие.
+
+    Таймер тикает каждые interval_ms; тик, пришедший позже срока, значит, что
+    цикл событий был занят, и опоздание равно длительности блокировки.
+    mark(name) открывает взаимодействие (клик, выбор места); оно закрывается
+    следующим mark или через settle_ms, и итог попадает в history.
+    """
+
+    def __init__(self, interval_ms=16, settle_ms=1000, parent=None):
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.settle_ms = settle_ms
+        self.history = deque(maxlen=100)  # пары (взаимодействие, худшая задержка в мс)
+        self.current = None
+        self.worst = 0.0
+        self.started = self.last = time.perf_counter()
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self._tick)
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.timer.start(self.interval_ms)
+
+    def mark(self, name):
+        self._close()
+        self.current = name
+        self.worst = 0.0
+        self.started = time.perf_counter()
+
+    def _tick(self):
+        now = time.perf_counter()
+        stall = max(0.0, (now - self.last) * 1000 - self.interval_ms)
+        self.last = now
+        if self.current is not None:
+            self.worst = max(self.worst, stall)
+            if (now - self.started) * 1000 >= self.settle_ms:
+                self._close()
+
+    def _close(self):
+        if self.current is None:
+            return
+        self.history.append((self.current, self.worst))
+        if self.worst >= STALL_WARN_MS:
+            tracer.count("gui.stalls")
+            print(f"GUI-поток был занят {self.worst:.0f} мс: {self.current}")
+        self.current = None
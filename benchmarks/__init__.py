@@ -0,0 +1 @@
+"""Нагрузочные замеры приложения. Запуск из корня репозитория: python -m benchmarks.<имя>."""
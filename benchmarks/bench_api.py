@@ -0,0 +1,124 @@
+"""Нагрузочный тест API-сервера: 1000 одновременных пользователей на keep-alive соединениях.
+
+    python -m benchmarks.bench_api --users 1000 --requests 20
+
+Сервер запускается отдельным процессом на копии locations.db, чтобы клиент
+не делил с ним GIL; клиент — один цикл asyncio со всеми соединениями.
+Каждый пользователь добавляет друга, а затем шлёт смесь запросов: прогресс,
+друзья, посещение, места в прямоугольнике.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from location_store import DB_PATH
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Доли запросов каждого вида
+MIX = [("progress", 0.5), ("friends", 0.2), ("visit", 0.2), ("locations", 0.1)]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def request(reader, writer, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def user_session(host, port, number, users, requests, places, latencies, errors, rng):
+    user = quote(f"user{number}")
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await request(reader, writer, "PUT", f"/api/users/{user}/friends/{quote(f'user{(number + 1) % users}')}")
+        kinds = [kind for kind, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        for kind in rng.choices(kinds, weights, k=requests):
+            if kind == "visit":
+                method, path, body = "POST", f"/api/users/{user}/visits", {"place": rng.randint(1, places)}
+            elif kind == "locations":
+                lat, lon = 55.75 + rng.uniform(-0.05, 0.05), 37.62 + rng.uniform(-0.08, 0.08)
+                method, path, body = "GET", f"/api/locations?bbox={lon - 0.02},{lat - 0.01},{lon + 0.02},{lat + 0.01}", None
+            else:
+                method, path, body = "GET", f"/api/users/{user}/{kind}", None
+            start = time.perf_counter()
+            status = await request(reader, writer, method, path, body)
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_clients(host, port, users, requests, places, seed):
+    latencies, errors = {}, []
+    sessions = [
+        user_session(host, port, number, users, requests, places, latencies, errors, random.Random(seed + number))
+        for number in range(users)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*sessions)
+    return time.perf_counter() - start, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="одновременных пользователей")
+    parser.add_argument("--requests", type=int, default=20, help="запросов на пользователя")
+    parser.add_argument("--db", default=DB_PATH, help="база, копия которой используется сервером")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "locations.db")
+        shutil.copy(os.path.join(ROOT, args.db), db_path)
+        server = subprocess.Popen(
+            [sys.executable, "api_server.py", "--db", db_path, "--port", "0"],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            url = server.stdout.readline().split()[-1]
+            host, port = url.rsplit("/", 1)[-1].split(":")
+            places = 20
+            elapsed, latencies, errors = asyncio.run(
+                run_clients(host, int(port), args.users, args.requests, places, args.seed)
+            )
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=30)
+
+    everything = [value for values in latencies.values() for value in values]
+    print(f"{args.users} пользователей, {len(everything)} запросов за {elapsed:.1f} с: "
+          f"{len(everything) / elapsed:.0f} запросов/с, ошибок {len(errors)}")
+    for kind, values in [("все", everything)] + sorted(latencies.items()):
+        print(f"  {kind:<10} p50 {percentile(values, 0.5) * 1000:7.1f} мс   "
+              f"p95 {percentile(values, 0.95) * 1000:7.1f} мс   p99 {percentile(values, 0.99) * 1000:7.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Цена замеров: пустой цикл, span() и traced() при выключенных и включённых замерах.
+
+    python -m benchmarks.bench_instrumentation --calls 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from instrumentation import Tracer, tracer, traced
+
+
+def per_call(function, calls):
+    start = time.perf_counter()
+    function(calls)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    def plain(x):
+        return x
+
+    wrapped = traced("bench.call")(plain)
+
+    def loop_plain(calls):
+        for i in range(calls):
+            plain(i)
+
+    def loop_span(calls):
+        for i in range(calls):
+            with tracer.span("bench.span"):
+                plain(i)
+
+    def loop_traced(calls):
+        for i in range(calls):
+            wrapped(i)
+
+    base = per_call(loop_plain, args.calls)
+    print(f"вызов без замеров: {base:.0f} нс")
+    for enabled in (False, True):
+        tracer.enable(enabled)
+        tracer.clear()
+        state = "включены" if enabled else "выключены"
+        print(f"замеры {state}: span +{per_call(loop_span, args.calls) - base:.0f} нс, "
+              f"traced +{per_call(loop_traced, args.calls) - base:.0f} нс на вызов")
+    tracer.enable(False)
+
+    summary = tracer.summary()["bench.call"]  # буфер заполнен последним циклом
+    print(f"сводка по буферу: {summary['count']:,} интервалов, p50 {summary['p50'] * 1e6:.0f} нс, p99 {summary['p99'] * 1e6:.0f} нс")
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        path = tracer.export_chrome_trace(os.path.join(directory, "trace.json"))
+        size = os.path.getsize(path)
+    print(f"экспорт Chrome trace: {time.perf_counter() - start:.2f} с, {size / 2 ** 20:.1f} МБ "
+          f"({len(tracer.spans):,} интервалов, буфер {Tracer().spans.maxlen:,})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Сводки по областям: построение, посещение и ответ для мелкого масштаба против маркеров.
+
+    python -m benchmarks.bench_regions --places 100000 --visits 100000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_render import generate
+from clustering import MarkerClusterer
+from regions import RegionStats
+
+CENTER = (55.7558, 37.6173)
+SCREEN = (1280, 800)  # пикселей
+
+
+def view(zoom):
+    """Видимая область экрана SCREEN с центром в Москве: west, south, east, north."""
+    degrees = 360.0 / 256 / (1 << zoom)  # градусов долготы на пиксель
+    half_width, half_height = SCREEN[0] / 2 * degrees, SCREEN[1] / 2 * degrees * 0.56  # cos(55.75°)
+    return CENTER[1] - half_width, CENTER[0] - half_height, CENTER[1] + half_width, CENTER[0] + half_height
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--places", type=int, default=100_000)
+    parser.add_argument("--visits", type=int, default=100_000, help="посещений после построения")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    locations, visited = generate(args.places, args.seed)
+    rng = np.random.default_rng(args.seed)
+    place_visits = np.bincount(rng.integers(1, args.places + 1, 10 * args.places), minlength=args.places + 1)
+
+    start = time.perf_counter()
+    regions = RegionStats(locations, place_visits, visited)
+    print(f"{args.places:,} мест: построение сводок {time.perf_counter() - start:.2f} с")
+
+    places = rng.integers(1, args.places + 1, args.visits).tolist()
+    start = time.perf_counter()
+    for place in places:
+        regions.record_visit(place, own=True)
+    print(f"посещение: {(time.perf_counter() - start) / args.visits * 1e6:.1f} мкс")
+
+    clusterer = MarkerClusterer(locations)
+    for zoom in (4, 6, 8, 10):
+        start = time.perf_counter()
+        cells = regions.cells(*view(zoom), zoom)
+        seconds = time.perf_counter() - start
+        size = len(json.dumps(cells, ensure_ascii=False))
+        clusterer.clusters(*view(zoom), zoom)  # первый запрос строит уровень
+        start = time.perf_counter()
+        markers = clusterer.clusters(*view(zoom), zoom)
+        marker_seconds = time.perf_counter() - start
+        marker_size = len(json.dumps(markers, ensure_ascii=False))
+        print(f"масштаб {zoom:2}: {len(cells):5} ячеек, {size / 1024:7.1f} КБ, {seconds * 1e3:6.2f} мс | "
+              f"маркеры и кластеры: {len(markers):5}, {marker_size / 1024:7.1f} КБ, {marker_seconds * 1e3:6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
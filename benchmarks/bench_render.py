@@ -0,0 +1,68 @@
+"""Сборка map.html: шаблон с JSON-данными против folium (маркер на каждое место).
+
+    python -m benchmarks.bench_render --sizes 20,1000,10000,100000 --folium-max 10000
+
+folium на 100 тыс. мест работает минутами, поэтому выше --folium-max он пропускается.
+Колонка «из кэша» — повтор уже собранного состояния: ключ страницы и PageCache.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from location_store import Location
+from map_renderer import PageCache, locations_digest, page_key, render_folium_map, render_map
+
+
+def generate(count, seed):
+    # Места вокруг центра Москвы, около десятой части посещено
+    rng = random.Random(seed)
+    locations = [
+        Location(i, f"Место {i}", f"Описание места {i}", rng.gauss(55.7558, 0.1), rng.gauss(37.6173, 0.15),
+                 round(rng.uniform(3.0, 5.0), 1))
+        for i in range(1, count + 1)
+    ]
+    visited = set(rng.sample(range(1, count + 1), count // 10))
+    return locations, visited
+
+
+def measure(render, locations, visited, path, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        render(locations, visited, path)
+        best = min(best, time.perf_counter() - start)
+    return best, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="20,1000,10000,100000")
+    parser.add_argument("--folium-max", type=int, default=10000, help="наибольший размер для folium")
+    parser.add_argument("--runs", type=int, default=3, help="лучший из запусков")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'мест':>8} {'шаблон, мс':>11} {'КБ':>9} {'из кэша, мс':>12} {'folium, мс':>11} {'КБ':>9} {'ускорение':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "map.html")
+        for size in map(int, args.sizes.split(",")):
+            locations, visited = generate(size, args.seed)
+            fast, fast_size = measure(render_map, locations, visited, path, args.runs)
+            pages, locations_key = PageCache(), locations_digest(locations)
+            pages.render(page_key(locations_key, visited), locations, visited)
+            start = time.perf_counter()
+            pages.render(page_key(locations_key, visited), locations, visited)
+            cached = time.perf_counter() - start
+            line = f"{size:>8} {fast * 1000:>11.1f} {fast_size / 1024:>9.0f} {cached * 1000:>12.2f}"
+            if size <= args.folium_max:
+                slow, slow_size = measure(render_folium_map, locations, visited, path, 1)
+                line += f" {slow * 1000:>11.1f} {slow_size / 1024:>9.0f} {slow / fast:>9.0f}x"
+            else:
+                line += f" {'—':>11} {'—':>9} {'—':>10}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
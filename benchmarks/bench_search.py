@@ -0,0 +1,65 @@
+"""Поиск по мере ввода: FTS5-запросы по рейтингу и по расстоянию на большом каталоге.
+
+    python -m benchmarks.bench_search --places 1000000 --db /tmp/search.db
+
+Каталог из benchmarks.synthetic собирается через LocationStore.replace_all
+(триггеры поиска и R*Tree) и сохраняется в --db: повторный запуск с тем же
+файлом и размером сразу переходит к замерам. Запросы — последовательные
+префиксы, как при наборе: «м», «му», «муз», ...
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks import synthetic
+from location_store import LocationStore
+
+QUERIES = ["м", "му", "музей", "музей бел", "елоч", "огонек", "парк «берёзка»", "санкт", "дворец 123", "нет такого"]
+POINTS = [("Москва", 55.7558, 37.6173), ("Сочи", 43.5855, 39.7231), ("Тверь", 56.8587, 35.9176)]
+
+
+def build(path, places):
+    store = LocationStore(path)
+    if store.count() != places:
+        start = time.perf_counter()
+        store.replace_all(
+            [(p.latitude, p.longitude, p.name, p.rating, p.description) for p in synthetic.locations(places)]
+        )
+        print(f"Каталог из {places:,} мест собран за {time.perf_counter() - start:.0f} с")
+    return store
+
+
+def timed(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--places", type=int, default=1_000_000)
+    parser.add_argument("--db", default=None, help="файл каталога (по умолчанию search-<N>.db во временном каталоге)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    path = args.db or os.path.join(os.environ.get("TMPDIR", "/tmp"), f"search-{args.places}.db")
+    store = build(path, args.places)
+
+    print(f"{'запрос':<16} {'рейтинг, мс':>12} {'стр. 5, мс':>11}" + "".join(f" {name + ', мс':>16}" for name, _, _ in POINTS))
+    worst = 0.0
+    for text in QUERIES:
+        first, found = timed(lambda: store.search(text, 20), args.runs)
+        page, _ = timed(lambda: store.search(text, 20, offset=80), args.runs)
+        near = [timed(lambda: store.search_near(text, lat, lon, 20), args.runs)[0] for _, lat, lon in POINTS]
+        worst = max(worst, first, page, *near)
+        print(f"{text:<16} {first:>12.2f} {page:>11.2f}" + "".join(f" {ms:>16.2f}" for ms in near)
+              + f"   ({len(found)} мест)")
+    print(f"Худший случай: {worst:.2f} мс")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
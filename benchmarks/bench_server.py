@@ -0,0 +1,75 @@
+"""Нагрузочный замер локального сервера карты: запросы в секунду и p50/p99 задержки.
+
+    python -m benchmarks.bench_server --clients 16 --requests 500
+"""
+import argparse
+import http.client
+import threading
+import time
+
+from map_server import start_map_server
+
+ASSETS = ["/map.html", "/leaflet.css", "/leafnet.js", "/lazy_markers.js", "/mapdata.js"]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def client(host, port, requests, latencies, revalidate):
+    # Одно keep-alive соединение на клиента, как у вкладки браузера
+    conn = http.client.HTTPConnection(host, port)
+    etags = {}
+    for i in range(requests):
+        path = ASSETS[i % len(ASSETS)]
+        headers = {"Accept-Encoding": "gzip"}
+        if revalidate and path in etags:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        etags[path] = response.getheader("ETag")
+    conn.close()
+
+
+def run(clients, requests, revalidate):
+    server = start_map_server(None, port=0)
+    host, port = server.server_address[:2]
+    latencies = []
+    threads = [
+        threading.Thread(target=client, args=(host, port, requests, latencies, revalidate))
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="запросов на клиента")
+    parser.add_argument("--revalidate", action="store_true", help="слать If-None-Match (ответы 304)")
+    args = parser.parse_args()
+    result = run(args.clients, args.requests, args.revalidate)
+    print(
+        f"{result['requests']} запросов: {result['rps']:.0f} запросов/с, "
+        f"p50 {result['p50_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс"
+    )
+
+
+if __name__ == "__main__":
+    main()
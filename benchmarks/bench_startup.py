@@ -0,0 +1,108 @@
+"""Бюджет времени запуска: импорт ядра, создание TravelCore и холодный старт GUI.
+
+    python -m benchmarks.bench_startup --runs 5 [--window]
+
+Импорт меряется через `python -X importtime` в отдельных процессах (медиана по
+запускам), поэтому кэш модулей текущего интерпретатора на результат не влияет.
+При превышении бюджета скрипт завершается с кодом 1.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Бюджеты в миллисекундах
+BUDGETS = {
+    "import travel_core": 400,
+    "TravelCore()": 600,
+    "import try2 (GUI)": 2500,
+    "окно TravelApp": 6000,
+}
+
+CORE_CHECK = (
+    "import sys, travel_core; "
+    "heavy = [name for name in ('PySide6', 'folium') if name in sys.modules]; "
+    "sys.exit('ядро импортировало ' + ', '.join(heavy) if heavy else 0)"
+)
+CORE_INIT = (
+    "import time; start = time.perf_counter(); import travel_core; travel_core.TravelCore(); "
+    "print((time.perf_counter() - start) * 1000)"
+)
+WINDOW_INIT = (
+    "import time; start = time.perf_counter(); import sys, try2; "
+    "app = try2.QApplication(sys.argv); window = try2.TravelApp(); window.show(); app.processEvents(); "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def run(code, importtime=False, check=True):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(command, capture_output=True, text=True, env=env, check=check)
+
+
+def import_ms(module):
+    """Суммарное время импорта модуля по выводу -X importtime."""
+    stderr = run(f"import {module}", importtime=True).stderr
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"В выводе importtime нет модуля {module}")
+
+
+def heaviest_imports(module, top=8):
+    """Прямые зависимости модуля, отсортированные по суммарному времени импорта."""
+    stderr = run(f"import {module}", importtime=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        # Глубина вложенности видна по отступу имени: берём прямые зависимости модуля
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2].lstrip()
+            if (len(parts[2]) - len(name) - 1) // 2 == 1:
+                rows.append((int(parts[1]), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(function, runs):
+    return statistics.median(function() for _ in range(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--window", action="store_true", help="мерить и создание окна (нужен QtWebEngine)")
+    parser.add_argument("--top", action="store_true", help="показать самые тяжёлые импорты ядра")
+    args = parser.parse_args()
+
+    check = run(CORE_CHECK, check=False)
+    if check.returncode:
+        print(check.stderr.strip())
+    results = {
+        "import travel_core": measure(lambda: import_ms("travel_core"), args.runs),
+        "TravelCore()": measure(lambda: float(run(CORE_INIT).stdout.split()[-1]), args.runs),
+    }
+    try:
+        results["import try2 (GUI)"] = measure(lambda: import_ms("try2"), args.runs)
+        if args.window:
+            results["окно TravelApp"] = measure(lambda: float(run(WINDOW_INIT).stdout.split()[-1]), args.runs)
+    except subprocess.CalledProcessError as error:
+        print(f"GUI не запускается в этом окружении: {error.stderr.strip().splitlines()[-1]}")
+
+    over_budget = False
+    for name, value in results.items():
+        budget = BUDGETS[name]
+        mark = "ok" if value <= budget else "ПРЕВЫШЕН"
+        over_budget |= value > budget
+        print(f"{name:<22}{value:>9.1f} мс   бюджет {budget} мс   {mark}")
+    if args.top:
+        for cumulative, name in heaviest_imports("travel_core"):
+            print(f"  {name:<30}{cumulative / 1000:>8.1f} мс")
+    sys.exit(1 if over_budget or check.returncode else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Обмен прогрессом с друзьями: размер дельты против полных множеств и время разбора и слияния.
+
+    python -m benchmarks.bench_sync --users 10000 --places 20000 --new 0.01
+
+Устройство A отдаёт посещения --users пользователей. Полная дельта
+сравнивается с наивными вариантами — JSON {имя: [места]} и битовыми
+строками VisitMatrix (как есть и в zlib). Затем у --new доли пользователей
+появляются новые посещения (по одному-два места), и по сети уходит только
+дельта с прошлой версии. Слияние — в индекс получателя, у которого уже
+есть всё из полной дельты: объединение множеств одним пакетом против
+посещений по одному.
+"""
+import argparse
+import json
+import time
+import zlib
+
+import numpy as np
+
+from benchmarks import synthetic
+from visit_index import VisitIndex
+from visit_sync import DEVICE_BYTES, DeltaReader, encode_delta, merge_delta
+from visits_bitset import VisitMatrix
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--places", type=int, default=20_000)
+    parser.add_argument("--new", type=float, default=0.01, help="доля пользователей с новыми посещениями")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    names = synthetic.user_names(args.users)
+    rows, places = synthetic.visits(args.users, args.places, args.seed)
+    device, peer = b"A" * DEVICE_BYTES, b"B" * DEVICE_BYTES
+    print(f"{args.users:,} пользователей, {args.places:,} мест, {len(rows):,} посещений")
+
+    def size(label, data, base=None):
+        ratio = f" ({len(data) / base:.1f}x дельты)" if base else ""
+        print(f"  {label:<28} {len(data) / 1024:10.1f} КБ{ratio}")
+
+    seconds, full = timed(lambda: encode_delta(device, 0, len(rows), names, rows, places, {peer: 0}), 5)
+    print(f"Полная дельта: кодирование {seconds * 1000:.1f} мс")
+    by_user = {}
+    for row, place in zip(rows.tolist(), places.tolist()):
+        by_user.setdefault(names[row], []).append(place)
+    naive = json.dumps(by_user, ensure_ascii=False).encode()
+    matrix = synthetic.visit_matrix(args.users, args.places, args.seed)
+    bits = matrix._rows().tobytes()
+    size("дельта TVSD (zlib)", full)
+    size("JSON", naive, len(full))
+    size("JSON, zlib", zlib.compress(naive, 6), len(full))
+    size("битовые строки", bits, len(full))
+    size("битовые строки, zlib", zlib.compress(bits, 6), len(full))
+
+    # Новые посещения: по одному-два непосещённых места у --new доли пользователей
+    rng = np.random.default_rng(args.seed + 1)
+    changed = rng.choice(args.users, max(1, int(args.users * args.new)), replace=False)
+    new_rows = np.repeat(changed, rng.integers(1, 3, len(changed)))
+    new_places = rng.integers(1, args.places + 1, len(new_rows))
+    seen = matrix.bits[new_rows, new_places >> 6] >> (new_places & 63).astype(np.uint64) & np.uint64(1)
+    new_rows, new_places = new_rows[seen == 0], new_places[seen == 0]
+    delta = encode_delta(device, len(rows), len(rows) + len(new_rows), names, new_rows, new_places, {peer: 0})
+    print(f"Новые посещения: {len(new_rows):,} у {len(changed):,} пользователей")
+    size("дельта TVSD (zlib)", delta)
+    size("полный JSON заново, zlib", zlib.compress(naive, 6), len(delta))
+
+    seconds, reader = timed(lambda: DeltaReader(full), 20)
+    decode, _ = timed(lambda: (reader.rows(), reader.places()), 20)
+    print(f"Разбор полной дельты: заголовок и zlib {seconds * 1000:.2f} мс, массивы {decode * 1000:.2f} мс")
+    json_seconds, _ = timed(lambda: json.loads(zlib.decompress(zlib.compress(naive, 6))), 5)
+    print(f"  (JSON с zlib: {json_seconds * 1000:.1f} мс)")
+
+    place_ids = np.arange(1, args.places + 1)
+    index = VisitIndex(VisitMatrix(args.places))
+    seconds, added = timed(lambda: merge_delta(index, reader, place_ids), 1)
+    print(f"Слияние полной дельты в пустой индекс: {seconds * 1000:.1f} мс, "
+          f"новых посещений {sum(len(value) for value in added.values()):,}")
+    seconds, added = timed(lambda: merge_delta(index, DeltaReader(full), place_ids), 1)
+    print(f"Повторное слияние той же дельты: {seconds * 1000:.1f} мс, новых посещений "
+          f"{sum(len(value) for value in added.values())}")
+
+    plain = VisitIndex(VisitMatrix.from_bits(args.places, index.matrix.names, index.matrix._rows(),
+                                             index.matrix.place_counts))
+    seconds, added = timed(lambda: merge_delta(index, DeltaReader(delta), place_ids), 1)
+    pairs = [(names[row], place) for row, place in zip(new_rows.tolist(), new_places.tolist())]
+    one_by_one, _ = timed(lambda: [plain.visit(name, place) for name, place in pairs], 1)
+    print(f"Слияние новой дельты: {seconds * 1000:.2f} мс, по одному посещению {one_by_one * 1000:.2f} мс, "
+          f"новых посещений {sum(len(value) for value in added.values()):,}")
+    if index.top(100) != plain.top(100) or not np.array_equal(index.matrix._rows(), plain.matrix._rows()):
+        raise SystemExit("Слияние пакетом и по одному разошлись")
+    print("Слияния совпадают")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Посещения по GPS-треку: разбор GPX и GeoJSON и сверка с геозонами в одном процессе и в пуле.
+
+    python -m benchmarks.bench_tracks --points 2000000 --places 100000 --workers 1,4,8
+
+Трек из benchmarks.synthetic (сутки — сегмент) пишется в оба формата во
+временный каталог. Для каждого формата и числа процессов печатается время
+и точек в секунду; итог всех запусков должен совпасть до бита.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import synthetic
+from tracks import Geofences, detect_visits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=2_000_000)
+    parser.add_argument("--places", type=int, default=100_000)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="числа процессов через запятую")
+    args = parser.parse_args()
+
+    places = synthetic.locations(args.places)
+    start = time.perf_counter()
+    fences = Geofences(places)
+    print(f"Геозоны {len(fences):,} мест: {time.perf_counter() - start:.2f} с")
+    track = synthetic.track(args.points, places)
+    days = int(track[3][-1]) + 1
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        files = [
+            synthetic.write_gpx(os.path.join(directory, "track.gpx"), *track),
+            synthetic.write_track_geojson(os.path.join(directory, "track.geojson"), *track),
+        ]
+        print(f"Трек: {args.points:,} точек за {days} сут.")
+        for path in files:
+            size = os.path.getsize(path) / 2 ** 20
+            for workers in sorted({int(value) for value in args.workers.split(",")}):
+                start = time.perf_counter()
+                visits = detect_visits([path], fences, workers=workers)
+                elapsed = time.perf_counter() - start
+                results[(path, workers)] = visits
+                print(f"{os.path.basename(path):14} {size:6.0f} МБ  процессов {workers:2}: {elapsed:6.2f} с, "
+                      f"{args.points / elapsed:9,.0f} точек/с, посещений {len(visits):,}")
+    if len({tuple(visits) for visits in results.values()}) != 1:
+        raise SystemExit("Итоги запусков различаются")
+    print("Итоги всех запусков совпадают")
+
+
+if __name__ == "__main__":
+    main()
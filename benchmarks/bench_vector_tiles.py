@@ -0,0 +1,103 @@
+"""Векторные тайлы мест: сборка по запросу, размер против JSON /api/markers и сборка уровней пулом.
+
+    python -m benchmarks.bench_vector_tiles --places 100000 --zooms 11-16 --workers 1,4
+
+Для каждого уровня берутся тайлы окна браузера 1280x800 (5x4 тайла) вокруг
+центра каждого города и печатаются время первой сборки и
+повторного запроса из кэша, а также средний размер тайла (как есть и в
+gzip) против JSON маркеров и кластеров MarkerClusterer на ту же область.
+Затем уровни собираются заранее с разным числом процессов; тайлы окон
+всех запусков должны совпасть.
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from clustering import MarkerClusterer
+from vector_tiles import VectorTileCache
+
+VIEW_TILES = (5, 4)
+
+
+def tile_bounds(z, x, y):
+    """(west, south, east, north) тайла."""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def view_tiles(zoom):
+    """Тайлы окна вокруг центра каждого города."""
+    n = 1 << zoom
+    tiles = []
+    for _, lat, lon, _ in synthetic.CITIES:
+        cx = int((lon + 180.0) / 360.0 * n)
+        cy = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        tiles.extend((zoom, cx + dx, cy + dy) for dx in range(-(VIEW_TILES[0] // 2), VIEW_TILES[0] - VIEW_TILES[0] // 2)
+                     for dy in range(-(VIEW_TILES[1] // 2), VIEW_TILES[1] - VIEW_TILES[1] // 2))
+    return tiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--places", type=int, default=100_000)
+    parser.add_argument("--zooms", default="11-16", help="уровни для запросов, например 11-16")
+    parser.add_argument("--prebuild", default="11-13", help="уровни для сборки заранее")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="числа процессов через запятую")
+    args = parser.parse_args()
+
+    places = synthetic.locations(args.places)
+    visited = synthetic.visits(1, args.places)[1].tolist()
+    start = time.perf_counter()
+    cache = VectorTileCache(places, visited)
+    print(f"Индекс {args.places:,} мест: {time.perf_counter() - start:.2f} с")
+    clusterer = MarkerClusterer(places)
+
+    low, high = (int(value) for value in args.zooms.split("-"))
+    print(f"{'z':>3} {'тайлов':>7} {'сборка, мс':>11} {'кэш, мкс':>9} {'MVT, КБ':>8} {'gzip, КБ':>9} {'JSON, КБ':>9}")
+    for zoom in range(low, high + 1):
+        tiles = view_tiles(zoom)
+        start = time.perf_counter()
+        built = [cache.get(*tile) for tile in tiles]
+        cold = (time.perf_counter() - start) / len(tiles)
+        start = time.perf_counter()
+        for tile in tiles:
+            cache.get(*tile)
+        warm = (time.perf_counter() - start) / len(tiles)
+        raw = np.mean([len(tile.data) for tile in built])
+        packed = np.mean([len(tile.gzipped or tile.data) for tile in built])
+        markers = np.mean([
+            len(gzip.compress(json.dumps(clusterer.clusters(*tile_bounds(*tile), zoom), ensure_ascii=False).encode()))
+            for tile in tiles
+        ])
+        print(f"{zoom:3} {len(tiles):7} {cold * 1000:11.1f} {warm * 1e6:9.1f} {raw / 1024:8.1f} {packed / 1024:9.1f} "
+              f"{markers / 1024:9.1f}")
+
+    low, high = (int(value) for value in args.prebuild.split("-"))
+    sample = [tile for zoom in range(low, high + 1) for tile in view_tiles(zoom)]
+    results = []
+    for workers in sorted({int(value) for value in args.workers.split(",")}):
+        cache = VectorTileCache(places, visited, capacity=1 << 20)
+        start = time.perf_counter()
+        count = cache.prebuild(low, high, workers)
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        print(f"Уровни {low}-{high}, процессов {workers:2}: {count:,} тайлов за {elapsed:.2f} с "
+              f"({count / elapsed:,.0f} тайлов/с, {stats['bytes'] / 2 ** 20:.1f} МБ)")
+        results.append([cache.get(*tile).etag for tile in sample])
+    if any(result != results[0] for result in results):
+        raise SystemExit("Тайлы запусков различаются")
+    print("Тайлы всех запусков совпадают")
+
+
+if __name__ == "__main__":
+    main()
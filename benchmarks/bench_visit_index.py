@@ -0,0 +1,86 @@
+"""Индекс посещений на 100 тыс. пользователей: построение, посещения и запросы против полного прохода.
+
+    python -m benchmarks.bench_visit_index --users 100000 --places 10000 --visits 2000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from visit_index import VisitIndex
+from visits_bitset import VisitMatrix
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--places", type=int, default=10_000)
+    parser.add_argument("--visits", type=int, default=2_000_000)
+    parser.add_argument("--friends", type=int, default=200, help="друзей у пользователя для рекомендаций")
+    parser.add_argument("--updates", type=int, default=100_000, help="посещений после построения")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    matrix = VisitMatrix(args.places)
+    for user in range(args.users):
+        matrix.add_user(f"user{user}")
+    matrix.visit_batch(rng.integers(0, args.users, args.visits), rng.zipf(1.3, args.visits) % args.places + 1)
+    print(f"{args.users:,} пользователей, {args.places:,} мест, {int(matrix.counts().sum()):,} посещений")
+
+    start = time.perf_counter()
+    index = VisitIndex(matrix)
+    print(f"построение индекса: {time.perf_counter() - start:.2f} с")
+
+    users = [f"user{user}" for user in rng.integers(0, args.users, args.updates)]
+    places = (rng.integers(1, args.places + 1, args.updates)).tolist()
+    plain = VisitMatrix.from_bits(args.places, matrix.names, matrix._rows(), matrix.place_counts)
+    start = time.perf_counter()
+    for user, place in zip(users, places):
+        plain.visit(user, place)
+    baseline = (time.perf_counter() - start) / args.updates
+    start = time.perf_counter()
+    for user, place in zip(users, places):
+        index.visit(user, place)
+    seconds = (time.perf_counter() - start) / args.updates
+    print(f"посещение через индекс: {seconds * 1e6:.1f} мкс (только матрица {baseline * 1e6:.1f} мкс)")
+
+    # Место средней популярности: у самых популярных посетители — почти все пользователи
+    name, place = "user42", int(np.argsort(matrix.place_counts)[len(matrix.place_counts) // 2])
+    seconds, _ = timed(lambda: index.rank(name), 10_000)
+    full, _ = timed(lambda: int((matrix.counts() > matrix.count(name)).sum()) + 1, 100)
+    print(f"место в рейтинге: {seconds * 1e6:.1f} мкс (полный проход {full * 1e6:.0f} мкс)")
+    assert index.rank(name) == int((matrix.counts() > matrix.count(name)).sum()) + 1
+
+    seconds, top = timed(lambda: index.top(100), 1000)
+    full, expected = timed(lambda: matrix.leaderboard(100), 20)
+    print(f"первые 100: {seconds * 1e6:.1f} мкс (полный проход {full * 1e6:.0f} мкс)")
+    assert [count for _, count in top] == [count for _, count in expected]
+
+    def column():
+        rows = np.flatnonzero(matrix._rows()[:, place >> 6] >> np.uint64(place & 63) & np.uint64(1))
+        return [matrix.names[row] for row in rows]
+
+    seconds, visitors = timed(lambda: index.place_visitors(place), 1000)
+    full, expected = timed(column, 20)
+    print(f"посетители места ({len(visitors):,}): {seconds * 1e6:.1f} мкс (полный проход {full * 1e6:.0f} мкс)")
+    assert sorted(visitors) == sorted(expected)
+
+    friends = [f"user{user}" for user in rng.choice(args.users, args.friends, replace=False)]
+    cold, _ = timed(lambda: index.recommendations(name, friends), 1)
+    warm, _ = timed(lambda: index.recommendations(name, friends), 1000)
+    print(f"рекомендации по {args.friends} друзьям: {cold * 1e3:.2f} мс, из кэша {warm * 1e6:.1f} мкс")
+    index.visit(friends[0], 1)
+    after, _ = timed(lambda: index.recommendations(name, friends), 1)
+    print(f"после посещения друга: {after * 1e3:.2f} мс (кэш сброшен)")
+
+
+if __name__ == "__main__":
+    main()
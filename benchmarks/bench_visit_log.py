@@ -0,0 +1,55 @@
+"""Журнал посещений: скорость записи и время восстановления состояния при запуске.
+
+    python -m benchmarks.bench_visit_log --events 2000000 --users 10000 --places 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from visit_log import VisitLog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--places", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    users = [f"user{i}" for i in rng.integers(0, args.users, args.events)]
+    places = (rng.zipf(1.3, args.events) % args.places + 1).tolist()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "visits.db")
+        log = VisitLog(path)
+        # Запись по одному событию, как из visit_place; поток записи сбрасывает пачки сам
+        start = time.perf_counter()
+        for user, place in zip(users, places):
+            log.record(user, place)
+        queued = time.perf_counter() - start
+        log.flush()
+        total = time.perf_counter() - start
+        print(f"record(): {args.events / queued:,.0f} событий/с в очередь")
+        print(f"с записью на диск: {args.events / total:,.0f} событий/с ({total:.1f} с)")
+
+        start = time.perf_counter()
+        matrix = log.load(args.places)  # хвост длиннее SNAPSHOT_EVERY — здесь же пишется снимок
+        print(f"запуск без снимка: {time.perf_counter() - start:.2f} с (проигрывание {args.events:,} событий и запись снимка)")
+        log.close()
+
+        log = VisitLog(path)
+        start = time.perf_counter()
+        restored = log.load(args.places)
+        print(f"запуск со снимком: {time.perf_counter() - start:.2f} с")
+        assert np.array_equal(restored.counts(), matrix.counts())
+        log.close()
+        print(f"размер базы: {os.path.getsize(path) / 2 ** 20:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
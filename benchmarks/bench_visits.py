@@ -0,0 +1,81 @@
+"""Сравнение VisitMatrix с хранением посещений в set из int.
+
+    python -m benchmarks.bench_visits --users 10000 --places 100000
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from visits_bitset import VisitMatrix
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def generate(users, places, visits_per_user, seed):
+    # Популярность мест по Ципфу: немногие места посещают почти все
+    rng = np.random.default_rng(seed)
+    data = {}
+    for user in range(users):
+        count = max(1, int(rng.exponential(visits_per_user)))
+        data[f"user{user}"] = set((rng.zipf(1.3, count) % places + 1).tolist())
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--places", type=int, default=100000)
+    parser.add_argument("--visits", type=int, default=200, help="среднее число посещений на пользователя")
+    parser.add_argument("--pairs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    data = generate(args.users, args.places, args.visits, args.seed)
+    names = list(data)
+    pair_rng = random.Random(args.seed)
+    pairs = [(pair_rng.randrange(len(names)), pair_rng.randrange(len(names))) for _ in range(args.pairs)]
+
+    build_time, matrix = timed(lambda: VisitMatrix(args.places, data))
+    set_bytes = sum(sys.getsizeof(visited) + 28 * len(visited) for visited in data.values())
+    print(f"{args.users} пользователей × {args.places} мест, построение матрицы {build_time * 1000:.0f} мс")
+    print(f"память: set {set_bytes / 1e6:.1f} МБ, битсеты {matrix._rows().nbytes / 1e6:.1f} МБ")
+
+    cases = [
+        (
+            "число мест у каждого",
+            lambda: [len(data[name]) for name in names],
+            lambda: matrix.counts(),
+        ),
+        (
+            f"общие места, {args.pairs} пар",
+            lambda: [len(data[names[a]] & data[names[b]]) for a, b in pairs],
+            lambda: matrix.common_counts(pairs),
+        ),
+        (
+            "10 самых посещаемых мест",
+            lambda: Counter(place for visited in data.values() for place in visited).most_common(10),
+            lambda: matrix.most_visited(10),
+        ),
+        (
+            "таблица лидеров, топ-10",
+            lambda: sorted(((len(data[name]), name) for name in names), reverse=True)[:10],
+            lambda: matrix.leaderboard(10),
+        ),
+    ]
+    print(f"{'операция':<28}{'set, мс':>12}{'битсеты, мс':>14}{'ускорение':>12}")
+    for title, with_sets, with_bits in cases:
+        set_time, _ = timed(with_sets)
+        bits_time, _ = timed(with_bits)
+        print(f"{title:<28}{set_time * 1000:>12.2f}{bits_time * 1000:>14.2f}{set_time / bits_time:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""Набор замеров на синтетических данных с сохранением результатов в JSON.
+
+    python -m benchmarks.suite --size small
+    python -m benchmarks.suite --size medium --filter map,visits --out before.json
+    python -m benchmarks.suite --size medium --compare before.json --threshold 0.1
+
+Замеры регистрируются декоратором @benchmark (как suites в asv): функция
+получает параметры размера и временный каталог, готовит данные и
+возвращает Case — замеряемую функцию и число операций за вызов. Подготовка
+в замер не входит. Каждый замер повторяется --repeat раз после прогрева.
+
+Результат по умолчанию пишется в benchmarks/results/<коммит>-<размер>.json:
+метаданные (коммит, версии Python и NumPy, платформа) и по каждому замеру
+времена повторов, min/median/mean/stdev и операций в секунду. С --compare
+медианы сравниваются с прошлым файлом; замедление больше --threshold
+считается регрессией (код выхода 1 с --fail-on-regression).
+
+Qt работает с платформой offscreen, поэтому набор запускается без дисплея.
+"""
+import argparse
+import datetime
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+from achievements import AchievementEngine
+from benchmarks import synthetic
+from clustering import MarkerClusterer
+from location_store import LocationStore
+from map_renderer import PageCache, locations_digest, page_key, render_map
+from map_server import start_map_server
+from tracks import Geofences, detect_visits
+from vector_tiles import TileIndex
+from visit_index import VisitIndex
+from visit_sync import DEVICE_BYTES, DeltaReader, encode_delta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+SIZES = {
+    "small": {"places": 1_000, "users": 1_000},
+    "medium": {"places": 20_000, "users": 10_000},
+    "large": {"places": 100_000, "users": 100_000},
+}
+
+# run() — замеряемая функция, ops — сколько операций она выполняет за вызов
+Case = namedtuple("Case", "run ops teardown", defaults=(1, None))
+
+BENCHMARKS = {}
+
+
+def benchmark(name, repeat=5, warmup=1):
+    """Регистрирует подготовку замера name: setup(params, directory) -> Case."""
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeat, warmup)
+        return setup
+    return register
+
+
+def database(params, directory):
+    """Синтетическая locations.db размера params; собирается один раз на каталог."""
+    path = os.path.join(directory, "locations.db")
+    if not os.path.exists(path):
+        synthetic.build_database(path, params["places"], params["users"])
+    return path
+
+
+def quiet_core(path):
+    # TravelCore и сервер печатают о запуске — в выводе набора это лишнее
+    from travel_core import TravelCore
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return TravelCore(path)
+        finally:
+            sys.stdout = stdout
+
+
+# --- Карта -----------------------------------------------------------------
+
+@benchmark("map.render")
+def map_render(params, directory):
+    places = synthetic.locations(params["places"])
+    visited = set(random.Random(1).sample(range(1, len(places) + 1), len(places) // 10))
+    path = os.path.join(directory, "map.html")
+    return Case(lambda: render_map(places, visited, path))
+
+
+@benchmark("map.page_key")
+def map_page_key(params, directory):
+    # Цена проверки «страница не изменилась» после посещения
+    places = synthetic.locations(params["places"])
+    visited = set(range(1, len(places) + 1, 10))
+    key = locations_digest(places)
+    cache = PageCache()
+    cache.render(page_key(key, visited), places, visited)
+    return Case(lambda: cache.get(page_key(key, visited)))
+
+
+@benchmark("map.clusters")
+def map_clusters(params, directory):
+    clusterer = MarkerClusterer(synthetic.locations(params["places"]))
+    rng = random.Random(1)
+    views = []
+    for _ in range(100):
+        city = rng.choice(synthetic.CITIES)
+        zoom = rng.randint(8, 16)
+        span = 360 / 2 ** zoom * 4
+        views.append((city[2] - span, city[1] - span / 2, city[2] + span, city[1] + span / 2, zoom))
+    return Case(lambda: [clusterer.clusters(*view) for view in views], ops=len(views))
+
+
+# --- Посещения -------------------------------------------------------------
+
+@benchmark("visits.visit_place")
+def visits_visit_place(params, directory):
+    core = quiet_core(database(params, directory))
+    # Каждый вызов отмечает новые места: повтор уже посещённого ничего не стоит
+    places = np.random.default_rng(2).permutation(np.arange(1, params["places"] + 1)).tolist()
+    batch = 100
+    batches = iter(range(0, len(places), batch))
+
+    def run():
+        start = next(batches)
+        for place in places[start:start + batch]:
+            core.visit_place(place)
+
+    return Case(run, ops=batch, teardown=core.close)
+
+
+@benchmark("visits.index_visit")
+def visits_index_visit(params, directory):
+    matrix = synthetic.visit_matrix(params["users"], params["places"])
+    index = VisitIndex(matrix)
+    rng = np.random.default_rng(3)
+    names = synthetic.user_names(params["users"])
+    batch = 1000
+
+    def run():
+        for row, place in zip(rng.integers(0, len(names), batch), rng.integers(1, params["places"] + 1, batch)):
+            index.visit(names[row], int(place))
+
+    return Case(run, ops=batch)
+
+
+# --- Прогресс и достижения -------------------------------------------------
+
+@benchmark("progress.achievements")
+def progress_achievements(params, directory):
+    places = synthetic.locations(params["places"])
+    matrix = synthetic.visit_matrix(params["users"], params["places"])
+    engine = AchievementEngine.from_config(places)
+    return Case(lambda: engine.evaluate_all(matrix), ops=params["users"])
+
+
+@benchmark("progress.leaderboard")
+def progress_leaderboard(params, directory):
+    index = VisitIndex(synthetic.visit_matrix(params["users"], params["places"]))
+    names = synthetic.user_names(params["users"])[:1000]
+
+    def run():
+        for name in names:
+            index.rank(name)
+        index.top(10)
+
+    return Case(run, ops=len(names))
+
+
+@benchmark("progress.recommendations")
+def progress_recommendations(params, directory):
+    index = VisitIndex(synthetic.visit_matrix(params["users"], params["places"]), cache_size=0)
+    names = synthetic.user_names(params["users"])
+    rng = random.Random(4)
+    queries = [(rng.choice(names), rng.sample(names, min(20, len(names)))) for _ in range(100)]
+    return Case(lambda: [index.recommendations(name, friends) for name, friends in queries], ops=len(queries))
+
+
+# --- База ------------------------------------------------------------------
+
+@benchmark("db.import_csv", repeat=3)
+def db_import_csv(params, directory):
+    from importer import Importer
+    source = synthetic.write_csv(os.path.join(directory, "places.csv"), synthetic.locations(params["places"]))
+    runs = itertools.count()
+    log = open(os.devnull, "w")
+
+    def run():
+        # Каждый повтор пишет в новую базу: в старой все места уже были бы дубликатами
+        importer = Importer(os.path.join(directory, f"import-{next(runs)}.db"), log=log)
+        importer.import_file(source)
+        importer.close()
+
+    return Case(run, ops=params["places"], teardown=log.close)
+
+
+@benchmark("db.in_bounds")
+def db_in_bounds(params, directory):
+    store = LocationStore(database(params, directory))
+    rng = random.Random(5)
+    boxes = []
+    for _ in range(200):
+        city = rng.choice(synthetic.CITIES)
+        lat, lon = city[1] + rng.uniform(-0.1, 0.1), city[2] + rng.uniform(-0.1, 0.1)
+        boxes.append((lat - 0.02, lon - 0.04, lat + 0.02, lon + 0.04))
+    return Case(lambda: [store.in_bounds(*box, limit=500) for box in boxes], ops=len(boxes), teardown=store.close)
+
+
+@benchmark("db.nearest")
+def db_nearest(params, directory):
+    store = LocationStore(database(params, directory))
+    rng = random.Random(6)
+    points = [(city[1] + rng.uniform(-0.2, 0.2), city[2] + rng.uniform(-0.2, 0.2))
+              for city in rng.choices(synthetic.CITIES, k=200)]
+    return Case(lambda: [store.nearest(lat, lon, 10) for lat, lon in points], ops=len(points), teardown=store.close)
+
+
+@benchmark("db.search")
+def db_search(params, directory):
+    # Набор по буквам: каждый префикс — отдельный запрос первой страницы
+    store = LocationStore(database(params, directory))
+    prefixes = [word[:n] for word in ("музей", "огонёк", "парк берёзка") for n in range(1, len(word) + 1)]
+    return Case(lambda: [store.search(text, 20) for text in prefixes], ops=len(prefixes), teardown=store.close)
+
+
+@benchmark("db.search_near")
+def db_search_near(params, directory):
+    store = LocationStore(database(params, directory))
+    prefixes = [word[:n] for word in ("музей", "огонёк", "парк берёзка") for n in range(1, len(word) + 1)]
+    lat, lon = synthetic.CITIES[0][1:3]
+    return Case(lambda: [store.search_near(text, lat, lon, 20) for text in prefixes], ops=len(prefixes),
+                teardown=store.close)
+
+
+# --- Треки -----------------------------------------------------------------
+
+@benchmark("tracks.detect", repeat=3)
+def tracks_detect(params, directory):
+    # Разбор GPX и сверка с геозонами в одном процессе: пул на замер не влияет, только делит его
+    places = synthetic.locations(params["places"])
+    fences = Geofences(places)
+    points = 100_000
+    path = synthetic.write_gpx(os.path.join(directory, "track.gpx"), *synthetic.track(points, places))
+    return Case(lambda: detect_visits([path], fences, workers=1), ops=points)
+
+
+# --- Векторные тайлы -------------------------------------------------------
+
+@benchmark("vtiles.encode")
+def vtiles_encode(params, directory):
+    # Окно 5x4 тайла z13 вокруг центра каждого города, без кэша
+    places = synthetic.locations(params["places"])
+    index = TileIndex(places, synthetic.visits(1, params["places"])[1].tolist())
+    tiles = []
+    for _, lat, lon, _ in synthetic.CITIES:
+        x = int((lon + 180.0) / 360.0 * (1 << 13))
+        y = int((1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * (1 << 13))
+        tiles.extend((13, x + dx, y + dy) for dx in range(-2, 3) for dy in range(-2, 2))
+    return Case(lambda: [index.encode(*tile) for tile in tiles], ops=len(tiles))
+
+
+# --- Обмен прогрессом -----------------------------------------------------
+
+@benchmark("sync.delta")
+def sync_delta(params, directory):
+    # Полная дельта всех пользователей: сборка файла и разбор обратно в массивы
+    names = synthetic.user_names(params["users"])
+    rows, places = synthetic.visits(params["users"], params["places"])
+
+    def run():
+        reader = DeltaReader(encode_delta(b"\0" * DEVICE_BYTES, 0, len(rows), names, rows, places))
+        return reader.rows(), reader.places()
+
+    return Case(run, ops=len(rows))
+
+
+# --- Сервер ----------------------------------------------------------------
+
+@benchmark("server.markers", repeat=3)
+def server_markers(params, directory):
+    clusterer = MarkerClusterer(synthetic.locations(params["places"]))
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            server = start_map_server(clusterer, port=0, static_root=directory)
+        finally:
+            sys.stdout = stdout
+    host, port = server.server_address[:2]
+    rng = random.Random(7)
+    paths = []
+    for _ in range(64):
+        city = rng.choice(synthetic.CITIES)
+        zoom = rng.randint(9, 15)
+        span = 360 / 2 ** zoom * 4
+        paths.append(f"/api/markers?west={city[2] - span:.5f}&south={city[1] - span / 2:.5f}"
+                     f"&east={city[2] + span:.5f}&north={city[1] + span / 2:.5f}&zoom={zoom}")
+    clients, per_client = 8, 100
+
+    def client(seed):
+        # Одно keep-alive соединение на клиента, как у вкладки браузера
+        conn = http.client.HTTPConnection(host, port)
+        order = random.Random(seed)
+        for _ in range(per_client):
+            conn.request("GET", order.choice(paths))
+            conn.getresponse().read()
+        conn.close()
+
+    def run():
+        threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def teardown():
+        server.shutdown()
+        server.server_close()
+
+    return Case(run, ops=clients * per_client, teardown=teardown)
+
+
+# --- Запуск ----------------------------------------------------------------
+
+@benchmark("startup.core", repeat=3)
+def startup_core(params, directory):
+    path = database(params, directory)
+    return Case(lambda: quiet_core(path).close())
+
+
+WINDOW_INIT = (
+    "import time; start = time.perf_counter(); import sys, try2; "
+    "app = try2.QApplication(sys.argv); window = try2.TravelApp(); window.show(); app.processEvents(); "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+@benchmark("startup.window", repeat=3, warmup=0)
+def startup_window(params, directory):
+    # Окно создаётся в отдельном процессе в каталоге с синтетической базой
+    # (try2 открывает locations.db из текущего каталога)
+    database(params, directory)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+
+    def run():
+        done = subprocess.run([sys.executable, "-c", WINDOW_INIT], cwd=directory, env=env,
+                              capture_output=True, text=True, timeout=300)
+        if done.returncode:
+            raise RuntimeError((done.stderr.strip().splitlines() or ["окно не создано"])[-1])
+
+    return Case(run)
+
+
+# ---------------------------------------------------------------------------
+
+def measure(name, params, directory):
+    setup, repeat, warmup = BENCHMARKS[name]
+    case = setup(params, directory)
+    try:
+        for _ in range(warmup):
+            case.run()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case.run()
+            times.append(time.perf_counter() - start)
+    finally:
+        if case.teardown is not None:
+            case.teardown()
+    median = statistics.median(times)
+    return {
+        "times": times,
+        "ops": case.ops,
+        "min": min(times),
+        "median": median,
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "ops_per_sec": case.ops / median if median else None,
+    }
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(size):
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "size": size,
+        "params": SIZES[size],
+    }
+
+
+def compare(old, new, threshold):
+    """Печатает сравнение медиан; возвращает имена замеров с регрессией."""
+    regressions = []
+    print(f"\nСравнение с {old['meta'].get('commit') or '?'} ({old['meta'].get('size')}):")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if not before or "median" not in before or "median" not in result:
+            continue
+        ratio = result["median"] / before["median"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  регрессия"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            mark = "  ускорение"
+        print(f"  {name:<28} {before['median'] * 1000:>10.2f} -> {result['median'] * 1000:>10.2f} мс  x{ratio:.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--filter", default="", help="префиксы имён через запятую, например map,db.import")
+    parser.add_argument("--repeat", type=int, help="повторов на замер вместо заданных в наборе")
+    parser.add_argument("--out", help="файл результатов (по умолчанию benchmarks/results/<коммит>-<размер>.json)")
+    parser.add_argument("--compare", help="файл результатов прошлого запуска")
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое замедление медианы (0.1 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--list", action="store_true", help="показать замеры и выйти")
+    args = parser.parse_args()
+
+    prefixes = [prefix for prefix in args.filter.split(",") if prefix]
+    names = [name for name in BENCHMARKS if not prefixes or name.startswith(tuple(prefixes))]
+    if args.list:
+        print("\n".join(names))
+        return
+    if args.repeat:
+        for name in names:
+            setup, _, warmup = BENCHMARKS[name]
+            BENCHMARKS[name] = (setup, args.repeat, warmup)
+
+    params = SIZES[args.size]
+    report = {"meta": metadata(args.size), "results": {}}
+    print(f"Размер {args.size}: {params['places']:,} мест, {params['users']:,} пользователей")
+    # Каталог общий для всех замеров: синтетическая база собирается один раз
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            try:
+                result = measure(name, params, directory)
+            except Exception as error:  # замер без нужной зависимости (QtWebEngine) не рушит набор
+                report["results"][name] = {"error": f"{type(error).__name__}: {error}"}
+                print(f"  {name:<28} ошибка: {type(error).__name__}: {error}")
+                continue
+            report["results"][name] = result
+            per_op = result["median"] / result["ops"]
+            print(f"  {name:<28} {result['median'] * 1000:>10.2f} мс  "
+                  f"({per_op * 1e6:,.1f} мкс/оп, {result['ops_per_sec']:,.0f} оп/с)")
+
+    out = args.out
+    if out is None:
+        commit = (report["meta"]["commit"] or "unknown")[:10]
+        out = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if report['meta']['dirty'] else ''}-{args.size}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"Результаты: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
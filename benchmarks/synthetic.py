@@ -0,0 +1,202 @@
+"""Синтетические данные для замеров: места вокруг центров городов, пользователи и посещения.
+
+Все генераторы детерминированы по seed: одинаковые аргументы дают те же
+данные на любой машине, поэтому результаты разных коммитов сравнимы.
+
+* Места сгущаются к центрам городов (CITIES, доля города — его вес), как
+  20 мест Москвы из DEFAULT_LOCATIONS; расстояние от центра экспоненциальное.
+* Популярность мест — распределение Ципфа по случайной перестановке id.
+* Число посещений у пользователя — логнормальное: большинство посетило
+  несколько мест, немногие — сотни.
+* GPS-трек — переходы от места к месту с остановками у них, точка раз в
+  TRACK_STEP_S секунд с шумом GPS; каждые сутки — новый сегмент.
+"""
+import csv
+import json
+import math
+
+import numpy as np
+
+from location_store import Location, LocationStore
+from visit_log import VisitLog
+from visits_bitset import VisitMatrix
+
+# Город, широта и долгота центра, доля мест
+CITIES = [
+    ("Москва", 55.7558, 37.6173, 0.45),
+    ("Санкт-Петербург", 59.9386, 30.3141, 0.20),
+    ("Казань", 55.7963, 49.1088, 0.08),
+    ("Новосибирск", 55.0302, 82.9204, 0.07),
+    ("Екатеринбург", 56.8380, 60.5975, 0.07),
+    ("Нижний Новгород", 56.3269, 44.0059, 0.07),
+    ("Сочи", 43.5855, 39.7231, 0.06),
+]
+CITY_RADIUS_KM = 6.0  # среднее расстояние места от центра
+# Из вида места и слова собираются названия вроде «Парк «Берёзка»»: слова повторяются,
+# как в настоящих каталогах, а «ё» проверяет поиск без учёта ё/е
+KINDS = [
+    "Музей", "Парк", "Храм", "Собор", "Театр", "Кафе", "Ресторан", "Сквер", "Памятник", "Библиотека",
+    "Галерея", "Усадьба", "Мост", "Площадь", "Рынок", "Вокзал", "Стадион", "Пруд", "Фонтан", "Дворец",
+]
+WORDS = [
+    "Берёзка", "Ёлочка", "Звезда", "Победа", "Весна", "Сокол", "Рассвет", "Космос", "Волга", "Север",
+    "Юность", "Мир", "Заря", "Радуга", "Огонёк", "Чайка", "Восток", "Лира", "Орбита", "Дружба",
+] + [stem + ending for stem in ("Бел", "Крас", "Зелен", "Стар", "Нов", "Тих", "Ясн", "Свет", "Тёмн", "Син")
+     for ending in ("ый", "ая", "ое", "ов", "ин", "ёк", "ица", "ец", "ушка", "ово")]
+KM_PER_DEGREE = 111.32
+TRACK_STEP_S = 5
+TRACK_START = 1_714_521_600  # 2024-05-01 00:00 UTC
+
+
+def locations(count, seed=1, cities=CITIES, radius_km=CITY_RADIUS_KM):
+    """count мест (Location с id от 1) вокруг центров городов."""
+    rng = np.random.default_rng(seed)
+    weights = np.array([city[3] for city in cities], dtype=np.float64)
+    city = rng.choice(len(cities), count, p=weights / weights.sum())
+    distance = rng.exponential(radius_km, count)
+    angle = rng.uniform(0, 2 * math.pi, count)
+    center_lat = np.array([c[1] for c in cities])[city]
+    center_lon = np.array([c[2] for c in cities])[city]
+    lat = center_lat + distance * np.sin(angle) / KM_PER_DEGREE
+    lon = center_lon + distance * np.cos(angle) / (KM_PER_DEGREE * np.cos(np.radians(center_lat)))
+    rating = np.clip(np.round(rng.normal(4.3, 0.4, count), 1), 1.0, 5.0)
+    kind = rng.integers(0, len(KINDS), count)
+    word = rng.integers(0, len(WORDS), count)
+    return [
+        Location(i + 1, f"{KINDS[kind[i]]} «{WORDS[word[i]]}»", f"{cities[city[i]][0]}, место {i + 1}",
+                 float(lat[i]), float(lon[i]), float(rating[i]))
+        for i in range(count)
+    ]
+
+
+def user_names(count):
+    return [f"user{i}" for i in range(count)]
+
+
+def visits(num_users, num_places, seed=1, mean_visits=20, zipf=1.3):
+    """Пары (строка пользователя, id места) без повторов, упорядоченные по пользователю."""
+    rng = np.random.default_rng(seed)
+    sigma = 1.0
+    counts = rng.lognormal(math.log(mean_visits) - sigma ** 2 / 2, sigma, num_users)
+    counts = np.clip(np.rint(counts), 1, num_places).astype(np.int64)
+    rows = np.repeat(np.arange(num_users, dtype=np.int64), counts)
+    popularity = rng.permutation(num_places) + 1  # ранг популярности -> id места
+    places = popularity[(rng.zipf(zipf, len(rows)) - 1) % num_places]
+    pairs = np.unique(rows * (num_places + 1) + places)
+    return pairs // (num_places + 1), pairs % (num_places + 1)
+
+
+def visit_matrix(num_users, num_places, seed=1, **options):
+    """VisitMatrix с пользователями user0..userN и посещениями из visits()."""
+    matrix = VisitMatrix(num_places)
+    for name in user_names(num_users):
+        matrix.add_user(name)
+    rows, places = visits(num_users, num_places, seed, **options)
+    matrix.visit_batch(rows, places)
+    return matrix
+
+
+def build_database(path, num_places, num_users, seed=1, **options):
+    """locations.db со синтетическими местами и журналом посещений; возвращает список мест."""
+    places = locations(num_places, seed)
+    store = LocationStore(path)
+    store.replace_all([(p.latitude, p.longitude, p.name, p.rating, p.description) for p in places])
+    store.close()
+    log = VisitLog(path)
+    names = user_names(num_users)
+    rows, ids = visits(num_users, num_places, seed, **options)
+    bounds = np.searchsorted(rows, np.arange(num_users + 1))
+    for row, name in enumerate(names):
+        if bounds[row + 1] > bounds[row]:
+            log.record_many(name, ids[bounds[row]:bounds[row + 1]].tolist())
+    log.close()
+    # Снимок пишется при первой загрузке, чтобы замеры запуска не проигрывали весь журнал
+    log = VisitLog(path, snapshot_every=0)
+    log.load(num_places)
+    log.close()
+    return places
+
+
+def write_csv(path, places):
+    """CSV с колонками, которые понимает importer.read_csv."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("name", "description", "latitude", "longitude", "rating"))
+        for p in places:
+            writer.writerow((p.name, p.description, f"{p.latitude:.6f}", f"{p.longitude:.6f}", p.rating))
+    return path
+
+
+def track(count, places, seed=1, step_s=TRACK_STEP_S, stop_s=(30, 900), gps_noise_m=8.0):
+    """GPS-трек из count точек: (широты, долготы, время unix, номера сегментов).
+
+    Трек идёт от места к месту из places (пешком, на длинных переходах —
+    быстрее) и стоит у каждого от stop_s[0] до stop_s[1] секунд.
+    """
+    rng = np.random.default_rng(seed)
+    lat, lon = [], []
+    size = 0
+    here = rng.integers(len(places))
+    current = np.array([places[here].latitude, places[here].longitude])
+    while size < count:
+        # Соседние места чаще: следующая цель — ближайшая из нескольких случайных
+        options = rng.integers(len(places), size=8)
+        points = np.array([(places[i].latitude, places[i].longitude) for i in options])
+        target = points[np.argmin(((points - current) ** 2).sum(axis=1))] if rng.random() < 0.9 else points[0]
+        legs = int(min(max(np.hypot(*(target - current)) * KM_PER_DEGREE * 1000 / (1.4 * step_s), 1), 500))
+        stay = int(rng.integers(stop_s[0], stop_s[1]) // step_s)
+        path = np.concatenate([
+            current + np.linspace(0, 1, legs, endpoint=False)[:, None] * (target - current),
+            np.repeat(target[None, :], stay, axis=0),
+        ])
+        lat.append(path[:, 0])
+        lon.append(path[:, 1])
+        size += len(path)
+        current = target
+    lat, lon = np.concatenate(lat)[:count], np.concatenate(lon)[:count]
+    noise = rng.normal(0, gps_noise_m / (KM_PER_DEGREE * 1000), (2, count))
+    lat = lat + noise[0]
+    lon = lon + noise[1] / np.cos(np.radians(lat))
+    times = TRACK_START + np.arange(count, dtype=np.float64) * step_s
+    segments = ((times - TRACK_START) // 86400).astype(np.int64)
+    return lat, lon, times, segments
+
+
+def _iso(seconds):
+    return np.datetime_as_string(np.asarray(seconds * 1000, dtype="int64").astype("datetime64[ms]"), unit="s")
+
+
+def write_gpx(path, lat, lon, times, segments):
+    """GPX 1.1 с одним треком; смена номера сегмента начинает новый <trkseg>."""
+    stamps = _iso(times)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="benchmarks" xmlns="http://www.topografix.com/GPX/1/1">\n'
+                "<trk><name>synthetic</name>\n")
+        bounds = np.flatnonzero(np.diff(segments)) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(lat)]):
+            f.write("<trkseg>\n")
+            f.writelines(
+                f'<trkpt lat="{lat[i]:.7f}" lon="{lon[i]:.7f}"><ele>150.0</ele><time>{stamps[i]}Z</time></trkpt>\n'
+                for i in range(start, end)
+            )
+            f.write("</trkseg>\n")
+        f.write("</trk>\n</gpx>\n")
+    return path
+
+
+def write_track_geojson(path, lat, lon, times, segments):
+    """GeoJSON с LineString на сегмент и временем точек в properties.coordTimes."""
+    stamps = _iso(times)
+    bounds = np.flatnonzero(np.diff(segments)) + 1
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": np.c_[lon[start:end], lat[start:end]].round(7).tolist()},
+            "properties": {"coordTimes": [f"{stamp}Z" for stamp in stamps[start:end]]},
+        }
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(lat)])
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
@@ -0,0 +1,150 @@
+import math
+import threading
+
+import numpy as np
+
+# Ячейка сетки — 64 px при тайле 256 px, т.е. 2 ** CELL_SHIFT ячеек на тайл.
+# Ячейка уровня z ровно делится на 4 ячейки уровня z + 1, поэтому кластеры
+# соседних уровней образуют иерархию, как в supercluster.
+CELL_SHIFT = 2
+MAX_CLUSTER_ZOOM = 16
+MAX_LATITUDE = 85.05112878
+
+
+def project(lat, lon):
+    """Web Mercator: координаты в долях мира [0, 1) по x и y (скаляры или массивы NumPy)."""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(lon) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+class ClusterLevel:
+    """Кластеры одного уровня масштаба, отсортированные по ключу ячейки."""
+
+    def __init__(self, scale, keys, counts, lat, lon, first, order=None, starts=None):
+        self.scale = scale
+        self.keys = keys
+        self.counts = counts
+        self.lat = lat
+        self.lon = lon
+        self.first = first  # индекс места-представителя (для одиночных ячеек)
+        self.order = order  # только у нижнего уровня: места, упорядоченные по ячейкам
+        self.starts = starts
+
+
+class MarkerClusterer:
+    """Сеточная кластеризация мест с кэшем по уровням масштаба.
+
+    Уровень строится лениво при первом запросе (сортировка + reduceat по ключам ячеек)
+    и хранится до reset(). Запрос по видимой области затрагивает только ячейки
+    внутри неё, поэтому ответ не зависит от размера каталога.
+    """
+
+    def __init__(self, locations=(), max_zoom=MAX_CLUSTER_ZOOM):
+        self.max_zoom = max_zoom
+        self._lock = threading.Lock()
+        self.reset(locations)
+
+    def reset(self, locations):
+        """Задаёт новый набор мест и сбрасывает кэш уровней."""
+        locations = list(locations)
+        lat = np.fromiter((location.latitude for location in locations), dtype=np.float64, count=len(locations))
+        lon = np.fromiter((location.longitude for location in locations), dtype=np.float64, count=len(locations))
+        x, y = project(lat, lon)
+        with self._lock:
+            self._locations = locations
+            self._by_id = {location.id: location for location in locations}
+            self._lat, self._lon = lat, lon
+            self._x, self._y = x, y
+            self._levels = {}
+
+    def place(self, place_id):
+        """Место по id в том же виде, что одиночный маркер в clusters(), или None."""
+        location = self._by_id.get(place_id)
+        return _marker(location) if location is not None else None
+
+    def level(self, zoom):
+        zoom = max(0, min(zoom, self.max_zoom))
+        with self._lock:
+            level = self._levels.get(zoom)
+            if level is None:
+                level = self._levels[zoom] = self._build_level(zoom)
+            return level
+
+    def _build_level(self, zoom):
+        scale = 1 << (zoom + CELL_SHIFT)
+        keys = (self._x * scale).astype(np.int64) * scale + (self._y * scale).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        if len(sorted_keys) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return ClusterLevel(scale, empty, empty, np.empty(0), np.empty(0), empty, order, empty)
+        cell_keys, starts, counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+        lat = np.add.reduceat(self._lat[order], starts) / counts
+        lon = np.add.reduceat(self._lon[order], starts) / counts
+        if zoom == self.max_zoom:
+            return ClusterLevel(scale, cell_keys, counts, lat, lon, order[starts], order, starts)
+        return ClusterLevel(scale, cell_keys, counts, lat, lon, order[starts])
+
+    def _visible_cells(self, level, west, south, east, north):
+        if not all(math.isfinite(value) for value in (west, south, east, north)):
+            return np.empty(0, dtype=np.int64)
+        scale = level.scale
+        x0, y0 = project(north, max(west, -180.0))
+        x1, y1 = project(south, min(east, 180.0))
+        cx0, cx1 = int(x0 * scale), int(x1 * scale)
+        cy0, cy1 = int(y0 * scale), int(y1 * scale)
+        if cx1 < cx0 or cy1 < cy0:
+            return np.empty(0, dtype=np.int64)
+        if cx1 - cx0 + 1 > len(level.keys):
+            # Окно шире числа занятых ячеек — дешевле отфильтровать все
+            cx, cy = np.divmod(level.keys, scale)
+            return np.nonzero((cx >= cx0) & (cx <= cx1) & (cy >= cy0) & (cy <= cy1))[0]
+        # Ключи отсортированы по столбцу, затем по строке: по диапазону на столбец
+        columns = np.arange(cx0, cx1 + 1, dtype=np.int64) * scale
+        lo = np.searchsorted(level.keys, columns + cy0, side="left")
+        hi = np.searchsorted(level.keys, columns + cy1, side="right")
+        ranges = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def clusters(self, west, south, east, north, zoom):
+        """Маркеры и кластеры, видимые в прямоугольнике при заданном масштабе.
+
+        Возвращает список словарей, готовых к сериализации в JSON: у одиночных мест
+        есть id, name, rating и description, у кластеров — только count и центр.
+        """
+        if zoom > self.max_zoom:
+            # Крупнее нижнего уровня кластеров не бывает — отдаём сами места
+            level = self.level(self.max_zoom)
+            result = []
+            for cell in self._visible_cells(level, west, south, east, north):
+                start = level.starts[cell]
+                for index in level.order[start:start + level.counts[cell]]:
+                    location = self._locations[index]
+                    if south <= location.latitude <= north and west <= location.longitude <= east:
+                        result.append(_marker(location))
+            return result
+
+        level = self.level(zoom)
+        result = []
+        for cell in self._visible_cells(level, west, south, east, north):
+            count = int(level.counts[cell])
+            if count == 1:
+                result.append(_marker(self._locations[level.first[cell]]))
+            else:
+                result.append({"lat": float(level.lat[cell]), "lon": float(level.lon[cell]), "count": count})
+        return result
+
+
+def _marker(location):
+    return {
+        "id": location.id,
+        "lat": location.latitude,
+        "lon": location.longitude,
+        "count": 1,
+        "name": location.name,
+        "rating": location.rating,
+        "description": location.description,
+    }
@@ -0,0 +1,90 @@
+"""Вкладка «Отладка»: живые сводки замеров, счётчики, профилировщик и экспорт трассы."""
+import os
+
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import (
+    QCheckBox, QHBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+)
+
+from instrumentation import pyinstrument, tracer
+
+REFRESH_MS = 1000
+TRACE_PATH = "trace.json"
+PROFILE_PATH = "profile.txt"
+COLUMNS = ("Интервал", "Число", "p50, мс", "p95, мс", "p99, мс", "Макс, мс")
+
+
+class DebugPanel(QWidget):
+    """Сводки обновляются раз в секунду, только пока вкладка видна и замеры включены."""
+
+    def __init__(self, stall_monitor=None, parent=None):
+        super().__init__(parent)
+        self.stall_monitor = stall_monitor
+        layout = QVBoxLayout(self)
+
+        controls = QHBoxLayout()
+        self.trace_box = QCheckBox("Замерять")
+        self.trace_box.setChecked(tracer.enabled)
+        self.trace_box.toggled.connect(self.set_tracing)
+        self.profile_box = QCheckBox(f"Профилировать ({'pyinstrument' if pyinstrument else 'cProfile'})")
+        self.profile_box.toggled.connect(self.set_profiling)
+        export_button = QPushButton("Экспорт Chrome trace")
+        export_button.clicked.connect(self.export_trace)
+        clear_button = QPushButton("Очистить")
+        clear_button.clicked.connect(self.clear)
+        for widget in (self.trace_box, self.profile_box, export_button, clear_button):
+            controls.addWidget(widget)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        self.counters_label = QLabel("")
+        self.counters_label.setWordWrap(True)
+        layout.addWidget(self.counters_label)
+        self.status_label = QLabel("")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_MS)
+
+    def set_tracing(self, enabled):
+        tracer.enable(enabled)
+        self.refresh()
+
+    def set_profiling(self, enabled):
+        if enabled:
+            tracer.start_profile()
+            self.status_label.setText("Профилировщик запущен (GUI-поток).")
+        else:
+            path = os.path.abspath(PROFILE_PATH)
+            tracer.stop_profile(path)
+            self.status_label.setText(f"Отчёт профилировщика: {path}")
+
+    def export_trace(self):
+        path = tracer.export_chrome_trace(os.path.abspath(TRACE_PATH))
+        self.status_label.setText(f"Трасса сохранена в {path} (открыть в chrome://tracing или Perfetto)")
+
+    def clear(self):
+        tracer.clear()
+        self.refresh()
+
+    def refresh(self):
+        if not self.isVisible() or not tracer.enabled:
+            return
+        summary = tracer.summary()
+        self.table.setRowCount(len(summary))
+        for row, (name, stats) in enumerate(summary.items()):
+            values = [name, str(stats["count"])] + [f"{stats[key]:.2f}" for key in ("p50", "p95", "p99", "max")]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+        counters = [f"{name}: {value}" for name, value in sorted(tracer.counters.items())]
+        if self.stall_monitor is not None and self.stall_monitor.history:
+            name, worst = self.stall_monitor.history[-1]
+            counters.append(f"последняя задержка GUI: {worst:.0f} мс ({name})")
+        counters.append(f"интервалов в буфере: {len(tracer.spans)} из {tracer.spans.maxlen}")
+        self.counters_label.setText("Счётчики: " + ", ".join(counters))
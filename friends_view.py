@@ -0,0 +1,205 @@
+"""Список друзей для вкладки «Друзья»: модель, делегат и кэш аватарок.
+
+QListView рисует только видимые строки, поэтому тысячи друзей не создают
+тысячи виджетов. Аватарки декодируются и уменьшаются в QThreadPool; готовые
+миниатюры хранятся в памяти (LRU) и на диске, где ключ включает mtime
+исходного файла, так что заменённая картинка пересчитывается сама.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+from PySide6.QtCore import (
+    QAbstractListModel, QEvent, QModelIndex, QObject, QRect, QRunnable, QSize, Qt, QThreadPool, Signal
+)
+from PySide6.QtGui import QColor, QImage, QPixmap
+from PySide6.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+AVATAR_DIR = "avatars"
+AVATAR_CACHE_DIR = os.path.join(".cache", "avatars")
+AVATAR_SIZE = 50
+AVATAR_CACHE_SIZE = 500  # миниатюр в памяти
+
+ROW_HEIGHT = 70
+BUTTON_WIDTH = 150
+PADDING = 10
+
+ProgressRole = Qt.UserRole + 1
+AchievementsRole = Qt.UserRole + 2
+
+
+def avatar_path(friend):
+    return os.path.join(AVATAR_DIR, f"{friend}.png")
+
+
+class _AvatarSignals(QObject):
+    # QRunnable не QObject: результат из пула передаётся через отдельный объект
+    loaded = Signal(str, QImage)
+
+
+class _AvatarTask(QRunnable):
+    """Чтение и уменьшение одной аватарки вне GUI-потока.
+
+    Работает с QImage: в отличие от QPixmap он безопасен вне главного потока.
+    """
+
+    def __init__(self, path, cache_path, size, signals):
+        super().__init__()
+        self.path = path
+        self.cache_path = cache_path
+        self.size = size
+        self.signals = signals
+
+    def run(self):
+        image = QImage(self.cache_path) if self.cache_path and os.path.exists(self.cache_path) else QImage()
+        if image.isNull():
+            image = QImage(self.path)
+            if not image.isNull():
+                image = image.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                if self.cache_path:
+                    os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                    # Запись во временный файл: соседняя задача не прочитает его наполовину
+                    temp_path = f"{self.cache_path}.{id(self)}.tmp"
+                    if image.save(temp_path, "PNG"):
+                        os.replace(temp_path, self.cache_path)
+        self.signals.loaded.emit(self.path, image)
+
+
+class AvatarCache(QObject):
+    """Миниатюры аватарок: LRU в памяти поверх кэша на диске и фоновой загрузки."""
+
+    avatarReady = Signal(str)
+
+    def __init__(self, size=AVATAR_SIZE, capacity=AVATAR_CACHE_SIZE, cache_dir=AVATAR_CACHE_DIR, pool=None, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.pool = pool or QThreadPool.globalInstance()
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.missing = set()
+        self.signals = _AvatarSignals()
+        # Сигнал из потока пула доставляется в GUI-поток очередью событий
+        self.signals.loaded.connect(self._on_loaded, Qt.QueuedConnection)
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(QColor("#d3d3d3"))
+
+    def _cache_path(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}:{self.size}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, path):
+        """Миниатюра, если готова; иначе ставит загрузку в очередь и возвращает заглушку."""
+        pixmap = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+            return pixmap
+        if path not in self.pending and path not in self.missing:
+            self.pending.add(path)
+            self.pool.start(_AvatarTask(path, self._cache_path(path), self.size, self.signals))
+        return self.placeholder
+
+    def _on_loaded(self, path, image):
+        self.pending.discard(path)
+        if image.isNull():
+            self.missing.add(path)  # Файла нет или он не читается — не пытаемся снова
+            return
+        self.pixmaps[path] = QPixmap.fromImage(image)
+        if len(self.pixmaps) > self.capacity:
+            self.pixmaps.popitem(last=False)
+        self.avatarReady.emit(path)
+
+
+class FriendsModel(QAbstractListModel):
+    """Друзья из журнала посещений ядра; строки вычисляются только при отрисовке."""
+
+    def __init__(self, core, avatars, parent=None):
+        super().__init__(parent)
+        self.core = core
+        self.avatars = avatars
+        self.rows = {}
+        self.refresh()
+        avatars.avatarReady.connect(self._on_avatar_ready)
+
+    def refresh(self):
+        """Перечитывает список друзей после изменений в ядре."""
+        self.beginResetModel()
+        self.names = self.core.friends
+        self.rows = {avatar_path(name): row for row, name in enumerate(self.names)}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        friend = self.names[index.row()]
+        if role == Qt.DisplayRole:
+            return friend
+        if role == Qt.DecorationRole:
+            return self.avatars.get(avatar_path(friend))
+        if role == ProgressRole:
+            return f"Прогресс - {self.core.visits.count(friend)} мест из {self.core.total_places}, #{self.core.rank(friend)} в рейтинге"
+        if role == AchievementsRole:
+            achievements = self.core.achievements.unlocked_titles(friend)
+            return f"Достижения: {', '.join(achievements) if achievements else 'Нет'}"
+        return None
+
+    def _on_avatar_ready(self, path):
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class FriendDelegate(QStyledItemDelegate):
+    """Рисует строку друга: аватар, имя с прогрессом, достижения и кнопку «Посмотреть места»."""
+
+    viewPlacesClicked = Signal(str)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), ROW_HEIGHT)
+
+    def _button_rect(self, rect):
+        return QRect(rect.right() - BUTTON_WIDTH - PADDING, rect.top() + PADDING, BUTTON_WIDTH, rect.height() - 2 * PADDING)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        style = option.widget.style() if option.widget else QApplication.style()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+
+        rect = option.rect
+        avatar = index.data(Qt.DecorationRole)
+        top = rect.top() + (rect.height() - AVATAR_SIZE) // 2
+        painter.drawPixmap(QRect(rect.left() + PADDING, top, AVATAR_SIZE, AVATAR_SIZE), avatar)
+
+        button_rect = self._button_rect(rect)
+        text_left = rect.left() + 2 * PADDING + AVATAR_SIZE
+        text_rect = QRect(text_left, rect.top() + PADDING, button_rect.left() - text_left - PADDING, rect.height() - 2 * PADDING)
+        painter.setPen(option.palette.text().color())
+        metrics = painter.fontMetrics()
+        title = f"{index.data(Qt.DisplayRole)}: {index.data(ProgressRole)}"
+        achievements = index.data(AchievementsRole)
+        painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignTop, metrics.elidedText(title, Qt.ElideRight, text_rect.width()))
+        painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignBottom, metrics.elidedText(achievements, Qt.ElideRight, text_rect.width()))
+
+        button = QStyleOptionButton()
+        button.rect = button_rect
+        button.text = "Посмотреть места"
+        button.state = QStyle.State_Enabled
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # Кнопка только нарисована, поэтому клик по ней ловится здесь
+        if event.type() == QEvent.MouseButtonRelease and self._button_rect(option.rect).contains(event.position().toPoint()):
+            self.viewPlacesClicked.emit(index.data(Qt.DisplayRole))
+            return True
+        return super().editorEvent(event, model, option, index)
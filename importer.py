@@ -0,0 +1,345 @@
+"""Потоковый импорт каталогов мест (CSV, GeoJSON, OSM XML/PBF) в таблицу locations.
+
+    python importer.py places.csv regions.geojson moscow.osm.pbf --db locations.db
+
+Файлы читаются генераторами и не загружаются в память целиком. Точки
+нормализуются, дубликаты (то же имя в радиусе DEDUP_RADIUS_M) отбрасываются,
+строки пишутся пачками executemany в больших транзакциях в режиме WAL.
+Прогресс сохраняется в той же транзакции, поэтому прерванный импорт
+продолжается с места остановки.
+
+Вставка в R*Tree стоит ~20 мкс на строку и съедала бо́льшую часть времени,
+поэтому на время импорта триггеры индексации (R*Tree и поиска) снимаются, а
+новые строки добавляются в индексы одним запросом в конце (LocationStore
+делает то же при открытии базы, если импорт был прерван).
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from location_store import DB_PATH, SEARCH_TABLES, LocationStore, haversine_km
+
+try:
+    import osmium
+except ImportError:  # pyosmium нужен только для .osm.pbf
+    osmium = None
+
+BATCH_SIZE = 50_000
+DEDUP_RADIUS_M = 50
+METERS_PER_DEGREE = 111_320
+DEFAULT_RATING = 0.0
+
+NAME_FIELDS = ("name", "title", "название")
+DESCRIPTION_FIELDS = ("description", "desc", "описание")
+LAT_FIELDS = ("latitude", "lat", "y")
+LON_FIELDS = ("longitude", "lon", "lng", "x")
+RATING_FIELDS = ("rating", "stars", "рейтинг")
+
+PROGRESS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_progress (
+    source TEXT PRIMARY KEY,
+    records INTEGER NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _pick(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def read_csv(path):
+    """Записи CSV как словари; имена колонок приводятся к нижнему регистру."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            yield {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def _feature_record(feature):
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") != "Point":
+        return None
+    lon, lat = geometry["coordinates"][:2]
+    record = {key.lower(): value for key, value in (feature.get("properties") or {}).items()}
+    record["latitude"], record["longitude"] = lat, lon
+    return record
+
+
+def read_features(path, chunk_size=1 << 20):
+    """Объекты Feature из GeoJSON FeatureCollection (или по объекту на строку, GeoJSONSeq).
+
+    Массив features разбирается по одному объекту через raw_decode, так что в
+    памяти одновременно находится лишь кусок файла.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        match = re.search(r'"features"\s*:\s*\[', buffer)
+        if match is None:
+            # GeoJSONSeq: по одному Feature на строку
+            f.seek(0)
+            for line in f:
+                line = line.strip().lstrip("\x1e")
+                if line:
+                    yield json.loads(line)
+            return
+        position = match.end()
+        while True:
+            while True:
+                stripped = buffer[position:].lstrip(" \t\r\n,")
+                position = len(buffer) - len(stripped)
+                if stripped:
+                    break
+                more = f.read(chunk_size)
+                if not more:
+                    return
+                buffer, position = more, 0
+            if buffer[position] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield feature
+            position = end
+            if position > chunk_size:
+                buffer, position = buffer[position:], 0
+
+
+def read_geojson(path):
+    """Точки GeoJSON как записи для normalize."""
+    for feature in read_features(path):
+        record = _feature_record(feature)
+        if record is not None:
+            yield record
+
+
+def read_osm_xml(path):
+    """Именованные узлы OSM XML; обработанные элементы сразу освобождаются."""
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if tags.get("name"):
+                yield {
+                    "name": tags.get("name:ru") or tags["name"],
+                    "description": tags.get("description") or _osm_kind(tags),
+                    "latitude": element.get("lat"),
+                    "longitude": element.get("lon"),
+                    "rating": tags.get("stars"),
+                }
+        if element.tag in ("node", "way", "relation"):
+            element.clear()
+
+
+def read_osm_pbf(path):
+    """Именованные узлы OSM PBF через pyosmium."""
+    if osmium is None:
+        raise RuntimeError("Для .osm.pbf нужен пакет osmium (pip install osmium)")
+    for node in osmium.FileProcessor(path, osmium.osm.NODE):
+        tags = dict(node.tags)
+        if tags.get("name") and node.location.valid():
+            yield {
+                "name": tags.get("name:ru") or tags["name"],
+                "description": tags.get("description") or _osm_kind(tags),
+                "latitude": node.location.lat,
+                "longitude": node.location.lon,
+                "rating": tags.get("stars"),
+            }
+
+
+def _osm_kind(tags):
+    for key in ("tourism", "historic", "amenity", "leisure", "shop"):
+        if key in tags:
+            return f"{key}={tags[key]}"
+    return ""
+
+
+def open_source(path):
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        return read_csv(path)
+    if lower.endswith((".geojson", ".geojsonl", ".geojsons", ".json")):
+        return read_geojson(path)
+    if lower.endswith(".osm.pbf") or lower.endswith(".pbf"):
+        return read_osm_pbf(path)
+    if lower.endswith(".osm") or lower.endswith(".xml"):
+        return read_osm_xml(path)
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def normalize(record):
+    """Приводит запись к кортежу (name, description, lat, lon, rating) или None."""
+    name = _pick(record, NAME_FIELDS)
+    lat, lon = _pick(record, LAT_FIELDS), _pick(record, LON_FIELDS)
+    if name is None or lat is None or lon is None:
+        return None
+    try:
+        lat, lon = round(float(lat), 6), round(float(lon), 6)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    name = " ".join(str(name).split())
+    if not name:
+        return None
+    description = " ".join(str(_pick(record, DESCRIPTION_FIELDS) or "").split())
+    try:
+        rating = min(5.0, max(0.0, float(_pick(record, RATING_FIELDS))))
+    except (TypeError, ValueError):
+        rating = DEFAULT_RATING
+    return name, description, lat, lon, rating
+
+
+def dedup_key(name):
+    return name.casefold().replace("ё", "е")
+
+
+class Deduplicator:
+    """Отсекает места с тем же именем в радиусе radius_m.
+
+    Места раскладываются по ячейкам сетки: по широте — полосы высотой
+    radius_m, по долготе — ячейки с постоянным для полосы масштабом (по её
+    краю ближе к полюсу, где градус долготы короче всего), так что ячейка
+    не уже radius_m ни в одной точке полосы. Новое место сравнивается по
+    настоящему расстоянию со всеми местами с тем же именем в ячейках, которые
+    задевает круг радиуса radius_m вокруг него.
+    """
+
+    def __init__(self, radius_m=DEDUP_RADIUS_M):
+        self.radius_km = radius_m / 1000
+        self.cell_deg = radius_m / METERS_PER_DEGREE
+        self.seen = {}  # (полоса, ячейка, имя) -> [(lat, lon), ...]
+        self._scales = {}  # полоса -> доля градуса долготы в ячейке
+
+    def _scale(self, band):
+        scale = self._scales.get(band)
+        if scale is None:
+            edge = min(max(abs(band), abs(band + 1)) * self.cell_deg, 90.0)
+            scale = self._scales[band] = max(math.cos(math.radians(edge)), 0.01) / self.cell_deg
+        return scale
+
+    def add(self, name, lat, lon):
+        """True, если место новое (и запоминает его), False для дубликата."""
+        key = dedup_key(name)
+        band = math.floor(lat / self.cell_deg)
+        # Полуширина круга по долготе — по самому далёкому от экватора краю соседних полос
+        reach = 1 / self._scale(band + 1 if lat >= 0 else band - 1)
+        for row in (band - 1, band, band + 1):
+            scale = self._scale(row)
+            for column in range(math.floor((lon - reach) * scale), math.floor((lon + reach) * scale) + 1):
+                for other_lat, other_lon in self.seen.get((row, column, key), ()):
+                    if haversine_km(lat, lon, other_lat, other_lon) <= self.radius_km:
+                        return False
+        self.seen.setdefault((band, math.floor(lon * self._scale(band)), key), []).append((lat, lon))
+        return True
+
+
+class Importer:
+    def __init__(self, db_path=DB_PATH, batch_size=BATCH_SIZE, radius_m=DEDUP_RADIUS_M, log=sys.stderr):
+        # LocationStore создаёт таблицу, R*Tree и триггеры, если базы ещё нет
+        self.db_path = db_path
+        LocationStore(db_path).close()
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(PROGRESS_SCHEMA)
+        for table in ("locations_rtree",) + SEARCH_TABLES:
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {table}_insert")
+        self.batch_size = batch_size
+        self.log = log
+        self.dedup = Deduplicator(radius_m)
+        # Уже загруженные места тоже участвуют в дедупликации — это и делает докачку безопасной
+        for name, lat, lon in self.conn.execute("SELECT name, latitude, longitude FROM locations"):
+            self.dedup.add(name, lat, lon)
+
+    def close(self):
+        self.conn.close()
+        # Повторное открытие восстанавливает триггеры и дописывает новые строки в R*Tree и поиск
+        start = time.perf_counter()
+        LocationStore(self.db_path).close()
+        print(f"Пространственный и поисковый индексы обновлены за {time.perf_counter() - start:.1f} с", file=self.log)
+
+    def _source_id(self, path):
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def import_file(self, path):
+        """Импортирует файл; возвращает (прочитано записей, добавлено мест)."""
+        source = self._source_id(path)
+        done = self.conn.execute(
+            "SELECT records, finished FROM import_progress WHERE source = ?", (source,)
+        ).fetchone()
+        skip, finished = done or (0, 0)
+        if finished:
+            print(f"{path}: уже импортирован", file=self.log)
+            return 0, 0
+
+        records = skip
+        inserted = 0
+        batch = []
+        start = time.perf_counter()
+        for index, record in enumerate(open_source(path)):
+            if index < skip:
+                continue  # Досрочно прерванный импорт: эти записи уже в базе
+            records += 1
+            row = normalize(record)
+            if row is not None and self.dedup.add(row[0], row[2], row[3]):
+                batch.append(row)
+            if len(batch) >= self.batch_size:
+                inserted += self._flush(source, batch, records)
+                batch = []
+                rate = (records - skip) / (time.perf_counter() - start)
+                print(f"{path}: {records} записей, добавлено {inserted}, {rate:.0f} строк/с", file=self.log)
+        inserted += self._flush(source, batch, records, finished=True)
+        elapsed = time.perf_counter() - start
+        rate = (records - skip) / elapsed if elapsed else 0.0
+        print(f"{path}: готово, {records} записей, добавлено {inserted}, {rate:.0f} строк/с", file=self.log)
+        return records, inserted
+
+    def _flush(self, source, batch, records, finished=False):
+        # Строки и позиция в файле фиксируются одной транзакцией
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO locations (name, description, latitude, longitude, rating) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO import_progress (source, records, finished) VALUES (?, ?, ?)",
+                (source, records, int(finished)),
+            )
+        return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт мест в locations.db.")
+    parser.add_argument("files", nargs="+", help="файлы .csv, .geojson, .osm, .osm.pbf")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="строк в одной транзакции")
+    parser.add_argument("--radius", type=float, default=DEDUP_RADIUS_M, help="радиус дедупликации, м")
+    args = parser.parse_args()
+
+    importer = Importer(args.db, args.batch, args.radius)
+    try:
+        for path in args.files:
+            importer.import_file(path)
+    finally:
+        importer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Замеры горячих путей: интервалы (spans) в кольцевом буфере, счётчики, профилировщик.
+
+    with tracer.span("map.render"):
+        ...
+
+    @traced("db.get_many")
+    def get_many(...): ...
+
+По умолчанию всё выключено: span() возвращает один общий пустой контекст,
+а traced-функция лишь проверяет флаг, поэтому цена замера — один вызов.
+Включается из кода (tracer.enable()), из панели отладки или переменной
+окружения TRAVEL_TRACE=1. Сводка по интервалу — число, p50/p95/p99 и максимум
+по последним записям буфера; export_chrome_trace() пишет JSON, который
+открывается в chrome://tracing и Perfetto. Профилировщик — cProfile или,
+если установлен, pyinstrument.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from functools import wraps
+
+import numpy as np
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument необязателен: без него профилирует cProfile
+    pyinstrument = None
+
+RING_SIZE = 50_000  # интервалов в буфере
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start)
+        return False
+
+
+class Tracer:
+    """Кольцевой буфер интервалов (имя, начало, длительность, поток) и именованные счётчики."""
+
+    def __init__(self, capacity=RING_SIZE, enabled=False):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity)
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._profiler = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    @staticmethod
+    def now():
+        """Отметка времени для record(): интервал, который нельзя обернуть в with (начало и конец в разных слотах)."""
+        return time.perf_counter_ns()
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def record(self, name, start, end=None):
+        """Записывает интервал от start (perf_counter_ns) до end или до текущего момента."""
+        if not self.enabled:
+            return
+        end = time.perf_counter_ns() if end is None else end
+        # append у deque атомарен, блокировка не нужна
+        self.spans.append((name, start, end - start, threading.get_ident()))
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def summary(self):
+        """Сводка по именам интервалов: count, p50, p95, p99, max и total в миллисекундах."""
+        spans = list(self.spans)
+        durations = {}
+        for name, _, duration, _ in spans:
+            durations.setdefault(name, []).append(duration)
+        result = {}
+        for name, values in sorted(durations.items()):
+            values = np.array(values, dtype=np.float64) / 1e6
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[name] = {
+                "count": len(values),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(values.max()),
+                "total": float(values.sum()),
+            }
+        return result
+
+    def export_chrome_trace(self, path):
+        """Пишет интервалы буфера в формате Chrome trace (события "X") и возвращает путь."""
+        pid = os.getpid()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        spans = list(self.spans)
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": names.get(tid, str(tid))}}
+            for tid in {span[3] for span in spans}
+        ]
+        events.extend(
+            {"name": name, "cat": name.split(".")[0], "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": tid}
+            for name, start, duration, tid in spans
+        )
+        events.extend(
+            {"name": name, "ph": "C", "ts": time.perf_counter_ns() / 1000, "pid": pid, "args": {"value": value}}
+            for name, value in dict(self.counters).items()
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return path
+
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def start_profile(self):
+        """Запускает профилировщик текущего потока (pyinstrument, если установлен, иначе cProfile)."""
+        if self._profiler is not None:
+            return
+        self._profiler = pyinstrument.Profiler() if pyinstrument is not None else cProfile.Profile()
+        if pyinstrument is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop_profile(self, path=None):
+        """Останавливает профилировщик и возвращает текстовый отчёт; path — куда ещё и сохранить его."""
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return ""
+        if pyinstrument is not None:
+            profiler.stop()
+            report = profiler.output_text()
+        else:
+            profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(40)
+            report = stream.getvalue()
+            if path:
+                profiler.dump_stats(f"{path}.prof")
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(report)
+        return report
+
+
+tracer = Tracer(enabled=os.environ.get("TRAVEL_TRACE") == "1")
+
+
+def traced(name):
+    """Декоратор: вызов функции — интервал name, если замеры включены."""
+
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(name, start)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,151 @@
+// lazy_markers.js
+// Подгрузка только видимых маркеров и кластеров с /api/markers при каждом сдвиге карты,
+// а с options.vectorTiles — слой мест из векторных тайлов (vector_tiles.js) вместо них.
+// На масштабах до options.regionZoom вместо них рисуются ячейки со сводками с /api/regions.
+(function () {
+    function clusterIcon(count) {
+        const size = count < 10 ? 30 : count < 100 ? 40 : 50;
+        return L.divIcon({
+            html: "<div><span>" + count + "</span></div>",
+            className: "travel-cluster",
+            iconSize: L.point(size, size),
+        });
+    }
+
+    // Цвет ячейки — доля мест, где уже был пользователь: от красного к зелёному
+    function regionStyle(cell) {
+        const share = cell.places ? cell.visited / cell.places : 0;
+        const hue = Math.round(120 * share);
+        return {
+            color: "hsl(" + hue + ", 70%, 35%)",
+            weight: 1,
+            fillColor: "hsl(" + hue + ", 70%, 50%)",
+            fillOpacity: 0.25 + 0.5 * Math.min(1, Math.log10(1 + cell.visits) / 4),
+        };
+    }
+
+    // Попап места собирается из DOM-узлов: название и описание приходят из импортированных
+    // данных (OSM, GeoJSON), и разметка в них должна остаться текстом
+    function placePopup(name, rating, description, note) {
+        const content = document.createElement("div");
+        const title = document.createElement("b");
+        title.textContent = name || "";
+        content.append(title, document.createElement("br"), "Рейтинг: " + rating + "/5",
+            document.createElement("br"), description || "");
+        if (note) {
+            content.append(document.createElement("br"), note);
+        }
+        return content;
+    }
+
+    window.travelPlacePopup = placePopup;
+
+    function regionPopup(cell) {
+        return `<b>${cell.places} мест</b><br>Средний рейтинг: ${cell.rating}/5<br>` +
+            `Посещено вами: ${cell.visited}<br>Посещений всего: ${cell.visits}`;
+    }
+
+    window.travelLazyMarkers = function (map, options) {
+        options = options || {};
+        const layer = L.layerGroup().addTo(map);
+        const visited = new Set(options.visited || []);
+        const tiles = options.vectorTiles ? travelVectorTiles(options.vectorTiles) : null;
+        let markers = {};
+        let request = 0;
+
+        function markerStyle(id) {
+            const color = visited.has(id) ? "green" : "red";
+            return { radius: 8, color: color, fillColor: color, fillOpacity: 0.8 };
+        }
+
+        function refresh() {
+            const bounds = map.getBounds();
+            const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(",");
+            const current = ++request;
+            const zoom = map.getZoom();
+            if (options.regionZoom !== undefined && zoom <= options.regionZoom) {
+                if (tiles) {
+                    map.removeLayer(tiles);
+                }
+                fetch("/api/regions?bbox=" + bbox + "&zoom=" + zoom)
+                    .then((response) => response.json())
+                    .then((cells) => {
+                        if (current !== request) {
+                            return;
+                        }
+                        layer.clearLayers();
+                        markers = {};
+                        cells.forEach((cell) => {
+                            const b = cell.bounds;
+                            const rectangle = L.rectangle([[b[0], b[1]], [b[2], b[3]]], regionStyle(cell));
+                            rectangle.bindPopup(regionPopup(cell));
+                            layer.addLayer(rectangle);
+                        });
+                    });
+                return;
+            }
+            if (tiles) {
+                // Тайлы слой подгружает сам; ячейки мелкого масштаба больше не нужны
+                layer.clearLayers();
+                markers = {};
+                tiles.addTo(map);
+                return;
+            }
+            fetch("/api/markers?bbox=" + bbox + "&zoom=" + zoom)
+                .then((response) => response.json())
+                .then((items) => {
+                    // Пока шёл запрос, карту успели сдвинуть — ответ устарел
+                    if (current !== request) {
+                        return;
+                    }
+                    layer.clearLayers();
+                    markers = {};
+                    items.forEach((item) => {
+                        if (item.count > 1) {
+                            const cluster = L.marker([item.lat, item.lon], { icon: clusterIcon(item.count) });
+                            cluster.on("click", function () {
+                                map.setView([item.lat, item.lon], Math.min(map.getZoom() + 2, map.getMaxZoom()));
+                            });
+                            layer.addLayer(cluster);
+                            return;
+                        }
+                        const marker = L.circleMarker([item.lat, item.lon], markerStyle(item.id));
+                        marker.bindPopup(placePopup(item.name, item.rating, item.description));
+                        if (options.onClick) {
+                            marker.on("click", function () {
+                                options.onClick(item);
+                            });
+                        }
+                        markers[item.id] = marker;
+                        layer.addLayer(marker);
+                    });
+                });
+        }
+
+        map.on("moveend", refresh);
+        refresh();
+
+        return {
+            refresh: refresh,
+            setVisited: function (ids, flag) {
+                // Сводки по ячейкам считает сервер — перечитываем их
+                if (options.regionZoom !== undefined && map.getZoom() <= options.regionZoom) {
+                    refresh();
+                } else if (tiles) {
+                    // Сервер уже сбросил тайлы с этими местами, остальные ответят 304
+                    tiles.refresh();
+                }
+                ids.forEach((id) => {
+                    if (flag) {
+                        visited.add(id);
+                    } else {
+                        visited.delete(id);
+                    }
+                    if (markers[id]) {
+                        markers[id].setStyle(markerStyle(id));
+                    }
+                });
+            },
+        };
+    };
+})();
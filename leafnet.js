@@ -3,19 +3,14 @@ document.addEventListener("DOMContentLoaded", function () {
     // Initialize map
     const map = L.map("map").setView([55.7558, 37.6173], 12);
 
-    // Add OpenStreetMap tiles
-    L.tileLayer("https://tile.openstreetmap.org/{z}/{x}/{y}.png", {
+    // Add OpenStreetMap tiles through the local tile cache (tile_cache.py)
+    L.tileLayer("/tiles/{z}/{x}/{y}.png", {
         attribution: "&copy; OpenStreetMap contributors",
     }).addTo(map);
     
-    // Add markers to the map
-    locations.forEach(({ lat, lon, name }) => {
-        const marker = L.marker([lat, lon]).addTo(map);
-        marker.bindPopup(name);
-
-        marker.on("click", function () {
-            handlePlaceVisit(name);
-        });
+    // Load only the markers visible in the viewport (see lazy_markers.js)
+    travelLazyMarkers(map, {
+        onClick: ({ name }) => handlePlaceVisit(name),
     });
 
     // Handle place visits and update progress
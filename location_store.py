@@ -0,0 +1,483 @@
+import heapq
+import math
+import re
+import sqlite3
+from collections import namedtuple
+
+from instrumentation import traced
+
+DB_PATH = "locations.db"
+
+EARTH_RADIUS_KM = 6371.0088
+# R*Tree хранит координаты во float32: запросы к нему расширяются на шаг float32
+# (относительный 2**-23), а точная проверка идёт по столбцам locations
+FLOAT32_STEP = 2.0 ** -23
+
+# Поиск: rowid в обоих индексах — (ключ порядка << 32) | id места
+SEARCH_ID_MASK = (1 << 32) - 1
+SEARCH_RATING_STEPS = 50  # рейтинг 0–5 с шагом 0.1
+# Геоиндекс: ключ — Z-порядок (Morton) клетки сетки 2**SEARCH_GEO_DEPTH × 2**SEARCH_GEO_DEPTH,
+# поэтому любая клетка квадродерева — непрерывный диапазон rowid
+SEARCH_GEO_DEPTH = 15
+# Клетка, где совпадений больше, при поиске рядом с точкой делится на четыре
+SEARCH_CELL_LIMIT = 128
+
+# Строка таблицы locations в порядке её колонок
+Location = namedtuple("Location", "id name description latitude longitude rating")
+
+# Места, с которых начиналось приложение; используются для заполнения пустой базы
+DEFAULT_LOCATIONS = [
+    (55.75202, 37.61749, "Московский Кремль", 4.9, "Исторический комплекс и резиденция президента России."),
+    (55.75098, 37.61698, "Успенский собор", 4.8, "Один из главных православных соборов России."),
+    (55.75076, 37.61849, "Царь-колокол", 4.7, "Самый большой колокол в мире, который никогда не звонил."),
+    (55.74968, 37.6136, "Оружейная палата", 4.6, "Хранилище уникальных коллекций оружия и доспехов."),
+    (55.760178, 37.618575, "Большой театр", 4.9, "Один из самых известных театров в мире."),
+    (55.73955, 37.6177, "Площадь Революции", 4.7, "Одна из центральных площадей Москвы, где расположены памятники историческим деятелям."),
+    (55.751244, 37.620577, "Красная площадь", 5.0, "Историческое сердце Москвы, место проведения многих значимых событий."),
+    (55.7557, 37.6176, "Мавзолей Ленина", 4.5, "Мавзолей, в котором покоится тело Владимира Ленина."),
+    (55.746047, 37.616264, "Парк Горького", 4.8, "Известный московский парк для отдыха и культурных мероприятий."),
+    (55.74517, 37.61712, "Воробьёвы горы", 4.9, "Одна из самых высоких точек Москвы с панорамным видом на город."),
+    (55.7644, 37.6155, "Третьяковская галерея", 4.9, "Один из крупнейших музеев искусства в России."),
+    (55.7575, 37.6173, "Храм Василия Блаженного", 5.0, "Известный храм на Красной площади, символ Москвы."),
+    (55.7536, 37.616, "ГУМ", 4.8, "Роскошный торговый центр на Красной площади."),
+    (55.756, 37.603, "Станция метро 'Киевская'", 4.7, "Одно из самых известных московских метро, характерное своими архитектурными особенностями."),
+    (55.7677, 37.6347, "Измайловский Кремль", 4.6, "Культурно-развлекательный комплекс в Москве, напоминающий старинную крепость."),
+    (55.7471, 37.595, "ВДНХ", 4.8, "Выставочный комплекс и музей под открытым небом."),
+    (55.7610, 37.5983, "Поклонная гора", 4.7, "Место исторических памятников и мемориалов."),
+    (55.7701, 37.6215, "Музей космонавтики", 4.9, "Музей, посвященный истории освоения космоса."),
+    (55.7237, 37.6727, "Московский зоопарк", 4.6, "Один из крупнейших зоопарков в России."),
+    (55.7579, 37.6641, "Кремль в Измайлово", 4.7, "Культурный комплекс и туристическая достопримечательность."),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    rating REAL NOT NULL
+);
+
+-- Пространственный индекс: точка хранится как вырожденный прямоугольник
+CREATE VIRTUAL TABLE IF NOT EXISTS locations_rtree USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+);
+
+CREATE TRIGGER IF NOT EXISTS locations_rtree_insert AFTER INSERT ON locations BEGIN
+    INSERT INTO locations_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS locations_rtree_update AFTER UPDATE OF latitude, longitude ON locations BEGIN
+    UPDATE locations_rtree
+    SET min_lat = new.latitude, max_lat = new.latitude, min_lon = new.longitude, max_lon = new.longitude
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS locations_rtree_delete AFTER DELETE ON locations BEGIN
+    DELETE FROM locations_rtree WHERE id = old.id;
+END;
+"""
+
+
+def _spread_bits_sql(value):
+    # Биты числа до 2**16 разносятся через один (0b1011 -> 0b1000101) — как interleave ниже
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+        value = f"(({value} | ({value} << {shift})) & {mask})"
+    return value
+
+
+def _search_rows(row):
+    """Значения строк обоих поисковых индексов для строки locations row (new, old или имя таблицы)."""
+    # ё и е не различаются: индексируется текст с «е», запрос приводится так же (search_query)
+    fold = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+    text = f"{fold.format(f'{row}.name')}, {fold.format(f'{row}.description')}"
+    rating = f"min(max(cast(round({row}.rating * 10) AS INTEGER), 0), {SEARCH_RATING_STEPS})"
+    cells = 1 << SEARCH_GEO_DEPTH
+    x = f"min(max(cast(({row}.longitude + 180) * {cells / 360!r} AS INTEGER), 0), {cells - 1})"
+    y = f"min(max(cast(({row}.latitude + 90) * {cells / 180!r} AS INTEGER), 0), {cells - 1})"
+    morton = f"(({_spread_bits_sql(x)} << 1) | {_spread_bits_sql(y)})"
+    return (
+        f"(({SEARCH_RATING_STEPS} - {rating}) << 32) | {row}.id, {text}",
+        f"({morton} << 32) | {row}.id, {text}",
+    )
+
+
+def _search_schema():
+    statements = []
+    for table, key in (("locations_fts", "rating"), ("locations_geo_fts", "geo")):
+        new, old = (_search_rows(row)[key == "geo"] for row in ("new", "old"))
+        insert = f"INSERT INTO {table} (rowid, name, description) VALUES ({new});"
+        delete = f"INSERT INTO {table} ({table}, rowid, name, description) VALUES ('delete', {old});"
+        statements.append(f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+    name, description, content='', detail=column,
+    tokenize='unicode61 remove_diacritics 0', prefix='1 2 3 4 5 6 7 8'
+);
+
+CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON locations BEGIN
+    {insert}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_update
+AFTER UPDATE OF name, description, latitude, longitude, rating ON locations BEGIN
+    {delete}
+    {insert}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON locations BEGIN
+    {delete}
+END;
+""")
+    return "".join(statements)
+
+
+# Полнотекстовый поиск по названию и описанию: два индекса без копии текста
+# (content=''), отличающиеся порядком rowid. В locations_fts rowid начинается
+# с рейтинга, и совпадения выдаются сразу по его убыванию; в locations_geo_fts —
+# с клетки Z-порядка, и совпадения в любой клетке читаются запросом по диапазону
+# rowid. Индекс префиксов до 8 букв отвечает на «начинается с» без перебора слов.
+SEARCH_SCHEMA = _search_schema()
+SEARCH_TABLES = ("locations_fts", "locations_geo_fts")
+
+COLUMNS = "l.id, l.name, l.description, l.latitude, l.longitude, l.rating"
+
+
+def _rtree_box(south, west, north, east):
+    """Параметры запроса на пересечение с R*Tree: прямоугольник, расширенный на шаг float32."""
+    def pad(value):
+        return abs(value) * FLOAT32_STEP + 1e-38
+
+    return north + pad(north), south - pad(south), east + pad(east), west - pad(west)
+
+
+RTREE_OVERLAP = "r.min_lat <= ? AND r.max_lat >= ? AND r.min_lon <= ? AND r.max_lon >= ?"
+
+
+def cap_boxes(lat, lon, radius_km):
+    """Прямоугольники (south, west, north, east), покрывающие круг радиуса radius_km вокруг точки.
+
+    Полуширина по долготе — точная для круга на сфере: asin(sin(r) / cos(lat)).
+    Круг с полюсом покрывает все долготы, а переходящий через ±180° делится на два.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    south, north = lat - dlat, lat + dlat
+    if south <= -90 or north >= 90 or math.sin(angle) >= math.cos(math.radians(lat)):
+        return [(max(south, -90.0), -180.0, min(north, 90.0), 180.0)]
+    dlon = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    west, east = lon - dlon, lon + dlon
+    if east - west >= 360:
+        return [(south, -180.0, north, 180.0)]
+    if west < -180:
+        return [(south, west + 360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+        return [(south, west, north, 180.0), (south, -180.0, north, east - 360)]
+    return [(south, west, north, east)]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу между двумя точками в километрах."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_to_cell_km(lat, lon, south, west, north, east):
+    """Расстояние от точки до прямоугольника широт и долгот в километрах.
+
+    Если точка в полосе его долгот, ближе всего точка на том же меридиане.
+    Иначе ближайшая точка лежит на меридиане-крае: на отрезке меридиана
+    расстояние растёт в обе стороны от основания перпендикуляра, поэтому
+    берётся основание, прижатое к отрезку (или конец отрезка, если основание
+    за полюсом).
+    """
+    if west <= lon <= east or west <= lon + 360 <= east or west <= lon - 360 <= east:
+        return math.radians(max(south - lat, lat - north, 0.0)) * EARTH_RADIUS_KM
+    distances = []
+    for edge in (west, east):
+        dlon = math.radians(lon - edge)
+        if math.cos(dlon) > 0:
+            foot = math.degrees(math.atan2(math.tan(math.radians(lat)), math.cos(dlon)))
+            distances.append(haversine_km(lat, lon, min(max(foot, south), north), edge))
+        else:
+            distances.extend(haversine_km(lat, lon, corner, edge) for corner in (south, north))
+    return min(distances)
+
+
+def interleave(x, y):
+    """Z-порядок клетки: биты x и y через один, x старше (как в геоиндексе поиска)."""
+    code = 0
+    for bit in range(SEARCH_GEO_DEPTH):
+        code |= ((x >> bit) & 1) << (2 * bit + 1) | ((y >> bit) & 1) << (2 * bit)
+    return code
+
+
+def search_query(text):
+    """Запрос FTS5 по тексту из строки поиска или None, если в нём нет слов.
+
+    Каждое слово ищется как начало слова в названии или описании, регистр и
+    ё/е не различаются: «елк» найдёт «Ёлочка».
+    """
+    words = re.findall(r"[^\W_]+", text.casefold().replace("ё", "е"))
+    if not words:
+        return None
+    return "{name description} : (" + " ".join(f'"{word}"*' for word in words) + ")"
+
+
+class LocationStore:
+    """Доступ к таблице locations в locations.db с R*Tree-индексом по координатам."""
+
+    def __init__(self, path=DB_PATH, check_same_thread=True):
+        self.path = path
+        # check_same_thread=False — для пулов, где хранилище переходит между потоками по очереди
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.executescript(SCHEMA)
+        self.conn.executescript(SEARCH_SCHEMA)
+        self._sync_index()
+        self._sync_search()
+        self._cache = None
+
+    def _sync_index(self):
+        # Индекс мог отсутствовать у базы, созданной до его появления, или отстать
+        # после пакетного импорта, который пишет строки без триггера (см. importer.py)
+        indexed, max_indexed = self.conn.execute(
+            "SELECT count(*), coalesce(max(id), 0) FROM locations_rtree"
+        ).fetchone()
+        (total,) = self.conn.execute("SELECT count(*) FROM locations").fetchone()
+        if indexed == total:
+            return
+        (tail,) = self.conn.execute("SELECT count(*) FROM locations WHERE id > ?", (max_indexed,)).fetchone()
+        with self.conn:
+            if indexed + tail == total:
+                self.conn.execute(
+                    "INSERT INTO locations_rtree "
+                    "SELECT id, latitude, latitude, longitude, longitude FROM locations WHERE id > ?",
+                    (max_indexed,),
+                )
+            else:
+                self.conn.execute("DELETE FROM locations_rtree")
+                self.conn.execute(
+                    "INSERT INTO locations_rtree "
+                    "SELECT id, latitude, latitude, longitude, longitude FROM locations"
+                )
+
+    def _sync_search(self):
+        # То же для поисковых индексов: импорт пишет строки без их триггеров
+        (total,) = self.conn.execute("SELECT count(*) FROM locations").fetchone()
+        for table, values in zip(SEARCH_TABLES, _search_rows("locations")):
+            (indexed,) = self.conn.execute(f"SELECT count(*) FROM {table}_docsize").fetchone()
+            if indexed == total:
+                continue
+            (last,) = self.conn.execute(
+                f"SELECT coalesce(max(id & {SEARCH_ID_MASK}), 0) FROM {table}_docsize"
+            ).fetchone()
+            (tail,) = self.conn.execute("SELECT count(*) FROM locations WHERE id > ?", (last,)).fetchone()
+            with self.conn:
+                if indexed + tail != total:
+                    self.conn.execute(f"INSERT INTO {table} ({table}) VALUES ('delete-all')")
+                    last = 0
+                self.conn.execute(
+                    f"INSERT INTO {table} (rowid, name, description) SELECT {values} FROM locations WHERE id > ?",
+                    (last,),
+                )
+
+    def close(self):
+        self.conn.close()
+
+    def seed_defaults(self):
+        """Заполняет пустую базу встроенным набором мест."""
+        if self.count() == 0:
+            self.replace_all(DEFAULT_LOCATIONS)
+
+    @traced("db.replace_all")
+    def replace_all(self, locations):
+        """Заменяет все места; id присваиваются заново с 1 в порядке списка.
+
+        locations — кортежи (lat, lon, name, rating, description), как в DEFAULT_LOCATIONS.
+        Возвращает {старый id: новый id} для мест, оставшихся в наборе (то же
+        название и те же координаты), чтобы переписать ссылки на них (VisitLog.remap_places).
+        """
+        old = {}
+        for place_id, name, lat, lon in self.conn.execute("SELECT id, name, latitude, longitude FROM locations ORDER BY id"):
+            old.setdefault((name, lat, lon), []).append(place_id)
+        mapping = {}
+        for place_id, (lat, lon, name, _, _) in enumerate(locations, start=1):
+            same = old.get((name, lat, lon))
+            if same:
+                mapping[same.pop(0)] = place_id
+        with self.conn:
+            self.conn.execute("DELETE FROM locations")
+            self.conn.execute("DELETE FROM sqlite_sequence WHERE name = 'locations'")
+            self.conn.executemany(
+                "INSERT INTO locations (id, name, description, latitude, longitude, rating) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (place_id, name, description, lat, lon, rating)
+                    for place_id, (lat, lon, name, rating, description) in enumerate(locations, start=1)
+                ],
+            )
+        self._cache = None
+        return mapping
+
+    def add(self, name, description, latitude, longitude, rating):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO locations (name, description, latitude, longitude, rating) VALUES (?, ?, ?, ?, ?)",
+                (name, description, latitude, longitude, rating),
+            )
+        self._cache = None
+        return cursor.lastrowid
+
+    @traced("db.count")
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM locations").fetchone()[0]
+
+    @traced("db.all")
+    def all(self):
+        """Все места по возрастанию id (кэшируется до следующего изменения)."""
+        if self._cache is None:
+            rows = self.conn.execute(f"SELECT {COLUMNS} FROM locations l ORDER BY l.id")
+            self._cache = [Location(*row) for row in rows]
+        return self._cache
+
+    @traced("db.get")
+    def get(self, place_id):
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM locations l WHERE l.id = ?", (place_id,)).fetchone()
+        return Location(*row) if row else None
+
+    @traced("db.get_many")
+    def get_many(self, place_ids):
+        """Места по набору id одним запросом, в порядке возрастания id."""
+        ids = sorted(place_ids)
+        if not ids:
+            return []
+        rows = self.conn.execute(
+            f"SELECT {COLUMNS} FROM locations l WHERE l.id IN ({','.join('?' * len(ids))}) ORDER BY l.id",
+            ids,
+        )
+        return [Location(*row) for row in rows]
+
+    @traced("db.in_bounds")
+    def in_bounds(self, south, west, north, east, limit=None):
+        """Места внутри прямоугольника видимой области карты (границы включаются)."""
+        sql = (
+            f"SELECT {COLUMNS} FROM locations_rtree r JOIN locations l ON l.id = r.id "
+            f"WHERE {RTREE_OVERLAP} AND l.latitude BETWEEN ? AND ? AND l.longitude BETWEEN ? AND ?"
+        )
+        params = [*_rtree_box(south, west, north, east), south, north, west, east]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Location(*row) for row in self.conn.execute(sql, params)]
+
+    @traced("db.search")
+    def search(self, text, limit=20, offset=0):
+        """Места, подходящие под строку поиска (см. search_query).
+
+        Порядок — по убыванию рейтинга (с шагом 0.1), при равном рейтинге по id.
+        """
+        query = search_query(text)
+        if query is None:
+            return []
+        rows = self.conn.execute(
+            f"SELECT {COLUMNS} FROM locations_fts f CROSS JOIN locations l ON l.id = f.rowid & {SEARCH_ID_MASK} "
+            "WHERE locations_fts MATCH ? ORDER BY f.rowid LIMIT ? OFFSET ?",
+            (query, limit, offset),
+        )
+        return [Location(*row) for row in rows]
+
+    def _search_cell(self, query, depth=0, x=0, y=0, limit=None):
+        # id мест с совпадениями в клетке (x, y) квадродерева глубины depth; не больше limit
+        shift = 2 * (SEARCH_GEO_DEPTH - depth)
+        first = interleave(x, y) << shift
+        rows = self.conn.execute(
+            "SELECT rowid FROM locations_geo_fts WHERE locations_geo_fts MATCH ? AND rowid >= ? AND rowid < ? LIMIT ?",
+            (query, first << 32, (first + (1 << shift)) << 32, -1 if limit is None else limit),
+        )
+        return [rowid & SEARCH_ID_MASK for (rowid,) in rows]
+
+    @traced("db.search_near")
+    def search_near(self, text, lat, lon, limit=20, offset=0):
+        """Места, подходящие под строку поиска, по возрастанию расстояния от точки.
+
+        Возвращает пары (Location, расстояние в км). Клетки квадродерева
+        обходятся в порядке удаления от точки (как окно в nearest, только по
+        поисковому индексу): клетка с небольшим числом совпадений читается
+        целиком, плотная делится на четыре. Место выдаётся, когда ближе него
+        не осталось непрочитанных клеток, поэтому порядок точен, а читается
+        лишь окрестность точки.
+        """
+        query = search_query(text)
+        if query is None:
+            return []
+        needed = offset + limit
+        # Куча из (оценка расстояния снизу, номер, место или клетка (глубина, x, y))
+        heap = [(0.0, 0, None, (0, 0, 0))]
+        counter = 0
+        found = []
+        while heap and len(found) < needed:
+            distance, _, location, cell = heapq.heappop(heap)
+            if location is not None:
+                found.append((location, distance))
+                continue
+            depth, x, y = cell
+            finest = depth == SEARCH_GEO_DEPTH
+            place_ids = self._search_cell(query, depth, x, y, None if finest else SEARCH_CELL_LIMIT + 1)
+            if len(place_ids) <= SEARCH_CELL_LIMIT or finest:
+                for location in self.get_many(place_ids):
+                    counter += 1
+                    heapq.heappush(heap, (
+                        haversine_km(lat, lon, location.latitude, location.longitude), counter, location, None
+                    ))
+                continue
+            width, height = 360.0 / (2 << depth), 180.0 / (2 << depth)
+            for child_x in (2 * x, 2 * x + 1):
+                for child_y in (2 * y, 2 * y + 1):
+                    west, south = child_x * width - 180, child_y * height - 90
+                    bound = distance_to_cell_km(lat, lon, south, west, south + height, west + width)
+                    counter += 1
+                    heapq.heappush(heap, (bound, counter, None, (depth + 1, child_x, child_y)))
+        return found[offset:needed]
+
+    def _ids_in_box(self, lat, lon, radius_km):
+        # Кандидаты — по R*Tree, координаты для расстояний — точные из locations
+        rows = []
+        for box in cap_boxes(lat, lon, radius_km):
+            rows += self.conn.execute(
+                f"SELECT l.id, l.latitude, l.longitude FROM locations_rtree r JOIN locations l ON l.id = r.id "
+                f"WHERE {RTREE_OVERLAP}",
+                _rtree_box(*box),
+            ).fetchall()
+        return rows
+
+    @traced("db.nearest")
+    def nearest(self, lat, lon, n=10, radius_km=1.0):
+        """n ближайших мест к точке; возвращает пары (Location, расстояние в км).
+
+        Окно поиска в R*Tree удваивается, пока в нём не наберётся n мест, после чего
+        выполняется повторный запрос по радиусу n-го кандидата — так результат точен,
+        а просматривается лишь окрестность точки.
+        """
+        if n <= 0:
+            return []
+        candidates = self._ids_in_box(lat, lon, radius_km)
+        # Круг радиуса в полокружности покрывает всю сферу: дальше окно не растёт
+        while len(candidates) < n and radius_km < math.pi * EARTH_RADIUS_KM:
+            radius_km *= 2
+            candidates = self._ids_in_box(lat, lon, radius_km)
+        distances = sorted((haversine_km(lat, lon, c_lat, c_lon), place_id) for place_id, c_lat, c_lon in candidates)
+        n = min(n, len(distances))
+        if distances and distances[n - 1][0] > radius_km:
+            # Углы прямоугольника могли пропустить места ближе n-го кандидата
+            distances = sorted(
+                (haversine_km(lat, lon, c_lat, c_lon), place_id)
+                for place_id, c_lat, c_lon in self._ids_in_box(lat, lon, distances[n - 1][0])
+            )
+        top = distances[:n]
+        if not top:
+            return []
+        by_id = {location.id: location for location in self.get_many(place_id for _, place_id in top)}
+        return [(by_id[place_id], distance) for distance, place_id in top]
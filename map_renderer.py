@@ -0,0 +1,191 @@
+"""Сборка map.html из одного заранее подготовленного шаблона.
+
+Вместо дерева объектов folium (Marker + Icon + Popup на каждое место, каждый со
+своим Jinja-рендером и случайным id) все места сериализуются одним компактным
+JSON в колоночном виде, а маркеры создаёт JS-код шаблона map_template.html.
+
+Страница детерминирована: одни и те же места, посещения и тема дают те же
+байты. Поэтому у страницы есть ключ — хэш этих входных данных (page_key), —
+по которому готовый HTML хранится в PageCache, а сервер отдаёт его по
+неизменному адресу /map-<ключ>.html. Файл на диске переписывается атомарно.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import tracer
+from map_server import STATIC_ROOT
+from regions import REGION_MAX_ZOOM
+from tile_cache import localize_assets
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_template.html")
+DEFAULT_CENTER = (55.7558, 37.6173)
+DEFAULT_ZOOM = 12
+TILES_URL = "tiles/{z}/{x}/{y}.png"
+VECTOR_TILES_URL = "vtiles/{z}/{x}/{y}.pbf"
+# Координаты уходят целыми микроградусами (точность ~10 см), рейтинг — десятыми:
+# целые кодируются в JSON втрое быстрее float и занимают меньше места
+COORD_SCALE = 1_000_000
+RATING_SCALE = 10
+ATTRIBUTION = "&copy; OpenStreetMap contributors"
+
+PAGE_CACHE_SIZE = 8  # страниц в памяти
+THEMES = ("light", "dark")
+
+LEAFLET_JS = ("leaflet", "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js")
+LEAFLET_CSS = ("leaflet_css", "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css")
+
+_template = None
+
+
+class _LeafletAssets:
+    # Те же имена, что у folium, чтобы localize_assets нашёл копии в vendor/
+    default_js = [LEAFLET_JS]
+    default_css = [LEAFLET_CSS]
+
+
+def _load_template():
+    global _template
+    if _template is None:
+        assets = localize_assets(_LeafletAssets(), STATIC_ROOT)
+        with open(TEMPLATE_PATH, encoding="utf-8") as f:
+            _template = (
+                f.read()
+                .replace("__LEAFLET_JS__", assets.default_js[0][1])
+                .replace("__LEAFLET_CSS__", assets.default_css[0][1])
+            )
+    return _template
+
+
+def _fixed(values, scale):
+    return np.rint(np.asarray(values, dtype=np.float64) * scale).astype(np.int64).tolist()
+
+
+def map_payload(locations, visited, center=DEFAULT_CENTER, zoom=DEFAULT_ZOOM, lazy=False, theme="light"):
+    """Данные страницы: места по колонкам, а не списком объектов — так JSON вдвое короче."""
+    if theme not in THEMES:
+        raise ValueError(f"Неизвестная тема карты: {theme}")
+    payload = {
+        "center": list(center),
+        "zoom": zoom,
+        "tiles": TILES_URL,
+        "attribution": ATTRIBUTION,
+        "lazy": lazy,
+        "coordScale": COORD_SCALE,
+        "ratingScale": RATING_SCALE,
+        "visited": sorted(visited),
+        "regionZoom": REGION_MAX_ZOOM,
+        "vectorTiles": VECTOR_TILES_URL,
+        "theme": theme,
+    }
+    if not lazy:
+        payload["ids"] = [location.id for location in locations]
+        payload["lat"] = _fixed([location.latitude for location in locations], COORD_SCALE)
+        payload["lon"] = _fixed([location.longitude for location in locations], COORD_SCALE)
+        payload["name"] = [location.name for location in locations]
+        payload["rating"] = _fixed([location.rating for location in locations], RATING_SCALE)
+        payload["description"] = [location.description for location in locations]
+    return payload
+
+
+def render_html(locations, visited, **options):
+    data = json.dumps(map_payload(locations, visited, **options), ensure_ascii=False, separators=(",", ":"))
+    # "</script>" или "<!--" внутри данных сломали бы тег скрипта, поэтому "<" пишется как \u003c
+    return _load_template().replace("__DATA__", data.replace("<", "\\u003c"))
+
+
+def locations_digest(locations):
+    """Хэш набора мест; считается один раз на набор и входит в page_key."""
+    digest = hashlib.blake2b(digest_size=16)
+    for location in locations:
+        digest.update(repr(tuple(location)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def page_key(locations_key, visited, **options):
+    """Ключ страницы по хэшу мест, множеству посещённых и параметрам сборки."""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(locations_key.encode("ascii"))
+    digest.update(json.dumps([sorted(visited), sorted(options.items())], separators=(",", ":")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_atomic(path, data):
+    """Пишет файл целиком во временный рядом и переименовывает: читатель видит старую или новую версию."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".map-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)  # mkstemp создаёт файл только для владельца
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class PageCache:
+    """Последние PAGE_CACHE_SIZE собранных страниц по ключу page_key (LRU).
+
+    Заполняется из фонового потока сборки, читается потоками сервера.
+    """
+
+    def __init__(self, capacity=PAGE_CACHE_SIZE):
+        self.capacity = capacity
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def render(self, key, locations, visited, **options):
+        """HTML страницы в UTF-8: из кэша или собранный заново."""
+        page = self.get(key)
+        if page is not None:
+            tracer.count("map.cache_hits")
+            return page
+        with tracer.span("map.render"):
+            page = render_html(locations, visited, **options).encode("utf-8")
+        with self._lock:
+            self._pages[key] = page
+            if len(self._pages) > self.capacity:
+                self._pages.popitem(last=False)
+        return page
+
+
+def render_map(locations, visited, path, **options):
+    """Пишет map.html и возвращает путь к нему."""
+    with tracer.span("map.render"):
+        html = render_html(locations, visited, **options)
+    with tracer.span("map.write"):
+        write_atomic(path, html.encode("utf-8"))
+    return path
+
+
+def render_folium_map(locations, visited, path):
+    """Прежняя сборка через folium: маркер с иконкой и попапом на каждое место.
+
+    Оставлена для сравнения в benchmarks/bench_render.py.
+    """
+    import folium
+
+    map_object = folium.Map(location=list(DEFAULT_CENTER), zoom_start=DEFAULT_ZOOM, tiles=TILES_URL, attr=ATTRIBUTION)
+    for location in locations:
+        color = "green" if location.id in visited else "red"
+        popup_content = f"<b>{location.name}</b><br>Рейтинг: {location.rating}/5<br>{location.description}"
+        folium.Marker(
+            [location.latitude, location.longitude],
+            popup=popup_content,
+            icon=folium.Icon(color=color)
+        ).add_to(map_object)
+    map_object.save(path)
+    return path
@@ -0,0 +1,370 @@
+import email.utils
+import gzip
+import hashlib
+import json
+import math
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from instrumentation import tracer
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+# Файлы крупнее этого размера не держим в памяти и не сжимаем, а отдаём с диска потоком
+MAX_CACHED_FILE_SIZE = 8 * 1024 * 1024
+# Раздаются только файлы страницы карты: рядом лежат locations.db, её -wal/-shm,
+# trace.json и профили, и отдавать весь каталог нельзя
+STATIC_FILES = frozenset({"map.html", "leaflet.css", "leafnet.js", "lazy_markers.js", "vector_tiles.js", "mapdata.js"})
+# Копии Leaflet, скачанные tile_cache.py vendor, вместе с картинками из его CSS
+STATIC_DIRS = ("vendor/",)
+# Файлы карты лежат рядом с модулем; текущий каталог зависит от того, откуда запущено приложение
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+TILE_PATH = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.png$")
+VECTOR_TILE_PATH = re.compile(r"^/vtiles/(\d+)/(\d+)/(\d+)\.pbf$")
+PAGE_PATH = re.compile(r"^/map-([0-9a-f]+)\.html$")
+# Масштабы карты, для которых отвечают /api/markers и /api/regions (как maxZoom у Leaflet)
+MAX_VIEW_ZOOM = 24
+# Тайлы по одному адресу не меняются месяцами — браузер может не перезапрашивать их
+TILE_MAX_AGE = 30 * 24 * 3600
+
+
+class Asset:
+    """Файл в памяти вместе с заранее сжатыми вариантами и ETag."""
+
+    def __init__(self, body, content_type, stamp):
+        self.body = body
+        self.content_type = content_type
+        self.stamp = stamp
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.last_modified = email.utils.formatdate(stamp[0] / 1e9, usegmt=True)
+        self.encoded = {}
+        if content_type.startswith(COMPRESSIBLE_TYPES) and len(body) > 256:
+            self.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(body)
+
+    def pick(self, accept_encoding):
+        """Лучшая кодировка из поддерживаемых клиентом: (encoding или None, тело)."""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding, self.encoded[encoding]
+        return None, self.body
+
+
+class LargeAsset:
+    """Файл крупнее MAX_CACHED_FILE_SIZE: не читается в память целиком и отдаётся с диска без сжатия."""
+
+    encoded = {}
+
+    def __init__(self, path, content_type, stamp):
+        self.path = path
+        self.content_type = content_type
+        self.stamp = stamp
+        self.etag = f'"{stamp[0]:x}-{stamp[1]:x}"'
+        self.last_modified = email.utils.formatdate(stamp[0] / 1e9, usegmt=True)
+
+    def pick(self, accept_encoding):
+        return None, None
+
+
+class AssetCache:
+    """Кэш статических файлов: перечитывает файл, только если изменились mtime или размер.
+
+    В памяти держатся только файлы до MAX_CACHED_FILE_SIZE, а раздаются лишь
+    STATIC_FILES и STATIC_DIRS, так что объём кэша ограничен ими.
+    """
+
+    def __init__(self, guess_type):
+        self.guess_type = guess_type
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(path)
+        if asset is not None and asset.stamp == stamp:
+            return asset
+        if stat.st_size > MAX_CACHED_FILE_SIZE:
+            return LargeAsset(path, self.guess_type(path), stamp)
+        with open(path, "rb") as f:
+            body = f.read()
+        asset = Asset(body, self.guess_type(path), stamp)
+        with self._lock:
+            self._assets[path] = asset
+        return asset
+
+
+def parse_bbox(query):
+    """[west, south, east, north] из параметра bbox или None, если его нет или он неверен."""
+    try:
+        bbox = [float(value) for value in query["bbox"][0].split(",")]
+    except (KeyError, ValueError):
+        return None
+    # float() принимает nan и inf, а дальше они ломают проекцию ячеек и запросы к R*Tree
+    if len(bbox) != 4 or not all(math.isfinite(value) for value in bbox):
+        return None
+    return bbox
+
+
+class MapRequestHandler(SimpleHTTPRequestHandler):
+    """Раздаёт файлы карты из памяти, тайлы /tiles/{z}/{x}/{y}.png из кэша,
+    векторные тайлы мест /vtiles/{z}/{x}/{y}.pbf, API видимых маркеров
+    /api/markers?bbox=w,s,e,n&zoom=z, места по id /api/place?id=n и сводок
+    по областям /api/regions?bbox=w,s,e,n&zoom=z.
+
+    Соединения keep-alive (HTTP/1.1), ответы с ETag/If-None-Match и сжатием gzip/br.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными записями; без этого Nagle добавляет ~40 мс
+    disable_nagle_algorithm = True
+    log_requests = False
+
+    def __init__(self, *args, clusterer=None, assets=None, tiles=None, regions=None, pages=None, vector_tiles=None,
+                 **kwargs):
+        self.clusterer = clusterer
+        self.vector_tiles = vector_tiles
+        self.regions = regions
+        self.pages = pages
+        self.assets = assets
+        self.tiles = tiles
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        if self.log_requests:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        tile = TILE_PATH.match(url.path)
+        vector_tile = VECTOR_TILE_PATH.match(url.path)
+        page = PAGE_PATH.match(url.path)
+        if url.path == "/api/markers":
+            with tracer.span("http.markers"):
+                self.send_markers(parse_qs(url.query))
+        elif url.path == "/api/regions":
+            with tracer.span("http.regions"):
+                self.send_regions(parse_qs(url.query))
+        elif url.path == "/api/place":
+            with tracer.span("http.place"):
+                self.send_place(parse_qs(url.query))
+        elif tile:
+            with tracer.span("http.tile"):
+                self.send_tile(*(int(value) for value in tile.groups()))
+        elif vector_tile:
+            with tracer.span("http.vector_tile"):
+                self.send_vector_tile(*(int(value) for value in vector_tile.groups()))
+        elif page:
+            with tracer.span("http.page"):
+                self.send_page(page.group(1))
+        else:
+            with tracer.span("http.asset"):
+                self.send_asset(url.path)
+
+    def do_HEAD(self):
+        with tracer.span("http.asset"):
+            self.send_asset(urlsplit(self.path).path, head=True)
+
+    def static_path(self, url_path):
+        """Путь к файлу на диске, если адрес входит в STATIC_FILES или STATIC_DIRS, иначе None."""
+        name = posixpath.normpath(unquote(url_path)).lstrip("/")
+        if name in STATIC_FILES or name.startswith(STATIC_DIRS):
+            return self.translate_path("/" + name)
+        return None
+
+    def send_asset(self, url_path, head=False):
+        path = self.static_path(url_path)
+        asset = self.assets.get(path) if self.assets and path else None
+        if asset is None:
+            self.send_error(404, explain="Файл не найден")
+            return
+        if asset.etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", asset.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        encoding, body = asset.pick(self.headers.get("Accept-Encoding", ""))
+        self.send_response(200)
+        self.send_header("Content-Type", asset.content_type)
+        self.send_header("Content-Length", str(asset.stamp[1] if body is None else len(body)))
+        self.send_header("ETag", asset.etag)
+        self.send_header("Last-Modified", asset.last_modified)
+        self.send_header("Cache-Control", "no-cache")
+        if asset.encoded:
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if head:
+            return
+        if body is None:
+            with open(asset.path, "rb") as f:
+                self.copyfile(f, self.wfile)
+        else:
+            self.wfile.write(body)
+
+    def send_page(self, key):
+        """Страница карты из PageCache: содержимое по ключу не меняется, поэтому кэшируется навсегда."""
+        page = self.pages.get(key) if self.pages else None
+        if page is None:
+            self.send_error(404, explain="Страница карты вытеснена из кэша")
+            return
+        etag = f'"{key}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        self.wfile.write(page)
+
+    def send_tile(self, z, x, y):
+        data = self.tiles.get(z, x, y) if self.tiles else None
+        if data is None:
+            self.send_error(404, explain="Тайла нет в кэше, а источник недоступен")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", f"public, max-age={TILE_MAX_AGE}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_vector_tile(self, z, x, y):
+        """Тайл мест из VectorTileCache; меняется с посещениями, поэтому браузер сверяет его по ETag."""
+        tile = self.vector_tiles.get(z, x, y) if self.vector_tiles else None
+        if tile is None:
+            self.send_error(404, explain="Нет такого векторного тайла")
+            return
+        if tile.etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", tile.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = tile.data
+        gzipped = tile.gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = tile.gzipped
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", tile.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def view_query(self, query):
+        """(west, south, east, north, zoom) из параметров запроса; при ошибке отправляет 400 и возвращает None."""
+        bbox = parse_bbox(query)
+        try:
+            zoom = int(query["zoom"][0])
+        except (KeyError, ValueError):
+            bbox = None
+        if bbox is None:
+            self.send_error(400, explain="Ожидаются параметры bbox=west,south,east,north и zoom")
+            return None
+        return (*bbox, max(0, min(zoom, MAX_VIEW_ZOOM)))
+
+    def send_markers(self, query):
+        view = self.view_query(query)
+        if view is not None:
+            self.send_json(self.clusterer.clusters(*view) if self.clusterer else [])
+
+    def send_place(self, query):
+        try:
+            place_id = int(query["id"][0])
+        except (KeyError, ValueError):
+            self.send_error(400, explain="Ожидается параметр id")
+            return
+        place = self.clusterer.place(place_id) if self.clusterer else None
+        if place is None:
+            self.send_error(404, explain="Нет места с таким id")
+            return
+        self.send_json(place)
+
+    def send_regions(self, query):
+        view = self.view_query(query)
+        if view is not None:
+            self.send_json(self.regions.cells(*view) if self.regions else [])
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        encoding = None
+        if len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MapServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Несколько вкладок и ресурсов страницы открывают соединения одновременно
+    request_queue_size = 128
+
+
+def start_map_server(clusterer, host="localhost", port=8000, static_root=None, tiles=None, regions=None, pages=None,
+                     vector_tiles=None):
+    """Запускает HTTP сервер карты в фоновом потоке и возвращает его.
+
+    Файлы карты берутся из static_root (по умолчанию STATIC_ROOT). Если порт
+    занят, берётся свободный порт, выбранный системой; фактический адрес
+    доступен в server.url.
+    """
+    static_root = os.path.abspath(static_root or STATIC_ROOT)
+    assets = AssetCache(_guess_type)
+    handler = partial(
+        MapRequestHandler, clusterer=clusterer, assets=assets, tiles=tiles, regions=regions, pages=pages,
+        vector_tiles=vector_tiles, directory=static_root,
+    )
+    try:
+        server = MapServer((host, port), handler)
+    except OSError:
+        server = MapServer((host, 0), handler)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    print(f"HTTP сервер запущен на {server.url}")
+    return server
+
+
+def _guess_type(path):
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    return content_type
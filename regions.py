@@ -0,0 +1,164 @@
+"""Сводки по областям карты для мелких масштабов: ячейки geohash вместо отдельных точек.
+
+Для каждой точности geohash (1..MAX_PRECISION) заранее известно, в какую
+ячейку попадает каждое место, и по ячейкам хранятся число мест, сумма
+рейтингов, число посещений всеми пользователями и число мест, посещённых
+текущим пользователем. Новое посещение увеличивает по одному счётчику на
+уровень, поэтому сводки не пересчитываются. Полигоны стран из mapdata.js для
+этого не годятся: в файле только настройки simplemaps, без геометрии.
+"""
+import threading
+
+import numpy as np
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+MAX_PRECISION = 6
+# До этого масштаба включительно страница рисует ячейки, а не маркеры
+REGION_MAX_ZOOM = 10
+# Ячейка не уже 1/CELLS_PER_TILE тайла (32 px при тайле 256 px)
+CELLS_PER_TILE = 8
+# С этого числа посещений за вызов счётчики обновляются векторно
+BULK_VISITS = 64
+
+
+def geohash_codes(lat, lon, precision):
+    """Geohash мест числом из 5 * precision бит (биты долготы и широты чередуются)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    x = np.clip(((lon + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    y = np.clip(((lat + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    codes = np.zeros(len(lat), dtype=np.int64)
+    # Старший бит кода — старший бит долготы, затем широты и т.д.
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+
+def geohash_bounds(codes, precision):
+    """Границы ячеек: массивы south, west, north, east."""
+    codes = np.asarray(codes, dtype=np.int64)
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    x = np.zeros(len(codes), dtype=np.int64)
+    y = np.zeros(len(codes), dtype=np.int64)
+    for i in range(bits):
+        bit = (codes >> (bits - 1 - i)) & 1
+        if i % 2 == 0:
+            x = (x << 1) | bit
+        else:
+            y = (y << 1) | bit
+    width, height = 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+    west, south = x * width - 180.0, y * height - 90.0
+    return south, west, south + height, west + width
+
+
+def geohash_string(code, precision):
+    return "".join(GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def precision_for_zoom(zoom):
+    """Самая мелкая точность, у которой ячейка не уже 1/CELLS_PER_TILE тайла."""
+    tile_width = 360.0 / (1 << max(0, zoom))
+    for precision in range(MAX_PRECISION, 0, -1):
+        if 360.0 / (1 << ((5 * precision + 1) // 2)) >= tile_width / CELLS_PER_TILE:
+            return precision
+    return 1
+
+
+class RegionLevel:
+    """Ячейки одной точности: ключи по возрастанию и счётчики по ним."""
+
+    def __init__(self, precision, cells, codes, rating, visits, own):
+        self.precision = precision
+        self.cells = cells  # номер ячейки для каждого места (по позиции в списке мест)
+        self.codes = codes
+        self.south, self.west, self.north, self.east = geohash_bounds(codes, precision)
+        self.places = np.bincount(cells, minlength=len(codes))
+        self.rating_sum = np.bincount(cells, weights=rating, minlength=len(codes))
+        self.visits = np.bincount(cells, weights=visits, minlength=len(codes)).astype(np.int64)
+        self.visited = np.bincount(cells, weights=own, minlength=len(codes)).astype(np.int64)
+
+
+class RegionStats:
+    """Число мест, средний рейтинг и посещения по ячейкам geohash всех точностей.
+
+    Запросы приходят из потоков сервера, посещения — из приложения, поэтому
+    счётчики меняются и читаются под блокировкой.
+    """
+
+    def __init__(self, locations=(), place_visits=None, visited=(), max_precision=MAX_PRECISION):
+        self.max_precision = max_precision
+        self._lock = threading.Lock()
+        self.reset(locations, place_visits, visited)
+
+    def reset(self, locations, place_visits=None, visited=()):
+        """Новый набор мест. place_visits — число посетителей по id места (как VisitMatrix.place_counts),
+        visited — id мест, посещённых текущим пользователем."""
+        locations = list(locations)
+        ids = np.fromiter((location.id for location in locations), dtype=np.int64, count=len(locations))
+        lat = np.fromiter((location.latitude for location in locations), dtype=np.float64, count=len(locations))
+        lon = np.fromiter((location.longitude for location in locations), dtype=np.float64, count=len(locations))
+        rating = np.fromiter((location.rating for location in locations), dtype=np.float64, count=len(locations))
+        position = {int(place): i for i, place in enumerate(ids)}
+        visits = np.zeros(len(locations), dtype=np.int64)
+        if place_visits is not None:
+            place_visits = np.asarray(place_visits)
+            known = ids < len(place_visits)
+            visits[known] = place_visits[ids[known]]
+        own = np.zeros(len(locations), dtype=np.int64)
+        own[[position[place] for place in visited if place in position]] = 1
+
+        levels = {}
+        for precision in range(1, self.max_precision + 1):
+            codes, cells = np.unique(geohash_codes(lat, lon, precision), return_inverse=True)
+            levels[precision] = RegionLevel(precision, cells.reshape(-1), codes, rating, visits, own)
+        with self._lock:
+            self._position = position
+            self._levels = levels
+
+    def record_visits(self, places, own=False):
+        """Учитывает новые посещения мест; own — это посещения текущего пользователя."""
+        with self._lock:
+            positions = [self._position[place] for place in places if place in self._position]
+            for level in self._levels.values():
+                if len(positions) > BULK_VISITS:
+                    # Пачка из синхронизации с друзьями: один np.add.at на уровень
+                    np.add.at(level.visits, level.cells[positions], 1)
+                    if own:
+                        np.add.at(level.visited, level.cells[positions], 1)
+                    continue
+                # Посещения приходят по одному-несколько: поэлементно дешевле, чем np.add.at
+                for cell in level.cells[positions].tolist():
+                    level.visits[cell] += 1
+                    if own:
+                        level.visited[cell] += 1
+
+    def record_visit(self, place, own=False):
+        self.record_visits((place,), own)
+
+    def cells(self, west, south, east, north, zoom):
+        """Непустые ячейки, пересекающие прямоугольник, для заданного масштаба — словари для JSON."""
+        with self._lock:
+            level = self._levels[min(precision_for_zoom(zoom), self.max_precision)]
+            hit = np.nonzero(
+                (level.east >= west) & (level.west <= east) & (level.north >= south) & (level.south <= north)
+            )[0]
+            places, rating_sum = level.places[hit], level.rating_sum[hit]
+            visits, visited = level.visits[hit].copy(), level.visited[hit].copy()
+        return [
+            {
+                "geohash": geohash_string(int(level.codes[cell]), level.precision),
+                "bounds": [float(level.south[cell]), float(level.west[cell]), float(level.north[cell]), float(level.east[cell])],
+                "places": int(places[i]),
+                "rating": round(float(rating_sum[i] / places[i]), 2),
+                "visits": int(visits[i]),
+                "visited": int(visited[i]),
+            }
+            for i, cell in enumerate(hit)
+        ]
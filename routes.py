@@ -0,0 +1,217 @@
+"""Ближайшие непосещённые места и порядок обхода выбранных мест.
+
+Поиск соседей идёт по KD-дереву из единичных векторов точек на сфере: хорда
+монотонна по расстоянию по дуге, поэтому порядок соседей совпадает с
+порядком по haversine, а дерево остаётся обычным евклидовым. Маршрут
+строится жадно (ближайший сосед) и улучшается 2-opt; оба шага работают по
+матрице расстояний, посчитанной NumPy одним вызовом.
+"""
+import heapq
+import time
+
+import numpy as np
+
+from location_store import EARTH_RADIUS_KM
+
+LEAF_SIZE = 32
+MAX_ROUTE_PLACES = 2000  # матрица расстояний 2000 × 2000 занимает 32 МБ
+ROUTE_TIME_LIMIT = 1.0  # секунд на улучшение 2-opt
+
+
+def unit_vectors(lat, lon):
+    """Точки на единичной сфере, массив формы (n, 3)."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.asarray(chord) / 2))
+
+
+def haversine_matrix(lat_a, lon_a, lat_b, lon_b):
+    """Расстояния в км между всеми точками a и b, матрица формы (len(a), len(b))."""
+    lat_a = np.radians(np.asarray(lat_a, dtype=np.float64))[:, None]
+    lon_a = np.radians(np.asarray(lon_a, dtype=np.float64))[:, None]
+    lat_b = np.radians(np.asarray(lat_b, dtype=np.float64))[None, :]
+    lon_b = np.radians(np.asarray(lon_b, dtype=np.float64))[None, :]
+    a = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class KDTree:
+    """Статическое KD-дерево по точкам формы (n, d) с поиском k ближайших.
+
+    Точки переставляются так, что каждый узел владеет отрезком [start, end)
+    массива; листья проверяются векторно, а узлы отсекаются по расстоянию до
+    их ограничивающего прямоугольника.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        points = np.asarray(points, dtype=np.float64)
+        self.order = np.arange(len(points))
+        self.leaf_size = leaf_size
+        # Узлы: отрезок точек, прямоугольник и дети (-1 у листа)
+        self.start, self.end, self.left, self.right = [], [], [], []
+        self.lower, self.upper = [], []
+        if len(points):
+            self._build(points, 0, len(points))
+        self.points = points[self.order]
+        self.lower = np.array(self.lower)
+        self.upper = np.array(self.upper)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _build(self, points, start, end):
+        node = len(self.start)
+        block = points[self.order[start:end]]
+        self.start.append(start)
+        self.end.append(end)
+        self.lower.append(block.min(axis=0))
+        self.upper.append(block.max(axis=0))
+        self.left.append(-1)
+        self.right.append(-1)
+        if end - start > self.leaf_size:
+            # Деление по медиане самой вытянутой оси
+            axis = int(np.argmax(self.upper[node] - self.lower[node]))
+            middle = (end - start) // 2
+            split = np.argpartition(block[:, axis], middle)
+            self.order[start:end] = self.order[start:end][split]
+            self.left[node] = self._build(points, start, start + middle)
+            self.right[node] = self._build(points, start + middle, end)
+        return node
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(self.lower[node] - point, 0) + np.maximum(point - self.upper[node], 0)
+        return float(gap @ gap)
+
+    def query(self, point, k=1, allowed=None):
+        """k ближайших точек: (квадраты расстояний, индексы исходного массива) по возрастанию.
+
+        allowed — булев массив по исходным индексам; точки с False пропускаются.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        best_d = np.empty(0)
+        best_i = np.empty(0, dtype=np.int64)
+        if not len(self) or k <= 0:
+            return best_d, best_i
+        bound = np.inf
+        heap = [(0.0, 0)]
+        while heap:
+            box, node = heapq.heappop(heap)
+            if box >= bound:
+                break  # Остальные узлы в куче ещё дальше
+            if self.left[node] < 0:
+                start, end = self.start[node], self.end[node]
+                index = self.order[start:end]
+                diff = self.points[start:end] - point
+                dist = np.einsum("ij,ij->i", diff, diff)
+                if allowed is not None:
+                    keep = allowed[index]
+                    index, dist = index[keep], dist[keep]
+                best_d = np.concatenate([best_d, dist])
+                best_i = np.concatenate([best_i, index])
+                if len(best_d) > k:
+                    top = np.argpartition(best_d, k - 1)[:k]
+                    best_d, best_i = best_d[top], best_i[top]
+                if len(best_d) == k:
+                    bound = float(best_d.max())
+                continue
+            for child in (self.left[node], self.right[node]):
+                distance = self._box_distance(child, point)
+                if distance < bound:
+                    heapq.heappush(heap, (distance, child))
+        order = np.argsort(best_d, kind="stable")
+        return best_d[order], best_i[order]
+
+
+class PlaceIndex:
+    """Пространственный индекс мест в памяти для запросов «рядом со мной»."""
+
+    def __init__(self, locations):
+        self.locations = list(locations)
+        self.ids = np.fromiter((location.id for location in self.locations), dtype=np.int64, count=len(self.locations))
+        self.lat = np.fromiter((location.latitude for location in self.locations), dtype=np.float64, count=len(self.locations))
+        self.lon = np.fromiter((location.longitude for location in self.locations), dtype=np.float64, count=len(self.locations))
+        self.tree = KDTree(unit_vectors(self.lat, self.lon))
+
+    def nearest(self, lat, lon, k=10, exclude=()):
+        """k ближайших мест к точке, кроме id из exclude: пары (Location, расстояние в км)."""
+        allowed = None
+        if exclude:
+            allowed = ~np.isin(self.ids, np.fromiter(exclude, dtype=np.int64, count=len(exclude)))
+        squared, index = self.tree.query(unit_vectors(lat, lon), k, allowed)
+        distances = chord_to_km(np.sqrt(squared))
+        return [(self.locations[i], float(d)) for i, d in zip(index.tolist(), distances)]
+
+    def route(self, place_ids, start=None, time_limit=ROUTE_TIME_LIMIT):
+        """Порядок обхода мест place_ids: (список Location по порядку, длина в км)."""
+        positions = np.flatnonzero(np.isin(self.ids, np.fromiter(place_ids, dtype=np.int64)))
+        order, length = plan_route(self.lat[positions], self.lon[positions], start, time_limit)
+        return [self.locations[positions[i]] for i in order], length
+
+
+def nearest_neighbour_route(dist, first):
+    """Жадный путь по матрице dist из узла first через все узлы."""
+    n = len(dist)
+    route = [first]
+    remaining = np.ones(n, dtype=bool)
+    remaining[first] = False
+    current = first
+    for _ in range(n - 1):
+        row = np.where(remaining, dist[current], np.inf)
+        current = int(np.argmin(row))
+        remaining[current] = False
+        route.append(current)
+    return np.array(route)
+
+
+def two_opt(dist, route, time_limit=ROUTE_TIME_LIMIT):
+    """Улучшает путь разворотами отрезков; первый и последний узлы остаются на месте.
+
+    Для каждого ребра (a, b) выигрыш по всем рёбрам (c, d) дальше по пути
+    считается одним векторным выражением, и применяется лучший разворот.
+    """
+    route = np.array(route)
+    n = len(route)
+    deadline = time.perf_counter() + time_limit
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n - 3):
+            a, b = route[i], route[i + 1]
+            c, d = route[i + 2:n - 1], route[i + 3:n]
+            gain = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-9:
+                j += i + 2
+                route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+                improved = True
+    return route
+
+
+def plan_route(lat, lon, start=None, time_limit=ROUTE_TIME_LIMIT):
+    """Порядок обхода точек: индексы в lat/lon и длина пути в км.
+
+    start — (lat, lon) начала пути; без него путь может начинаться с любой
+    точки. Путь открытый: возвращаться в начало не нужно.
+    """
+    n = len(lat)
+    if n > MAX_ROUTE_PLACES:
+        raise ValueError(f"Маршрут строится не более чем по {MAX_ROUTE_PLACES} местам")
+    if n < 2:
+        # Путь из одного места — только отрезок от начала до него
+        length = float(haversine_matrix([start[0]], [start[1]], lat, lon)[0, 0]) if n and start is not None else 0.0
+        return list(range(n)), length
+    # Узел n — начало пути, n + 1 — конец с нулевыми рёбрами (путь не замыкается).
+    # Без заданного начала у узла n тоже нулевые рёбра, и начало выбирает 2-opt.
+    dist = np.zeros((n + 2, n + 2))
+    dist[:n, :n] = haversine_matrix(lat, lon, lat, lon)
+    if start is not None:
+        dist[n, :n] = dist[:n, n] = haversine_matrix([start[0]], [start[1]], lat, lon)[0]
+    route = np.append(nearest_neighbour_route(dist[:n + 1, :n + 1], n), n + 1)
+    route = two_opt(dist, route, time_limit)
+    length = float(dist[route[:-2], route[1:-1]].sum())
+    return route[1:-1].tolist(), length
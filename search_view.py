@@ -0,0 +1,113 @@
+"""Поиск мест по мере ввода: строка с подсказками QCompleter поверх поискового индекса.
+
+Запрос к базе уходит не на каждую клавишу, а через SEARCH_DELAY_MS после
+последней. Подсказки подгружаются страницами по PAGE_SIZE: следующая
+страница запрашивается, только когда список прокручен до конца
+(canFetchMore/fetchMore), поэтому размер каталога на ввод не влияет.
+"""
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, QTimer, Signal
+from PySide6.QtWidgets import QCompleter, QLineEdit
+
+SEARCH_DELAY_MS = 150
+PAGE_SIZE = 50
+VISIBLE_ROWS = 12
+
+PlaceRole = Qt.UserRole + 1
+
+
+class SearchModel(QAbstractListModel):
+    """Результаты одного запроса; search(text, limit, offset) возвращает пары (Location, км или None)."""
+
+    def __init__(self, search, parent=None):
+        super().__init__(parent)
+        self.search = search
+        self.text = ""
+        self.rows = []
+        self.exhausted = True
+        self.fetching = False
+
+    def set_query(self, text):
+        self.beginResetModel()
+        self.text = text
+        self.rows = []
+        self.exhausted = not text.strip()
+        self.endResetModel()
+        # Первую страницу может уже запросить модель QCompleter, реагируя на сброс
+        if not self.rows:
+            self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        location, distance = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            text = f"{location.name} — {location.rating}/5"
+            return text if distance is None else f"{text}, {distance:.1f} км"
+        if role == Qt.EditRole:
+            return location.name
+        if role == Qt.ToolTipRole:
+            return location.description
+        if role == PlaceRole:
+            return location.id
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # Модель QCompleter дочитывает источник в ответ на вставку строк; без этой
+        # проверки одна страница тянула бы за собой все остальные
+        return not parent.isValid() and not self.exhausted and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.fetching = True
+        try:
+            page = self.search(self.text, PAGE_SIZE, len(self.rows))
+            self.exhausted = len(page) < PAGE_SIZE
+            if page:
+                self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+                self.rows.extend(page)
+                self.endInsertRows()
+        finally:
+            self.fetching = False
+
+
+class PlaceSearchBox(QLineEdit):
+    """Строка поиска; выбор подсказки испускает place_chosen(id места)."""
+
+    place_chosen = Signal(int)
+
+    def __init__(self, search, parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText("Найти место по названию или описанию")
+        self.setClearButtonEnabled(True)
+        self.model = SearchModel(search, self)
+        # Фильтрует база, а не QCompleter: подсказки показываются как есть
+        self.completer = QCompleter(self.model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCompletionRole(Qt.EditRole)
+        self.completer.setMaxVisibleItems(VISIBLE_ROWS)
+        # Виджет задаётся без setCompleter: иначе QLineEdit показывал бы старые
+        # подсказки на каждую клавишу, не дожидаясь нового запроса
+        self.completer.setWidget(self)
+        self.completer.activated[QModelIndex].connect(self.choose)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(SEARCH_DELAY_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.textEdited.connect(self.timer.start)
+
+    def refresh(self):
+        """Повторяет запрос по текущему тексту (после ввода или смены порядка)."""
+        self.timer.stop()
+        self.model.set_query(self.text())
+        if self.model.rowCount():
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def choose(self, index):
+        self.setText(index.data(Qt.EditRole))
+        self.place_chosen.emit(index.data(PlaceRole))
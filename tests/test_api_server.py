@@ -0,0 +1,112 @@
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from api_server import TravelService, start_api_server
+from location_store import LocationStore
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("api") / "locations.db")
+    service = TravelService(db_path, pool_size=2)
+    server = start_api_server(service, port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def request(server, path, method="GET", payload=None):
+    """(статус, тело) ответа; тело JSON разбирается."""
+    data = None if payload is None else json.dumps(payload).encode()
+    req = urllib.request.Request(server.url + path, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            status, body, kind = response.status, response.read(), response.headers.get_content_type()
+    except urllib.error.HTTPError as error:
+        return error.code, None
+    return status, json.loads(body) if kind == "application/json" else body
+
+
+def test_locations_in_bbox(server):
+    status, places = request(server, "/api/locations?bbox=37.5,55.7,37.7,55.8&limit=5")
+    assert status == 200
+    assert 0 < len(places) <= 5
+    assert all(55.7 <= place["latitude"] <= 55.8 for place in places)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/locations",
+    "/api/locations?bbox=1,2,3",
+    "/api/locations?bbox=nan,55,38,56",
+    "/api/locations?bbox=37,55,38,inf",
+    "/api/locations?bbox=37,55,38,56&limit=-1",
+    "/api/locations?bbox=37,55,38,56&limit=0",
+    "/api/locations?bbox=37,55,38,56&limit=5001",
+    "/api/locations?bbox=37,55,38,56&limit=ten",
+    "/api/markers?bbox=nan,55,38,56&zoom=10",
+    "/api/markers?bbox=37,55,inf,56&zoom=10",
+    "/api/leaderboard?k=0",
+    "/api/leaderboard?k=ten",
+    "/api/places/1/visitors?limit=0",
+    "/api/places/1/visitors?offset=-1",
+])
+def test_bad_query_is_400(server, path):
+    assert request(server, path)[0] == 400
+
+
+@pytest.mark.parametrize("path", [
+    "/locations.db",
+    "/locations.db-wal",
+    "/../locations.db",
+    "/%2e%2e/locations.db",
+    "/vendor/../locations.db",
+    "/api_server.py",
+    "/",
+    "/api/unknown",
+])
+def test_only_map_assets_are_served(server, path):
+    assert request(server, path)[0] == 404
+
+
+def test_map_page_is_served(server):
+    status, body = request(server, "/map.html")
+    assert status == 200 and body
+
+
+def test_visits_and_visitors_paging(server):
+    for user in ("Аня", "Боря", "Вика"):
+        status, result = request(server, f"/api/users/{urllib.parse.quote(user)}/visits", "POST", {"places": [3]})
+        assert status == 200 and result["added"] == [3]
+    assert request(server, "/api/places/3/visitors") == (200, ["Аня", "Боря", "Вика"])
+    assert request(server, "/api/places/3/visitors?limit=2") == (200, ["Аня", "Боря"])
+    assert request(server, "/api/places/3/visitors?limit=2&offset=2") == (200, ["Вика"])
+    assert request(server, "/api/places/99999/visitors") == (200, [])
+
+
+def test_bad_visits_body_is_400(server):
+    assert request(server, "/api/users/x/visits", "POST", {"places": "3"})[0] == 400
+    assert request(server, "/api/users/x/visits", "POST", [3])[0] == 400
+    assert request(server, "/api/users/x/visits", "POST", {"places": [True]})[0] == 400
+    assert request(server, "/api/users/x/visits", "POST", {"place": True})[0] == 400
+    assert request(server, "/api/users/x/progress", "POST", {"places": [3]})[0] == 404
+
+
+def test_visits_are_checked_against_catalogue_ids(tmp_path):
+    db_path = str(tmp_path / "locations.db")
+    store = LocationStore(db_path)
+    for i in range(3):
+        store.add(f"Место {i}", "", 55.75 + i / 100, 37.62, 4.0)
+    with store.conn:
+        store.conn.execute("DELETE FROM locations WHERE id = 2")
+    store.close()
+    service = TravelService(db_path, pool_size=1)
+    try:
+        assert service.record_visits("Аня", [2, 3, 4, 1])["added"] == [3, 1]
+        assert service.progress("Аня")["visited"] == 2
+    finally:
+        service.close()
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+QtCore = pytest.importorskip("PySide6.QtCore")
+
+from background import TaskRunner  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    # Результаты приходят через очередь событий — нужен экземпляр приложения
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def runner(app):
+    runner = TaskRunner(max_workers=2)
+    yield runner
+    runner.shutdown()
+
+
+def wait_idle(runner, key, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while runner.is_busy(key):
+        assert time.monotonic() < deadline, "фоновая задача не завершилась"
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.001)
+    QtCore.QCoreApplication.processEvents()
+
+
+def test_submits_coalesce_to_latest(runner):
+    release = threading.Event()
+    ran, results = [], []
+
+    def job(i):
+        def run():
+            if i == 0:
+                release.wait(5)
+            ran.append(i)
+            return i
+        return run
+
+    for i in range(100):
+        runner.submit("markers", job(i), results.append)
+    # Пока первый запуск идёт, в очереди только самый новый запрос
+    assert len(runner.callbacks) == 2
+    release.set()
+    wait_idle(runner, "markers")
+    assert ran == [0, 99]
+    assert results == [99]
+    assert runner.callbacks == {}
+
+
+def test_cancel_drops_result_and_callbacks(runner):
+    release = threading.Event()
+    results = []
+    runner.submit("search", lambda: release.wait(5), results.append)
+    runner.submit("search", lambda: "новый", results.append)
+    runner.cancel("search")
+    release.set()
+    wait_idle(runner, "search")
+    assert results == []
+    assert runner.callbacks == {}
+
+
+def test_error_goes_to_on_error(runner):
+    errors = []
+
+    def fail():
+        raise RuntimeError("сбой")
+
+    runner.submit("route", fail, on_error=errors.append)
+    wait_idle(runner, "route")
+    assert [str(error) for error in errors] == ["сбой"]
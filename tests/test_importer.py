@@ -0,0 +1,48 @@
+import math
+import random
+
+import pytest
+
+from importer import Deduplicator
+from location_store import haversine_km
+
+
+def offset(lat, lon, meters, bearing):
+    """Точка на расстоянии meters от (lat, lon) по азимуту bearing (в градусах)."""
+    km = meters / 1000
+    dlat = km * math.cos(math.radians(bearing)) / 111.195
+    dlon = km * math.sin(math.radians(bearing)) / (111.195 * math.cos(math.radians(lat)))
+    return lat + dlat, lon + dlon
+
+
+@pytest.mark.parametrize("lat", [0.0, 55.75, -33.86, 69.0, 84.0])
+def test_dedup_uses_real_distance(lat):
+    lon = 37.62
+    for bearing in range(0, 360, 15):
+        dedup = Deduplicator(radius_m=50)
+        assert dedup.add("Кафе", lat, lon)
+        near = offset(lat, lon, 45, bearing)
+        far = offset(lat, lon, 55, bearing)
+        assert haversine_km(lat, lon, *near) < 0.05 < haversine_km(lat, lon, *far)
+        assert not dedup.add("Кафе", *near)
+        assert dedup.add("Кафе", *far)
+
+
+def test_dedup_compares_names_case_and_yo_insensitive():
+    dedup = Deduplicator(radius_m=50)
+    assert dedup.add("Ёлочка", 55.75, 37.62)
+    assert not dedup.add("елочка", 55.75, 37.62)
+    assert dedup.add("Берёзка", 55.75, 37.62)
+
+
+def test_dedup_matches_brute_force():
+    rng = random.Random(7)
+    dedup = Deduplicator(radius_m=50)
+    kept = []
+    for _ in range(3000):
+        # Плотное облако, чтобы соседи попадали в разные ячейки и полосы
+        lat, lon = rng.uniform(59.93, 59.94), rng.uniform(30.30, 30.32)
+        expected = all(haversine_km(lat, lon, *other) > 0.05 for other in kept)
+        assert dedup.add("Фонтан", lat, lon) == expected
+        if expected:
+            kept.append((lat, lon))
@@ -0,0 +1,145 @@
+import math
+import random
+
+import pytest
+
+from location_store import EARTH_RADIUS_KM, LocationStore, haversine_km
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocationStore(str(tmp_path / "locations.db"))
+    yield store
+    store.close()
+
+
+def test_in_bounds_includes_edges_exactly(store):
+    # Координаты, которых нет во float32: R*Tree хранит их округлёнными
+    lat, lon = 55.753912345678, 37.620512345678
+    place_id = store.add("Точка", "", lat, lon, 4.5)
+    assert [p.id for p in store.in_bounds(lat, lon, lat, lon)] == [place_id]
+    assert [p.id for p in store.in_bounds(lat - 1, lon - 1, lat, lon)] == [place_id]
+    above = math.nextafter(lat, 90)
+    right = math.nextafter(lon, 180)
+    assert store.in_bounds(above, lon - 1, lat + 1, lon + 1) == []
+    assert store.in_bounds(lat - 1, right, lat + 1, lon + 1) == []
+
+
+def test_in_bounds_matches_scan(store):
+    rng = random.Random(3)
+    points = [(rng.uniform(55.5, 56.0), rng.uniform(37.3, 37.9)) for _ in range(300)]
+    for i, (lat, lon) in enumerate(points):
+        store.add(f"Место {i}", "", lat, lon, 4.0)
+    for _ in range(50):
+        # Края прямоугольника — координаты самих мест
+        (s, w), (n, e) = rng.sample(points, 2)
+        south, north = sorted((s, n))
+        west, east = sorted((w, e))
+        expected = {
+            i + 1 for i, (lat, lon) in enumerate(points) if south <= lat <= north and west <= lon <= east
+        }
+        assert {p.id for p in store.in_bounds(south, west, north, east)} == expected
+
+
+def test_nearest_is_exact(store):
+    rng = random.Random(5)
+    points = [(rng.uniform(55.5, 56.0), rng.uniform(37.3, 37.9)) for _ in range(300)]
+    for i, (lat, lon) in enumerate(points):
+        store.add(f"Место {i}", "", lat, lon, 4.0)
+    for _ in range(20):
+        lat, lon = rng.uniform(55.4, 56.1), rng.uniform(37.2, 38.0)
+        expected = sorted((haversine_km(lat, lon, *point), i + 1) for i, point in enumerate(points))[:7]
+        result = store.nearest(lat, lon, n=7, radius_km=0.5)
+        assert [(distance, place.id) for place, distance in result] == expected
+
+
+def test_nearest_outside_window_falls_back_to_all(store):
+    store.add("Далеко", "", -33.86, 151.21, 4.0)
+    [(place, distance)] = store.nearest(55.75, 37.62, n=3)
+    assert place.name == "Далеко"
+    assert distance == pytest.approx(haversine_km(55.75, 37.62, -33.86, 151.21))
+
+
+def test_nearest_refines_with_full_circle_due_north(store):
+    # Первое окно (1 км) находит только место к северо-востоку, за радиусом окна;
+    # уточняющий запрос по его расстоянию должен захватить чуть более близкое место к северу
+    lat, lon = 55.0, 37.0
+    east = store.add("Северо-восток", "", lat + 0.0089, lon + 0.0155, 4.0)
+    distance = haversine_km(lat, lon, lat + 0.0089, lon + 0.0155)
+    assert distance > 1.0
+    north_lat = lat + math.degrees((distance - 0.0005) / EARTH_RADIUS_KM)
+    north = store.add("Север", "", north_lat, lon, 4.0)
+    assert [place.id for place, _ in store.nearest(lat, lon, n=1, radius_km=1.0)] == [north]
+    assert [place.id for place, _ in store.nearest(lat, lon, n=2, radius_km=1.0)] == [north, east]
+
+
+@pytest.mark.parametrize("query, near, far", [
+    ((0.0, 179.999), (0.0, -179.999), (0.0, 179.9)),
+    ((-10.0, -179.998), (-10.0, 179.998), (-10.0, -179.95)),
+    ((89.99, 0.0), (89.99, 180.0), (89.9, 0.0)),
+])
+def test_nearest_wraps_antimeridian_and_pole(store, query, near, far):
+    far_id = store.add("Дальше", "", *far, 4.0)
+    near_id = store.add("Ближе", "", *near, 4.0)
+    [(place, distance)] = store.nearest(*query, n=1, radius_km=0.1)
+    assert place.id == near_id
+    assert distance == pytest.approx(haversine_km(*query, *near))
+    assert [place.id for place, _ in store.nearest(*query, n=2, radius_km=0.1)] == [near_id, far_id]
+
+
+def test_search_orders_by_rating_then_id(store):
+    store.add("Парк Горького", "", 55.73, 37.60, 4.8)
+    store.add("Ёлочный базар", "У парка", 55.70, 37.50, 4.84)
+    store.add("Музей", "Старый ПАРКОВЫЙ павильон", 55.71, 37.51, 4.9)
+    store.add("Парковка", "", 55.72, 37.52, 3.0)
+    store.add("Сквер", "", 55.74, 37.53, 5.0)
+    # Рейтинг сравнивается с шагом 0.1: 4.84 и 4.8 равны, дальше решает id
+    assert [p.id for p in store.search("парк")] == [3, 1, 2, 4]
+    assert [p.id for p in store.search("ПАРК горь")] == [1]
+    assert [p.id for p in store.search("елоч")] == [2]
+    assert [p.id for p in store.search("ёлоч")] == [2]
+    assert [p.id for p in store.search("парк", limit=2, offset=1)] == [1, 2]
+    assert store.search("арк") == []
+    assert store.search(" ,.-_ ") == []
+
+
+def test_search_follows_replace_all(store):
+    store.add("Старое место", "", 55.0, 37.0, 4.0)
+    store.replace_all([(10.0, 20.0, "Новое место", 3.5, "описание"), (11.0, 21.0, "Старый парк", 4.5, "")])
+    assert [p.name for p in store.search("место")] == ["Новое место"]
+    assert [p.name for p in store.search("стар")] == ["Старый парк"]
+    assert [p.id for p in store.search("опис")] == [1]
+
+
+def test_search_matches_scan(store):
+    rng = random.Random(11)
+    words = ["парк", "музей", "мост", "собор"]
+    rows = [
+        (rng.uniform(-60, 70), rng.uniform(-180, 180), f"{rng.choice(words)} {rng.choice(words)}", rng.choice([3.0, 4.0, 4.5, 5.0]), "")
+        for _ in range(400)
+    ]
+    store.replace_all(rows)
+    places = [(i, name, rating) for i, (_, _, name, rating, _) in enumerate(rows, start=1)]
+    for word in words:
+        expected = sorted((-rating, place_id) for place_id, name, rating in places if word in name.split())
+        assert [p.id for p in store.search(word[:3], limit=1000)] == [place_id for _, place_id in expected]
+
+
+@pytest.mark.parametrize("lat, lon", [(55.75, 37.62), (-33.9, 151.2), (0.0, 179.9), (85.0, -10.0)])
+def test_search_near_matches_brute_force(store, lat, lon):
+    # Совпадений больше SEARCH_CELL_LIMIT: квадродерево делит плотные клетки
+    rng = random.Random(13)
+    rows = []
+    for i in range(600):
+        point = (rng.uniform(-80, 80), rng.uniform(-180, 180))
+        if i < 200:
+            point = (lat + rng.uniform(-1, 1), (lon + rng.uniform(-1, 1) + 180) % 360 - 180)
+        rows.append((*point, f"{'Парк' if i % 3 else 'Музей'} {i}", 4.0, ""))
+    store.replace_all(rows)
+    points = {i: row[:2] for i, row in enumerate(rows, start=1) if row[2].startswith("Парк")}
+    expected = sorted((haversine_km(lat, lon, *point), place_id) for place_id, point in points.items())
+    result = store.search_near("парк", lat, lon, limit=150)
+    assert [(distance, place.id) for place, distance in result] == expected[:150]
+    page = store.search_near("парк", lat, lon, limit=10, offset=395)
+    assert [place.id for place, _ in page] == [place_id for _, place_id in expected[395:405]]
+    assert store.search_near("вокзал", lat, lon) == []
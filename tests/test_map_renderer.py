@@ -0,0 +1,15 @@
+import json
+
+from location_store import Location
+from map_renderer import map_payload, render_html
+
+
+def test_render_html_escapes_markup_in_data():
+    name = "</script><script>alert(1)</script><!-- <SCRIPT"
+    locations = [Location(1, name, "a < b", 55.75, 37.62, 4.5)]
+    html = render_html(locations, {1})
+    start = html.index("var travelData = ") + len("var travelData = ")
+    data = html[start:html.index(";\n", start)]
+    assert "<" not in data
+    assert json.loads(data) == map_payload(locations, {1})
+    assert "alert" not in html.replace(data, "")
@@ -0,0 +1,20 @@
+import os
+import urllib.request
+
+import map_server
+from map_server import start_map_server
+
+
+def test_static_files_come_from_module_directory(tmp_path, monkeypatch):
+    # Запуск из другого каталога не меняет, откуда берутся файлы карты
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "lazy_markers.js").write_text("// чужой файл")
+    server = start_map_server(None, port=0)
+    try:
+        with urllib.request.urlopen(server.url + "/lazy_markers.js", timeout=5) as response:
+            body = response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+    with open(os.path.join(map_server.STATIC_ROOT, "lazy_markers.js"), "rb") as f:
+        assert body == f.read()
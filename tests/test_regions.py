@@ -0,0 +1,130 @@
+import random
+
+import numpy as np
+import pytest
+
+import regions
+from location_store import Location
+from regions import RegionStats, geohash_bounds, geohash_codes, geohash_string, precision_for_zoom
+
+
+def place(place_id, lat, lon, rating=4.0):
+    return Location(place_id, f"Место {place_id}", "", lat, lon, rating)
+
+
+def catalogue(seed, count=300):
+    rng = random.Random(seed)
+    return [place(i, rng.uniform(-85, 85), rng.uniform(-180, 180), round(rng.uniform(1, 5), 1)) for i in range(1, count + 1)]
+
+
+@pytest.mark.parametrize(
+    "lat, lon, expected",
+    [(57.64911, 10.40744, "u4pruy"), (42.6, -5.6, "ezs42e"), (-90.0, -180.0, "000000"), (90.0, 180.0, "zzzzzz")],
+)
+def test_geohash_matches_reference(lat, lon, expected):
+    for precision in range(1, 7):
+        code = int(geohash_codes([lat], [lon], precision)[0])
+        assert geohash_string(code, precision) == expected[:precision]
+
+
+def test_geohash_bounds_contain_points():
+    locations = catalogue(1)
+    lat = np.array([location.latitude for location in locations])
+    lon = np.array([location.longitude for location in locations])
+    for precision in range(1, 7):
+        south, west, north, east = geohash_bounds(geohash_codes(lat, lon, precision), precision)
+        assert np.all((south <= lat) & (lat < north) & (west <= lon) & (lon < east))
+        # Ширина ячейки: половина бит на долготу (с лишним битом при нечётном числе)
+        assert np.allclose(east - west, 360.0 / (1 << ((5 * precision + 1) // 2)))
+        assert np.allclose(north - south, 180.0 / (1 << (5 * precision // 2)))
+
+
+def test_precision_for_zoom():
+    precisions = [precision_for_zoom(zoom) for zoom in range(0, 20)]
+    assert precisions == sorted(precisions)
+    assert precisions[0] == 1 and precisions[-1] == regions.MAX_PRECISION
+    for zoom, precision in enumerate(precisions):
+        width = 360.0 / (1 << ((5 * precision + 1) // 2))
+        tile = 360.0 / (1 << zoom)
+        assert width >= tile / regions.CELLS_PER_TILE or precision == 1
+        if precision < regions.MAX_PRECISION:
+            assert 360.0 / (1 << ((5 * (precision + 1) + 1) // 2)) < tile / regions.CELLS_PER_TILE
+
+
+def brute_force(locations, visits, own, precision, west, south, east, north):
+    cells = {}
+    for location in locations:
+        code = int(geohash_codes([location.latitude], [location.longitude], precision)[0])
+        cell = cells.setdefault(geohash_string(code, precision), {"code": code, "places": 0, "rating": 0.0, "visits": 0, "visited": 0})
+        cell["places"] += 1
+        cell["rating"] += location.rating
+        cell["visits"] += visits.get(location.id, 0)
+        cell["visited"] += location.id in own
+    result = {}
+    for name, cell in cells.items():
+        s, w, n, e = (float(value[0]) for value in geohash_bounds([cell["code"]], precision))
+        if e >= west and w <= east and n >= south and s <= north:
+            result[name] = {
+                "geohash": name,
+                "bounds": [s, w, n, e],
+                "places": cell["places"],
+                "rating": round(cell["rating"] / cell["places"], 2),
+                "visits": cell["visits"],
+                "visited": cell["visited"],
+            }
+    return result
+
+
+@pytest.mark.parametrize("zoom, box", [(0, (-180, -90, 180, 90)), (3, (-30, -20, 60, 50)), (6, (10, 10, 25, 20))])
+def test_cells_match_brute_force(zoom, box):
+    locations = catalogue(2)
+    rng = random.Random(3)
+    place_visits = np.array([0] + [rng.randrange(5) for _ in locations] + [7])
+    own = {location.id for location in rng.sample(locations, 60)}
+    stats = RegionStats(locations, place_visits, own)
+    visits = {location.id: int(place_visits[location.id]) for location in locations}
+    expected = brute_force(locations, visits, own, precision_for_zoom(zoom), *box)
+    cells = stats.cells(*box, zoom)
+    assert [cell["geohash"] for cell in cells] == sorted(expected)
+    assert {cell["geohash"]: cell for cell in cells} == expected
+
+
+@pytest.mark.parametrize("count", [3, regions.BULK_VISITS + 10])
+def test_record_visits_updates_every_level(count):
+    # Пачки больше BULK_VISITS идут через np.add.at, меньшие — поэлементно; повторы в пачке считаются
+    locations = catalogue(4)
+    stats = RegionStats(locations, max_precision=4)
+    rng = random.Random(count)
+    visits, own = {}, {}
+    for _ in range(5):
+        batch = [rng.choice(locations).id for _ in range(count)]
+        stats.record_visits(batch + [10_000], own=True)
+        stats.record_visits(batch[:2])
+        for place_id in batch:
+            visits[place_id] = visits.get(place_id, 0) + 1
+            own[place_id] = own.get(place_id, 0) + 1
+        for place_id in batch[:2]:
+            visits[place_id] += 1
+    stats.record_visit(locations[0].id)
+    visits[locations[0].id] = visits.get(locations[0].id, 0) + 1
+    for zoom in (0, 2, 4, 7):
+        precision = min(precision_for_zoom(zoom), 4)
+        expected = brute_force(locations, visits, set(), precision, -180, -90, 180, 90)
+        own_cells = brute_force(locations, own, set(), precision, -180, -90, 180, 90)
+        cells = stats.cells(-180, -90, 180, 90, zoom)
+        assert len(cells) == len(expected)
+        for cell in cells:
+            assert cell["visits"] == expected[cell["geohash"]]["visits"]
+            assert cell["visited"] == own_cells[cell["geohash"]]["visits"]
+
+
+def test_reset_replaces_catalogue():
+    stats = RegionStats([place(1, 10, 10), place(2, 10.001, 10.001, 2.0)], visited=[2, 99])
+    [cell] = stats.cells(-180, -90, 180, 90, 0)
+    assert (cell["places"], cell["rating"], cell["visits"], cell["visited"]) == (2, 3.0, 0, 1)
+    stats.reset([place(5, -40, -70)], place_visits=[0, 0, 0, 0, 0, 3])
+    [cell] = stats.cells(-180, -90, 180, 90, 0)
+    assert (cell["places"], cell["visits"], cell["visited"]) == (1, 3, 0)
+    stats.record_visit(1)
+    assert stats.cells(-180, -90, 180, 90, 0)[0]["visits"] == 3
+    assert RegionStats().cells(-180, -90, 180, 90, 0) == []
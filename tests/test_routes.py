@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+import pytest
+
+from location_store import haversine_km
+from routes import MAX_ROUTE_PLACES, plan_route
+
+
+def path_km(lat, lon, order, start=None):
+    points = [(lat[i], lon[i]) for i in order]
+    if start is not None:
+        points.insert(0, start)
+    return sum(haversine_km(*a, *b) for a, b in zip(points, points[1:]))
+
+
+def test_empty_and_single_place():
+    assert plan_route(np.array([]), np.array([])) == ([], 0.0)
+    assert plan_route(np.array([59.94]), np.array([30.31])) == ([0], 0.0)
+
+
+def test_single_place_counts_start_leg():
+    moscow, spb = (55.7558, 37.6173), (59.9386, 30.3141)
+    order, length = plan_route(np.array([spb[0]]), np.array([spb[1]]), start=moscow)
+    assert order == [0]
+    assert length == pytest.approx(haversine_km(*moscow, *spb))
+
+
+def test_points_on_meridian_are_visited_in_order():
+    lat = np.array([55.80, 55.72, 55.76, 55.70, 55.78, 55.74])
+    lon = np.full(len(lat), 37.62)
+    order, length = plan_route(lat, lon, start=(55.68, 37.62))
+    assert order == np.argsort(lat).tolist()
+    assert length == pytest.approx(haversine_km(55.68, 37.62, 55.80, 37.62))
+
+
+@pytest.mark.parametrize("start", [None, (55.75, 37.62)])
+def test_route_is_permutation_with_matching_length(start):
+    rng = random.Random(11)
+    lat = np.array([rng.uniform(55.6, 55.9) for _ in range(60)])
+    lon = np.array([rng.uniform(37.4, 37.8) for _ in range(60)])
+    order, length = plan_route(lat, lon, start=start)
+    assert sorted(order) == list(range(60))
+    assert length == pytest.approx(path_km(lat, lon, order, start))
+
+
+def test_too_many_places():
+    lat = np.zeros(MAX_ROUTE_PLACES + 1)
+    with pytest.raises(ValueError):
+        plan_route(lat, lat)
@@ -0,0 +1,127 @@
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import tile_cache
+from tile_cache import TileCache
+
+
+class TileSource(BaseHTTPRequestHandler):
+    """Тайлы-заглушки: тело — «z/x/y» до размера size; /broken/... обрывает ответ."""
+
+    size = 1000
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        z, x, y = self.path.rsplit(".", 1)[0].split("/")[-3:]
+        body = f"{z}/{x}/{y}".encode().ljust(self.size, b".")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        # Обрыв: объявлено больше, чем отправлено
+        self.send_header("Content-Length", str(len(body) + (100 if self.path.startswith("/broken/") else 0)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def source():
+    server = ThreadingHTTPServer(("localhost", 0), TileSource)
+    server.requests = []
+    server.url = f"http://localhost:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(upstream, **options):
+        cache = TileCache(str(tmp_path / "tiles.mbtiles"), upstream, **options)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def usage_bytes(cache):
+    return cache.conn.execute("SELECT coalesce(sum(size), 0) FROM tile_usage").fetchone()[0]
+
+
+def test_miss_fetches_once_then_hits(source, make_cache):
+    cache = make_cache(source.url + "/{z}/{x}/{y}.png")
+    data = cache.get(3, 2, 5)
+    assert data.startswith(b"3/2/5")
+    assert cache.get(3, 2, 5) == data
+    assert source.requests == ["/3/2/5.png"]
+    assert cache.has(3, 2, 5) and not cache.has(3, 2, 4)
+    # В MBTiles строка в схеме TMS
+    assert cache.conn.execute("SELECT tile_row FROM tiles").fetchone() == (2,)
+    assert cache.stats()["bytes"] == usage_bytes(cache) == len(data)
+
+
+def test_invalid_tile_is_not_fetched(source, make_cache):
+    cache = make_cache(source.url + "/{z}/{x}/{y}.png")
+    assert cache.get(2, 4, 0) is None
+    assert cache.get(23, 0, 0) is None
+    assert source.requests == []
+
+
+def test_offline_serves_cached_tiles_only(source, make_cache):
+    cache = make_cache(source.url + "/{z}/{x}/{y}.png")
+    cached = cache.get(5, 1, 1)
+    source.shutdown()
+    source.server_close()
+    assert cache.get(5, 1, 1) == cached
+    assert cache.get(5, 1, 2) is None
+
+
+def test_truncated_response_counts_as_unavailable(source, make_cache):
+    cache = make_cache(source.url + "/broken/{z}/{x}/{y}.png")
+    assert cache.get(4, 1, 1) is None
+    assert not cache.has(4, 1, 1)
+    assert cache.seed(37.6, 55.7, 37.61, 55.71, 4, 4) == (0, 1)
+
+
+def test_lru_eviction_by_bytes(make_cache, monkeypatch):
+    clock = itertools.count(1000, 100)
+    monkeypatch.setattr(tile_cache.time, "time", lambda: float(next(clock)))
+    cache = make_cache(None, max_bytes=3000)
+    tile = b"x" * 1000
+    for x in range(3):
+        cache.put(4, x, 0, tile)
+    cache.get(4, 0, 0)  # Первый тайл использован последним
+    cache.put(4, 3, 0, tile)
+    # Превышение: вытесняются давние тайлы, пока не останется не больше 90% лимита
+    assert [x for x in range(4) if cache.has(4, x, 0)] == [0, 3]
+    assert cache.stats()["bytes"] == usage_bytes(cache) == 2000
+
+
+def test_replacing_tile_keeps_byte_count(make_cache):
+    cache = make_cache(None)
+    cache.put(2, 1, 1, b"a" * 300)
+    cache.put(2, 1, 1, b"b" * 100)
+    assert cache.stats()["bytes"] == usage_bytes(cache) == 100
+
+
+def test_foreign_tiles_enter_byte_count(make_cache):
+    cache = make_cache(None, max_bytes=10_000)
+    # Тайл, записанный в MBTiles другой программой, без строки учёта
+    with cache.conn:
+        cache.conn.execute("INSERT INTO tiles VALUES (1, 0, 0, ?)", (b"z" * 700,))
+    assert cache.get(1, 0, 1) == b"z" * 700
+    assert cache.stats()["bytes"] == usage_bytes(cache) == 700
+    cache.get(1, 0, 1)
+    assert cache.stats()["bytes"] == 700
+    reopened = make_cache(None)
+    assert reopened.stats()["bytes"] == 700
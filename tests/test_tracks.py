@@ -0,0 +1,108 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import tracks
+from location_store import Location
+from tracks import Geofences, TrackVisit, detect_visits
+
+A = Location(1, "Красная площадь", "", 55.7539, 37.6208, 5.0)
+B = Location(2, "Парк Горького", "", 55.7299, 37.6036, 4.8)
+FAR = (55.70, 37.50)
+START = datetime(2024, 5, 1, 10, tzinfo=timezone.utc).timestamp()
+
+# Два сегмента: в A 90 с подряд, в B 20 с в конце первого сегмента и 30 с в начале второго.
+# Разрыв между сегментами в B не засчитывается, поэтому B не набирает MIN_DWELL_S.
+SEGMENTS = [
+    [(A, 0), (A, 30), (A, 60), (A, 90), (FAR, 120), (B, 150), (B, 170)],
+    [(B, 1000), (B, 1030), (FAR, 1060)],
+]
+EXPECTED = [TrackVisit(A.id, START, 90.0)]
+
+
+def coordinates(point):
+    return (point.latitude, point.longitude) if isinstance(point, Location) else point
+
+
+def iso(offset):
+    return datetime.fromtimestamp(START + offset, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def write_gpx(path, segments):
+    parts = ['<?xml version="1.0"?>\n<gpx version="1.1"><trk>']
+    for segment in segments:
+        parts.append("<trkseg>")
+        for point, offset in segment:
+            lat, lon = coordinates(point)
+            parts.append(f'<trkpt lat="{lat}" lon="{lon}"><ele>150</ele><time>{iso(offset)}</time></trkpt>')
+        parts.append("</trkseg>")
+    parts.append("</trk></gpx>")
+    path.write_text("\n".join(parts))
+    return str(path)
+
+
+def write_geojson(path, segments):
+    lines = [[[coordinates(point)[1], coordinates(point)[0]] for point, _ in segment] for segment in segments]
+    times = [[iso(offset) for _, offset in segment] for segment in segments]
+    feature = {
+        "type": "Feature",
+        "geometry": {"type": "MultiLineString", "coordinates": lines},
+        "properties": {"coordTimes": times},
+    }
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    return str(path)
+
+
+@pytest.fixture
+def fences():
+    return Geofences([A, B])
+
+
+def test_geofence_picks_closest_place_in_radius(fences):
+    lat = [A.latitude, B.latitude, FAR[0], A.latitude + 0.0008]
+    lon = [A.longitude, B.longitude, FAR[1], A.longitude]
+    assert fences.match(lat, lon).tolist() == [A.id, B.id, 0, A.id]
+    assert fences.match([A.latitude + 0.001], [A.longitude]).tolist() == [0]  # ~111 м
+
+
+def test_gpx_dwell_and_segment_breaks(tmp_path, fences):
+    path = write_gpx(tmp_path / "walk.gpx", SEGMENTS)
+    assert detect_visits([path], fences, workers=1) == EXPECTED
+
+
+def test_gpx_chunks_join_to_same_result(tmp_path, fences, monkeypatch):
+    path = write_gpx(tmp_path / "walk.gpx", SEGMENTS)
+    ranges = tracks.gpx_ranges
+    # Каждая точка — отдельный кусок: всё пребывание складывается из интервалов на стыках
+    monkeypatch.setattr(tracks, "gpx_ranges", lambda path: ranges(path, chunk_bytes=1))
+    assert len(ranges(path, chunk_bytes=1)) == sum(map(len, SEGMENTS))
+    assert detect_visits([path], fences, workers=1) == EXPECTED
+    assert detect_visits([path], fences, workers=2) == EXPECTED
+
+
+def test_geojson_chunks_join_to_same_result(tmp_path, fences, monkeypatch):
+    path = write_geojson(tmp_path / "walk.geojson", SEGMENTS)
+    assert detect_visits([path], fences, workers=1) == EXPECTED
+    for chunk in (1, 2, 3):
+        monkeypatch.setattr(tracks, "CHUNK_POINTS", chunk)
+        assert detect_visits([path], fences, workers=1) == EXPECTED
+
+
+def test_files_add_up_without_the_gap_between_them(tmp_path, fences):
+    # Пребывание в файлах складывается, а стык между файлами — не интервал внутри сегмента
+    first = write_gpx(tmp_path / "1.gpx", [[(A, 0), (A, 40)]])
+    second = write_gpx(tmp_path / "2.gpx", [[(A, 50), (A, 90)]])
+    assert detect_visits([first, second], fences, workers=1) == [TrackVisit(A.id, START, 80.0)]
+    assert detect_visits([first], fences, workers=1) == []
+
+
+def test_points_without_time_count_by_presence(tmp_path, fences):
+    feature = {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[FAR[1], FAR[0]], [B.longitude, B.latitude]]},
+        "properties": {},
+    }
+    path = tmp_path / "untimed.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    assert detect_visits([str(path)], fences, workers=1) == [TrackVisit(B.id, None, 0.0)]
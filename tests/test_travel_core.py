@@ -0,0 +1,27 @@
+import pytest
+
+from travel_core import TravelCore
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = TravelCore(str(tmp_path / "locations.db"), friends_data={})
+    yield core
+    core.close()
+
+
+def test_visit_place_returns_location_once(core):
+    place = core.visit_place(3)
+    assert place.id == 3
+    assert core.visit_place(3) is None
+    assert core.visited_places == {3}
+    assert core.progress() == pytest.approx(100 / core.total_places)
+
+
+def test_unknown_place_is_rejected_without_changes(core):
+    core.visit_place(3)
+    with pytest.raises(ValueError):
+        core.visit_place(999)
+    assert core.visited_places == {3}
+    assert core.progress() == pytest.approx(100 / core.total_places)
+    assert core.visits.visited("Я").tolist() == [3]
@@ -0,0 +1,172 @@
+import math
+import struct
+
+import pytest
+
+from clustering import project
+from location_store import Location
+from vector_tiles import BUFFER, EXTENT, LAYER_NAME, MAX_TILE_ZOOM, VectorTileCache
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, offset
+
+
+def fields(data):
+    """Поля сообщения protobuf: список (номер, значение); для wire type 2 — байты."""
+    result, offset = [], 0
+    while offset < len(data):
+        key, offset = read_varint(data, offset)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, offset = read_varint(data, offset)
+        elif wire == 1:
+            value, offset = data[offset:offset + 8], offset + 8
+        elif wire == 2:
+            length, offset = read_varint(data, offset)
+            value, offset = data[offset:offset + length], offset + length
+        else:
+            raise AssertionError(f"неожиданный wire type {wire}")
+        result.append((number, value))
+    return result
+
+
+def packed(data):
+    values, offset = [], 0
+    while offset < len(data):
+        value, offset = read_varint(data, offset)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    [(number, value)] = fields(data)
+    return struct.unpack("<d", value)[0] if number == 3 else value
+
+
+def decode(tile):
+    """Слой тайла: имя, extent, версия и точки {id: ((x, y), свойства)}."""
+    [(number, layer)] = fields(tile)
+    assert number == 3
+    layer = fields(layer)
+    keys = [value.decode() for number, value in layer if number == 3]
+    values = [decode_value(value) for number, value in layer if number == 4]
+    points = {}
+    for number, feature in layer:
+        if number != 2:
+            continue
+        feature = dict(fields(feature))
+        assert feature[3] == 1  # POINT
+        command, x, y = packed(feature[4])
+        assert command == (1 << 3) | 1  # MoveTo, одна точка
+        tags = packed(feature[2])
+        properties = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+        points[feature[1]] = ((unzigzag(x), unzigzag(y)), properties)
+    meta = {number: value for number, value in layer if number in (1, 5, 15)}
+    return meta[1].decode(), meta[5], meta[15], points
+
+
+def place(place_id, lat, lon, rating=4.0):
+    return Location(place_id, f"Место {place_id}", "", lat, lon, rating)
+
+
+def tile_of(lat, lon, zoom):
+    x, y = project(lat, lon)
+    n = 1 << zoom
+    return int(x * n), int(y * n)
+
+
+def pixel(lat, lon, z, tx, ty):
+    x, y = project(lat, lon)
+    n = 1 << z
+    return math.floor((float(x) * n - tx) * EXTENT), math.floor((float(y) * n - ty) * EXTENT)
+
+
+MOSCOW = place(1, 55.7539, 37.6208, 5.0)
+SPB = place(2, 59.9386, 30.3141, 4.5)
+
+
+def test_tile_round_trip():
+    cache = VectorTileCache([MOSCOW, SPB], visited={2})
+    z = 12
+    tx, ty = tile_of(MOSCOW.latitude, MOSCOW.longitude, z)
+    name, extent, version, points = decode(cache.get(z, tx, ty).data)
+    assert (name, extent, version) == (LAYER_NAME, EXTENT, 2)
+    assert points == {1: (pixel(MOSCOW.latitude, MOSCOW.longitude, z, tx, ty), {"rating": 5.0, "visited": 0})}
+    tx, ty = tile_of(SPB.latitude, SPB.longitude, z)
+    assert decode(cache.get(z, tx, ty).data)[3] == {
+        2: (pixel(SPB.latitude, SPB.longitude, z, tx, ty), {"rating": 4.5, "visited": 1}),
+    }
+
+
+def test_nearby_places_merge_into_one_point():
+    places = [place(7, 55.75, 37.62, 4.0), place(3, 55.75001, 37.62001, 5.0), place(9, 55.7501, 37.6201, 3.0)]
+    cache = VectorTileCache(places, visited={9})
+    tx, ty = tile_of(55.75, 37.62, 3)
+    [(place_id, (_, properties))] = decode(cache.get(3, tx, ty).data)[3].items()
+    # Точка — место с меньшим id, рейтинг средний, visited — сколько посещено
+    assert place_id == 3
+    assert properties == {"count": 3, "rating": 4.0, "visited": 1}
+    assert len(decode(cache.get(MAX_TILE_ZOOM - 6, *tile_of(55.75, 37.62, MAX_TILE_ZOOM - 6)).data)[3]) >= 2
+
+
+def test_buffer_puts_place_into_neighbour_with_negative_coordinate():
+    z = 10
+    n = 1 << z
+    # Место чуть левее левого края тайла попадает в его поле с отрицательной x
+    tx, ty = tile_of(55.75, 37.62, z)
+    edge_lon = tx / n * 360 - 180
+    lat = 55.75
+    left_of_edge = place(5, lat, edge_lon - 1e-4)
+    cache = VectorTileCache([left_of_edge])
+    points = decode(cache.get(z, tx, ty).data)[3]
+    (x, y), _ = points[5]
+    assert -BUFFER <= x < 0
+    assert (x, y) == pixel(lat, left_of_edge.longitude, z, tx, ty)
+    assert cache.get(z, tx + 2, ty).data == b""
+
+
+def test_record_visit_invalidates_covering_tiles_only():
+    cache = VectorTileCache([MOSCOW, SPB])
+    z = 9
+    moscow_tile = (z, *tile_of(MOSCOW.latitude, MOSCOW.longitude, z))
+    spb_tile = (z, *tile_of(SPB.latitude, SPB.longitude, z))
+    before = cache.get(*moscow_tile)
+    spb = cache.get(*spb_tile)
+    assert cache.get(*moscow_tile) is before
+    cache.record_visit(1)
+    after = cache.get(*moscow_tile)
+    assert after is not before and after.etag != before.etag
+    assert decode(after.data)[3][1][1]["visited"] == 1
+    assert cache.get(*spb_tile) is spb
+
+
+def test_invalid_and_empty_tiles():
+    cache = VectorTileCache([MOSCOW])
+    assert cache.get(-1, 0, 0) is None
+    assert cache.get(2, 4, 0) is None
+    assert cache.get(MAX_TILE_ZOOM + 1, 0, 0) is None
+    assert cache.get(5, 0, 0).data == b""
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_prebuild_is_capped_at_capacity(workers):
+    places = [place(i + 1, 50 + i * 0.37 % 10, 30 + i * 0.73 % 20) for i in range(200)]
+    cache = VectorTileCache(places, capacity=40)
+    built = cache.prebuild(0, 8, workers=workers)
+    assert built == 40
+    assert cache.stats()["tiles"] == 40
+    # Собраны мелкие уровни: тайл нулевого уровня берётся из кэша, а не собирается заново
+    assert len(decode(cache.get(0, 0, 0).data)[3]) > 0
+    assert cache.stats()["tiles"] == 40
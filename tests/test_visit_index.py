@@ -0,0 +1,166 @@
+import random
+
+import pytest
+
+from visit_index import Leaderboard, VisitIndex
+from visits_bitset import VisitMatrix
+
+
+def reference(seed, users=30, places=150, visits=800):
+    rng = random.Random(seed)
+    events = [(f"user{rng.randrange(users)}", rng.randint(1, places)) for _ in range(visits)]
+    return rng, events
+
+
+def check_leaderboard(index, sets):
+    counts = {name: len(places) for name, places in sets.items()}
+    for name, count in counts.items():
+        assert index.rank(name) == 1 + sum(other > count for other in counts.values())
+    top = index.top(len(counts) + 5)
+    assert sorted(top) == sorted(counts.items())
+    assert [count for _, count in top] == sorted(counts.values(), reverse=True)
+    assert index.top(3) == top[:3]
+
+
+def test_leaderboard_ties_keep_arrival_order():
+    board = Leaderboard(10)
+    for row in range(4):
+        board.insert(row, 0)
+    board.move(2, 0, 3)
+    board.move(0, 0, 3)
+    board.move(3, 0, 1)
+    assert board.top(10) == [(2, 3), (0, 3), (3, 1), (1, 0)]
+    assert [board.rank(count) for count in (3, 2, 1, 0)] == [1, 3, 3, 4]
+    assert board.top(2) == [(2, 3), (0, 3)]
+
+
+@pytest.mark.parametrize("batch", [1, 50])
+def test_move_many_matches_single_moves(batch):
+    # Маленький пакет двигает по одному, большой пересобирает дерево Фенвика
+    rng = random.Random(batch)
+    single, bulk = Leaderboard(64), Leaderboard(64)
+    counts = [0] * 20
+    for row in range(20):
+        single.insert(row, 0)
+        bulk.insert(row, 0)
+    for _ in range(10):
+        moves = []
+        for row in rng.sample(range(20), min(batch, 20)):
+            new = min(counts[row] + rng.randint(1, 4), 64)
+            if new != counts[row]:
+                moves.append((row, counts[row], new))
+                counts[row] = new
+        for move in moves:
+            single.move(*move)
+        bulk.move_many(moves)
+        assert bulk.top(20) == single.top(20)
+        assert bulk.levels == single.levels
+        assert [bulk.rank(count) for count in range(66)] == [single.rank(count) for count in range(66)]
+
+
+def test_visits_match_sets():
+    _, events = reference(1)
+    index = VisitIndex(VisitMatrix(150))
+    sets, order = {}, {}
+    for name, place in events:
+        added = index.visit(name, place)
+        places = sets.setdefault(name, set())
+        assert added == ([] if place in places else [place])
+        if place not in places:
+            places.add(place)
+            order.setdefault(place, []).append(name)
+    assert index.visit_many("user0", [1, 1, 2, 2]) == [p for p in (1, 2) if p not in sets["user0"]]
+    sets["user0"] |= {1, 2}
+    for place in (1, 2):
+        if "user0" not in order.get(place, []):
+            order.setdefault(place, []).append("user0")
+    check_leaderboard(index, sets)
+    for place in range(1, 151):
+        assert index.place_visitors(place) == order.get(place, [])
+    assert index.place_visitors(0) == [] and index.place_visitors(151) == []
+    assert index.rank("nobody") is None
+
+
+def test_place_visitors_pages():
+    index = VisitIndex(VisitMatrix(10))
+    names = [f"user{i}" for i in range(7)]
+    for name in names:
+        index.visit(name, 5)
+    assert index.place_visitors(5, offset=2, limit=3) == names[2:5]
+    assert index.place_visitors(5, offset=5, limit=10) == names[5:]
+    assert index.place_visitors(5, offset=10) == []
+    assert index.place_visitors(5, limit=0) == []
+
+
+def test_index_built_from_existing_matrix():
+    _, events = reference(2)
+    matrix = VisitMatrix(150)
+    sets = {}
+    for name, place in events:
+        matrix.add_user(name)
+        matrix.visit(name, place)
+        sets.setdefault(name, set()).add(place)
+    index = VisitIndex(matrix)
+    check_leaderboard(index, sets)
+    for place in range(1, 151):
+        # Строки посетителей при сборке идут по возрастанию
+        assert index.place_visitors(place) == [name for name in matrix.names if place in sets[name]]
+
+
+def test_visit_batch_matches_single_visits():
+    _, events = reference(3)
+    single, batch = VisitIndex(VisitMatrix(150)), VisitIndex(VisitMatrix(150))
+    for chunk in range(0, len(events), 200):
+        part = events[chunk:chunk + 200]
+        pairs = {(name, place) for name, place in part if single.visit(name, place)}
+        rows = [batch.add_user(name) for name, _ in part]
+        new_rows, new_places = batch.visit_batch(rows, [place for _, place in part])
+        got = [(batch.matrix.names[row], place) for row, place in zip(new_rows.tolist(), new_places.tolist())]
+        assert sorted(got) == sorted(pairs)
+        assert list(zip(new_rows.tolist(), new_places.tolist())) == sorted(zip(new_rows.tolist(), new_places.tolist()))
+    sets = {name: set(single.matrix.visited(name).tolist()) for name in single.matrix.names}
+    check_leaderboard(batch, sets)
+    for place in range(1, 151):
+        assert sorted(batch.place_visitors(place)) == sorted(single.place_visitors(place))
+    empty_rows, _ = batch.visit_batch(rows[:3], [place for _, place in part[:3]])
+    assert len(empty_rows) == 0
+
+
+def test_recommendations_order_and_cache():
+    index = VisitIndex(VisitMatrix(20))
+    index.visit_many("me", [1, 2])
+    index.visit_many("a", [1, 3, 4, 7])
+    index.visit_many("b", [2, 4, 7, 9])
+    index.visit_many("c", [7, 5])
+    friends = ["a", "b", "c", "me", "ghost"]
+    assert index.recommendations("me", friends) == [(7, 3), (4, 2), (3, 1), (5, 1), (9, 1)]
+    assert index.recommendations("me", friends, k=2) == [(7, 3), (4, 2)]
+    # Изменение своей строки или строки друга сбрасывает запись кэша
+    index.visit("me", 7)
+    assert index.recommendations("me", friends, k=2) == [(4, 2), (3, 1)]
+    index.visit("c", 3)
+    assert index.recommendations("me", friends, k=2) == [(3, 2), (4, 2)]
+    assert index.recommendations("me", ["a"]) == [(3, 1), (4, 1)]
+    assert index.recommendations("stranger", ["a"]) == [(1, 1), (3, 1), (4, 1), (7, 1)]
+    assert index.recommendations("me", []) == []
+
+
+def test_recommendations_match_brute_force():
+    rng, events = reference(4, users=40, places=400, visits=4000)
+    index = VisitIndex(VisitMatrix(400), cache_size=4)
+    sets = {}
+    for name, place in events:
+        index.visit(name, place)
+        sets.setdefault(name, set()).add(place)
+    names = sorted(sets)
+    for name in names[:10]:
+        friends = rng.sample(names, 15)
+        counts = {}
+        for friend in friends:
+            if friend != name:
+                for place in sets[friend] - sets[name]:
+                    counts[place] = counts.get(place, 0) + 1
+        expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        for k in (5, 150):
+            assert index.recommendations(name, friends, k=k) == expected[:k]
+    assert len(index._recommendations) == 4
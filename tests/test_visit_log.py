@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from visit_log import VisitLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def crash(db_path, script):
+    """Выполняет script с журналом log в отдельном процессе и обрывает его без close()."""
+    code = "import os\nfrom visit_log import VisitLog\n" + textwrap.dedent(script) + "\nos._exit(0)\n"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ, DB_PATH=db_path), check=True,
+                   timeout=60)
+
+
+def visited(matrix):
+    return {name: matrix.visited(name).tolist() for name in matrix.names}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "locations.db")
+
+
+def test_reopen_restores_visits(db_path):
+    log = VisitLog(db_path)
+    assert log.is_empty()
+    log.record_many("Аня", [3, 1])
+    log.record("Боря", 2)
+    log.record("Аня", 3)
+    log.close()
+    log = VisitLog(db_path)
+    assert not log.is_empty()
+    matrix = log.load(10)
+    assert visited(matrix) == {"Аня": [1, 3], "Боря": [2]}
+    assert matrix.place_popularity()[1:4].tolist() == [1, 1, 1]
+    log.close()
+
+
+def test_full_batch_is_written_in_background(db_path):
+    log = VisitLog(db_path, flush_interval=60, batch_size=10)
+    log.record_many("Аня", range(1, 11))
+    conn = sqlite3.connect(db_path)
+    deadline = time.monotonic() + 5
+    while conn.execute("SELECT count(*) FROM visit_events").fetchone()[0] < 10:
+        assert time.monotonic() < deadline, "пачка не записана"
+        time.sleep(0.01)
+    conn.close()
+    log.close()
+
+
+def test_crash_loses_only_unflushed_events(db_path):
+    crash(db_path, """
+        log = VisitLog(os.environ["DB_PATH"], flush_interval=60)
+        log.record_many("Аня", [1, 2, 3])
+        log.flush()
+        log.record("Боря", 4)
+    """)
+    log = VisitLog(db_path)
+    assert visited(log.load(10)) == {"Аня": [1, 2, 3]}
+    log.close()
+
+
+def test_crash_after_snapshot_replays_tail(db_path):
+    crash(db_path, """
+        log = VisitLog(os.environ["DB_PATH"], flush_interval=60, snapshot_every=3)
+        log.record_many("Аня", [1, 2, 3])
+        log.record_many("Боря", [2, 5])
+        log.load(10)  # хвост длиннее snapshot_every — пишется снимок
+        log.record_many("Вика", [7])
+        log.record_many("Аня", [8])
+        log.flush()
+        log.record_many("Гоша", [9])
+    """)
+    conn = sqlite3.connect(db_path)
+    (snapshot_seq,) = conn.execute("SELECT seq FROM visit_snapshot_meta").fetchone()
+    (last_seq,) = conn.execute("SELECT max(seq) FROM visit_events").fetchone()
+    assert (snapshot_seq, last_seq) == (5, 7)
+    conn.close()
+    log = VisitLog(db_path, snapshot_every=100)
+    matrix = log.load(10)
+    expected = {"Аня": [1, 2, 3, 8], "Боря": [2, 5], "Вика": [7]}
+    assert visited(matrix) == expected
+    assert matrix.place_popularity()[1:10].tolist() == [1, 2, 1, 0, 1, 0, 1, 1, 0]
+    assert log.tail == 2
+    log.close()
+    # Без снимка журнал проигрывается целиком с тем же результатом
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM visit_snapshot")
+        conn.execute("DELETE FROM visit_snapshot_meta")
+    conn.close()
+    log = VisitLog(db_path)
+    assert visited(log.load(10)) == expected
+    log.close()
+
+
+def test_remap_places_keeps_seqs(db_path):
+    log = VisitLog(db_path, snapshot_every=1)
+    log.record_many("Аня", [1, 2, 3])
+    log.load(10)  # снимок со старыми id сбрасывается при замене каталога
+    log.remap_places({1: 2, 2: 1})
+    assert visited(log.load(10)) == {"Аня": [1, 2]}
+    seqs, names, rows, places = log.events_since(0)
+    assert (seqs.tolist(), names, rows.tolist(), places.tolist()) == ([1, 2], ["Аня"], [0, 0], [2, 1])
+    log.record("Боря", 3)
+    assert log.last_seq() == 4
+    log.close()
+
+
+def test_events_since(db_path):
+    log = VisitLog(db_path)
+    log.record_many("Аня", [5, 6])
+    log.record("Боря", 5)
+    seqs, names, rows, places = log.events_since(1)
+    assert (seqs.tolist(), names, rows.tolist(), places.tolist()) == ([2, 3], ["Аня", "Боря"], [0, 1], [6, 5])
+    log.close()
+
+
+def test_places_beyond_catalogue_are_skipped(db_path):
+    log = VisitLog(db_path)
+    log.record_many("Аня", [2, 50])
+    assert visited(log.load(10)) == {"Аня": [2]}
+    log.close()
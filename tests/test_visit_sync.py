@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from visit_index import VisitIndex
+from visit_sync import DEVICE_BYTES, DeltaReader, encode_delta, load_delta, merge_delta
+from visits_bitset import VisitMatrix
+
+A, B = b"A" * DEVICE_BYTES, b"B" * DEVICE_BYTES
+NAMES = ["Аня", "Боря", "Вика", "Гоша"]
+
+
+def random_events(seed, events=500, places=300):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, len(NAMES), events), rng.integers(1, places + 1, events)
+
+
+def pairs(reader):
+    return {(reader.names[row], place) for row, place in zip(reader.rows().tolist(), reader.places().tolist())}
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(compress):
+    rows, places = random_events(1)
+    data = encode_delta(A, 10, 510, NAMES, rows, places, {B: 7}, compress=compress)
+    reader = DeltaReader(data)
+    assert (reader.device, reader.base, reader.until, reader.versions) == (A, 10, 510, {B: 7})
+    # Повторы событий схлопываются, пользователи без событий не передаются
+    expected = {(NAMES[row], place) for row, place in zip(rows.tolist(), places.tolist())}
+    assert pairs(reader) == expected
+    assert len(reader) == len(expected)
+    assert set(reader.names) == {name for name, _ in expected}
+
+
+def test_empty_delta():
+    reader = DeltaReader(encode_delta(A, 5, 5, NAMES, [], []))
+    assert (reader.names, len(reader), reader.places().tolist()) == ([], 0, [])
+
+
+def test_load_delta_rejects_damaged_files(tmp_path):
+    data = encode_delta(A, 0, 500, NAMES, *random_events(2))
+    path = tmp_path / "friend.tvsd"
+    path.write_bytes(data)
+    assert pairs(load_delta(str(path))) == pairs(DeltaReader(data))
+    for damaged in (data[:20], data[:-5], b"XXXX" + data[4:]):
+        path.write_bytes(damaged)
+        with pytest.raises(ValueError):
+            load_delta(str(path))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_reader_does_not_hold_buffer(compress):
+    data = encode_delta(A, 0, 500, NAMES, *random_events(5), versions={B: 7}, compress=compress)
+    expected = pairs(DeltaReader(data))
+    buffer = bytearray(data)
+    reader = DeltaReader(buffer)
+    # Изменить размер bytearray нельзя, пока на него есть представления
+    buffer.clear()
+    assert pairs(reader) == expected
+    assert reader.versions == {B: 7}
+
+
+def index_with(num_places=300):
+    return VisitIndex(VisitMatrix(num_places))
+
+
+def test_merge_is_idempotent_and_commutative():
+    first = DeltaReader(encode_delta(A, 0, 500, NAMES, *random_events(3)))
+    second = DeltaReader(encode_delta(B, 0, 500, NAMES, *random_events(4)))
+    place_ids = np.arange(1, 301)
+    one, other = index_with(), index_with()
+    added = merge_delta(one, first, place_ids)
+    assert sum(map(len, added.values())) == len(first)
+    merge_delta(one, second, place_ids)
+    assert merge_delta(one, first, place_ids) == {}
+    assert merge_delta(one, second, place_ids) == {}
+    merge_delta(other, second, place_ids)
+    merge_delta(other, first, place_ids)
+    for name in NAMES:
+        assert one.matrix.visited(name).tolist() == other.matrix.visited(name).tolist()
+    assert one.top(10) == other.top(10)
+
+
+def test_merge_skips_places_outside_catalogue_and_renames():
+    reader = DeltaReader(encode_delta(A, 0, 3, ["Аня", "Боря"], [0, 0, 1], [2, 7, 4]))
+    index = index_with(10)
+    added = merge_delta(index, reader, np.array([1, 2, 4, 5]), rename={"Аня": "Я"})
+    assert {name: places.tolist() for name, places in added.items()} == {"Я": [2], "Боря": [4]}
+
+
+@pytest.fixture
+def device(tmp_path):
+    """Фабрика устройств: TravelCore со своей базой и без встроенных друзей."""
+    from travel_core import TravelCore
+
+    cores = []
+
+    def make(name):
+        core = TravelCore(str(tmp_path / f"{name}.db"), friends_data={})
+        core.sync.user = name
+        cores.append(core)
+        return core
+
+    yield make
+    for core in cores:
+        core.close()
+
+
+def test_devices_exchange_without_echo(device):
+    anya, borya = device("Аня"), device("Боря")
+    for place in (1, 2, 3):
+        anya.visit_place(place)
+    added = borya.import_progress(DeltaReader(anya.export_progress(borya.sync.device)))
+    assert {name: places.tolist() for name, places in added.items()} == {"Аня": [1, 2, 3]}
+    # Повтор той же дельты ничего не добавляет
+    assert borya.import_progress(DeltaReader(anya.export_progress(borya.sync.device, full=True))) == {}
+
+    # Пришедшее от Ани ей не возвращается, уходят только свои посещения Бори
+    borya.visit_place(5)
+    reply = DeltaReader(borya.export_progress(anya.sync.device))
+    assert pairs(reply) == {("Боря", 5)}
+    added = anya.import_progress(reply)
+    assert {name: places.tolist() for name, places in added.items()} == {"Боря": [5]}
+
+    # Вектор версий в ответе сообщил Ане, что у Бори уже есть: следующая дельта — только новое
+    anya.visit_place(4)
+    assert pairs(DeltaReader(anya.export_progress(borya.sync.device))) == {("Аня", 4)}
+
+
+def test_jobs_run_in_another_thread(device, tmp_path):
+    # Приложение выполняет export_job и import_job в пуле потоков, а apply_import — в GUI-потоке
+    anya, borya = device("Аня"), device("Боря")
+    for place in (1, 2, 3):
+        anya.visit_place(place)
+    borya.visit_place(2)
+    path, missing = tmp_path / "anya.tvsd", str(tmp_path / "missing.tvsd")
+    with ThreadPoolExecutor(1) as pool:
+        path.write_bytes(pool.submit(anya.export_job(borya.sync.device)).result())
+        loaded, errors = pool.submit(borya.import_job([str(path), missing])).result()
+        [(reader, events)] = loaded
+        assert [error_path for error_path, _ in errors] == [missing]
+        added = borya.apply_import(reader, events)
+        assert {name: places.tolist() for name, places in added.items()} == {"Аня": [1, 2, 3]}
+        assert borya.sync.received(anya.sync.device) == reader.until
+
+        reply = pool.submit(borya.export_job(anya.sync.device)).result()
+        assert pairs(DeltaReader(reply)) == {("Боря", 2)}
+        path.write_bytes(reply)
+        [(reader, events)], _ = pool.submit(borya.import_job([str(path)])).result()
+        assert borya.apply_import(reader, events) == {}
+
+
+def test_gapped_delta_merges_but_keeps_version(device):
+    anya, borya = device("Аня"), device("Боря")
+    anya.visit_place(1)
+    full = DeltaReader(anya.export_progress(borya.sync.device))
+    anya.visit_place(2)
+    # Дельта с пропуском: начинается после первого события, которого у Бори ещё нет
+    seqs, names, rows, places = anya.visit_log.events_since(full.until)
+    gapped = DeltaReader(encode_delta(anya.sync.device, full.until, int(seqs[-1]), ["Аня"], rows, places))
+    added = borya.import_progress(gapped)
+    assert {name: places.tolist() for name, places in added.items()} == {"Аня": [2]}
+    assert borya.sync.received(anya.sync.device) == 0
+    borya.import_progress(full)
+    assert borya.sync.received(anya.sync.device) == full.until
+    assert borya.visits.visited("Аня").tolist() == [1, 2]
@@ -0,0 +1,85 @@
+import random
+
+import numpy as np
+import pytest
+
+from visits_bitset import VisitMatrix, popcount
+
+
+def reference(seed, users=40, places=200, visits=1500):
+    rng = random.Random(seed)
+    sets = {f"user{i}": set() for i in range(users)}
+    for _ in range(visits):
+        sets[f"user{rng.randrange(users)}"].add(rng.randint(1, places))
+    return sets
+
+
+def test_popcount():
+    words = np.array([[0, 1, 2 ** 64 - 1], [3, 0, 1 << 63]], dtype=np.uint64)
+    assert popcount(words).tolist() == [65, 3]
+
+
+def test_matches_sets():
+    sets = reference(1)
+    matrix = VisitMatrix(200)
+    # Больше 16 пользователей — строки растут; повторы посещений не меняют счётчики
+    for name, places in sets.items():
+        matrix.add_user(name, sorted(places))
+        matrix.visit_many(name, list(places)[:5])
+    for name, places in sets.items():
+        assert matrix.visited(name).tolist() == sorted(places)
+        assert matrix.count(name) == len(places)
+        assert all(matrix.has_visited(name, place) == (place in places) for place in (1, 63, 64, 65, 128, 200))
+    assert matrix.counts().tolist() == [len(places) for places in sets.values()]
+    popularity = matrix.place_popularity()
+    assert popularity[0] == 0
+    assert popularity[1:].tolist() == [sum(place in s for s in sets.values()) for place in range(1, 201)]
+    assert matrix.common("user1", "user2").tolist() == sorted(sets["user1"] & sets["user2"])
+    rows = [[0, 1], [2, 3], [5, 5]]
+    names = list(sets)
+    assert matrix.common_counts(rows).tolist() == [len(sets[names[a]] & sets[names[b]]) for a, b in rows]
+
+
+def test_unknown_user_and_range_checks():
+    matrix = VisitMatrix(100)
+    assert matrix.visited("никто").tolist() == []
+    assert matrix.count("никто") == 0
+    assert not matrix.has_visited("никто", 5)
+    with pytest.raises(ValueError):
+        matrix.visit("Аня", 101)
+    with pytest.raises(ValueError):
+        matrix.visit("Аня", 0)
+    assert matrix.count("Аня") == 0
+
+
+def test_batch_deduplicates():
+    matrix = VisitMatrix(100)
+    a, b = matrix.add_user("Аня"), matrix.add_user("Боря")
+    matrix.visit_batch([a, a, b, a], [7, 7, 7, 64])
+    matrix.visit_batch([a], [7])
+    assert matrix.counts().tolist() == [2, 1]
+    assert matrix.place_popularity()[[7, 64]].tolist() == [2, 1]
+
+
+def test_rankings_break_ties_by_order():
+    matrix = VisitMatrix(10, {"Аня": [1, 2], "Боря": [2, 3, 4], "Вика": [5, 6], "Гоша": [2]})
+    assert matrix.leaderboard(3) == [("Боря", 3), ("Аня", 2), ("Вика", 2)]
+    assert matrix.most_visited(3) == [(2, 3), (1, 1), (3, 1)]
+    assert VisitMatrix(10).leaderboard() == []
+
+
+def test_from_bits_and_resized():
+    sets = reference(2, users=5, places=130)
+    matrix = VisitMatrix(130, {name: sorted(places) for name, places in sets.items()})
+    # Снимок на больше мест обрезается: биты за num_places сбрасываются
+    copy = VisitMatrix.from_bits(100, matrix.names, matrix._rows())
+    for name, places in sets.items():
+        assert copy.visited(name).tolist() == sorted(place for place in places if place <= 100)
+        assert copy.count(name) == sum(place <= 100 for place in places)
+    assert copy.place_popularity().tolist() == matrix.place_popularity()[:101].tolist()
+    smaller = matrix.resized(100)
+    assert smaller.counts().tolist() == copy.counts().tolist()
+    wider = VisitMatrix.from_bits(300, matrix.names, matrix._rows(), matrix.place_counts)
+    assert wider.place_popularity()[:131].tolist() == matrix.place_popularity().tolist()
+    wider.visit("user0", 300)
+    assert wider.visited("user0")[-1] == 300
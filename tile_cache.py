@@ -0,0 +1,331 @@
+"""Офлайн-кэш тайлов карты в MBTiles и локальные копии JS/CSS, которые подключает карта.
+
+    python tile_cache.py seed --bbox 37.3,55.5,37.9,56.0 --zoom 10-14
+    python tile_cache.py vendor
+    python tile_cache.py stats
+"""
+import argparse
+import http.client
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+TILES_PATH = "tiles.mbtiles"
+UPSTREAM_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+# Правила OSM требуют узнаваемый User-Agent
+USER_AGENT = "travelmap-tile-cache/1.0"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Время последнего обращения обновляется не чаще, чем раз в эту паузу — чтение не должно писать
+TOUCH_INTERVAL = 60
+MAX_SEED_TILES = 100_000
+# Источник недоступен: сеть и HTTP-ошибки — OSError, оборванный или кривой ответ — HTTPException
+FETCH_ERRORS = (OSError, http.client.HTTPException)
+
+VENDOR_DIR = "vendor"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+-- Не входит в спецификацию MBTiles: учёт размера и последнего обращения для LRU
+CREATE TABLE IF NOT EXISTS tile_usage (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS tile_usage_last_used ON tile_usage (last_used);
+"""
+
+
+def tile_range(west, south, east, north, zoom):
+    """Диапазоны x и y тайлов (включительно), покрывающих прямоугольник."""
+    n = 1 << zoom
+
+    def to_tile(lat, lon):
+        lat = max(-85.05112878, min(85.05112878, lat))
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x0, y0 = to_tile(north, west)
+    x1, y1 = to_tile(south, east)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def fetch_url(url, timeout=10):
+    # urllib.request нужен только при скачивании — импортируем здесь
+    import urllib.request
+
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+class TileCache:
+    """Растровые тайлы в файле MBTiles с ограничением размера по LRU.
+
+    При промахе тайл скачивается с upstream (шаблон URL с {z}/{x}/{y}); без сети
+    отдаются только уже сохранённые тайлы. Строки в MBTiles хранятся в схеме TMS,
+    наружу — в XYZ, как их запрашивает Leaflet.
+    """
+
+    def __init__(self, path=TILES_PATH, upstream=UPSTREAM_URL, max_bytes=MAX_CACHE_BYTES, fetch=fetch_url):
+        self.path = path
+        self.upstream = upstream
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+                [("name", "travelmap"), ("format", "png"), ("type", "baselayer"), ("version", "1.1")],
+            )
+        self.total_bytes = self.conn.execute("SELECT coalesce(sum(size), 0) FROM tile_usage").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def _read(self, z, x, y):
+        row = (1 << z) - 1 - y
+        with self._lock:
+            found = self.conn.execute(
+                "SELECT t.tile_data, u.last_used FROM tiles t LEFT JOIN tile_usage u "
+                "ON u.zoom_level = t.zoom_level AND u.tile_column = t.tile_column AND u.tile_row = t.tile_row "
+                "WHERE t.zoom_level = ? AND t.tile_column = ? AND t.tile_row = ?",
+                (z, x, row),
+            ).fetchone()
+            if found is None:
+                return None
+            data, last_used = found
+            now = time.time()
+            if last_used is None or now - last_used > TOUCH_INTERVAL:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)", (z, x, row, len(data), now)
+                    )
+                    if last_used is None:
+                        # Тайл без учёта (MBTiles, заполненный другой программой) входит в размер кэша
+                        self.total_bytes += len(data)
+                        if self.total_bytes > self.max_bytes:
+                            self._evict()
+            return data
+
+    def put(self, z, x, y, data):
+        self.put_many([(z, x, y, data)])
+
+    def put_many(self, tiles):
+        """Сохраняет тайлы одной транзакцией и вытесняет давно не использованные."""
+        now = time.time()
+        rows = [(z, x, (1 << z) - 1 - y, data) for z, x, y, data in tiles]
+        with self._lock, self.conn:
+            for z, x, row, data in rows:
+                old = self.conn.execute(
+                    "SELECT size FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (z, x, row),
+                ).fetchone()
+                self.total_bytes += len(data) - (old[0] if old else 0)
+            self.conn.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", rows)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)",
+                [(z, x, row, len(data), now) for z, x, row, data in rows],
+            )
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Освобождаем до 90% лимита, чтобы не вытеснять на каждой записи
+        target = self.max_bytes * 0.9
+        victims = []
+        for z, x, row, size in self.conn.execute(
+            "SELECT zoom_level, tile_column, tile_row, size FROM tile_usage ORDER BY last_used"
+        ):
+            if self.total_bytes <= target:
+                break
+            victims.append((z, x, row))
+            self.total_bytes -= size
+        self.conn.executemany(
+            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims
+        )
+        self.conn.executemany(
+            "DELETE FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims
+        )
+
+    def get(self, z, x, y):
+        """PNG тайла или None, если его нет в кэше и скачать не удалось."""
+        if not (0 <= z <= 22 and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return None
+        data = self._read(z, x, y)
+        if data is not None or not self.upstream:
+            return data
+        try:
+            data = self.fetch(self.upstream.format(z=z, x=x, y=y))
+        except FETCH_ERRORS:
+            return None
+        self.put(z, x, y, data)
+        return data
+
+    def has(self, z, x, y):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (1 << z) - 1 - y),
+            ).fetchone() is not None
+
+    def seed(self, west, south, east, north, min_zoom, max_zoom, workers=4, batch=200):
+        """Заранее скачивает все отсутствующие тайлы прямоугольника; возвращает (скачано, ошибок)."""
+        missing = [
+            (z, x, y)
+            for z in range(min_zoom, max_zoom + 1)
+            for xs, ys in [tile_range(west, south, east, north, z)]
+            for x in xs
+            for y in ys
+            if not self.has(z, x, y)
+        ]
+        if len(missing) > MAX_SEED_TILES:
+            raise ValueError(f"Слишком много тайлов для загрузки: {len(missing)} > {MAX_SEED_TILES}")
+
+        def download(tile):
+            z, x, y = tile
+            try:
+                return z, x, y, self.fetch(self.upstream.format(z=z, x=x, y=y))
+            except FETCH_ERRORS:
+                return None
+
+        fetched = failed = 0
+        pending = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(download, missing):
+                if result is None:
+                    failed += 1
+                    continue
+                pending.append(result)
+                fetched += 1
+                if len(pending) >= batch:
+                    self.put_many(pending)
+                    pending = []
+        if pending:
+            self.put_many(pending)
+        return fetched, failed
+
+    def stats(self):
+        with self._lock:
+            count = self.conn.execute("SELECT count(*) FROM tiles").fetchone()[0]
+        return {"tiles": count, "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+
+def _vendor_name(name, url):
+    return f"{VENDOR_DIR}/{name}/{os.path.basename(urlsplit(url).path)}"
+
+
+def vendor_assets(assets, root=".", fetch=fetch_url):
+    """Скачивает JS/CSS (пары (имя, url), как default_js у folium) в vendor/.
+
+    Ресурсы, на которые CSS ссылается через url(...) (шрифты, картинки), кладутся
+    рядом с файлом, а ссылки переписываются на локальные. Возвращает списки
+    сохранённых файлов и URL, которые скачать не удалось.
+    """
+    saved, failed = [], []
+    for name, url in assets:
+        local = os.path.join(root, _vendor_name(name, url))
+        try:
+            body = fetch(url)
+        except FETCH_ERRORS:
+            failed.append(url)
+            continue
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        if local.endswith(".css"):
+            body = _vendor_css(body.decode("utf-8"), url, os.path.dirname(local), fetch).encode("utf-8")
+        with open(local, "wb") as f:
+            f.write(body)
+        saved.append(local)
+    return saved, failed
+
+
+def _vendor_css(css, base_url, directory, fetch):
+    fetched = {}
+
+    def replace(match):
+        ref = match.group(1).strip("'\"")
+        if ref.startswith(("data:", "#")):
+            return match.group(0)
+        absolute = urljoin(base_url, ref)
+        filename = os.path.basename(urlsplit(absolute).path)
+        if filename not in fetched:
+            try:
+                with open(os.path.join(directory, filename), "wb") as f:
+                    f.write(fetch(absolute))
+            except FETCH_ERRORS:
+                return match.group(0)
+            fetched[filename] = True
+        suffix = urlsplit(ref).fragment
+        return f"url({filename}{'#' + suffix if suffix else ''})"
+
+    return re.sub(r"url\(([^)]+)\)", replace, css)
+
+
+def localize_assets(element, root="."):
+    """Подменяет CDN-ссылки элемента folium на скачанные в vendor/, если они есть."""
+    for attribute in ("default_js", "default_css"):
+        assets = getattr(element, attribute, None)
+        if assets:
+            setattr(element, attribute, [
+                (name, _vendor_name(name, url)) if os.path.exists(os.path.join(root, _vendor_name(name, url)))
+                else (name, url)
+                for name, url in assets
+            ])
+    return element
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш тайлов и локальные ресурсы карты.")
+    parser.add_argument("--db", default=TILES_PATH, help="файл MBTiles")
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help="шаблон URL источника тайлов")
+    parser.add_argument("--max-mb", type=int, default=MAX_CACHE_BYTES // (1024 * 1024))
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("seed", help="скачать тайлы прямоугольника заранее")
+    seed.add_argument("--bbox", required=True, help="west,south,east,north")
+    seed.add_argument("--zoom", required=True, help="диапазон масштабов, например 10-14")
+    seed.add_argument("--workers", type=int, default=4)
+    commands.add_parser("vendor", help="скачать JS/CSS Leaflet для map.html")
+    commands.add_parser("stats", help="размер кэша")
+    args = parser.parse_args()
+
+    if args.command == "vendor":
+        from map_renderer import LEAFLET_CSS, LEAFLET_JS
+        from map_server import STATIC_ROOT
+
+        saved, failed = vendor_assets([LEAFLET_JS, LEAFLET_CSS], STATIC_ROOT)
+        print(f"Сохранено файлов: {len(saved)} в {os.path.join(STATIC_ROOT, VENDOR_DIR)}")
+        for url in failed:
+            print(f"Не удалось скачать: {url}")
+        return
+
+    cache = TileCache(args.db, upstream=args.upstream, max_bytes=args.max_mb * 1024 * 1024)
+    if args.command == "seed":
+        west, south, east, north = (float(value) for value in args.bbox.split(","))
+        min_zoom, _, max_zoom = args.zoom.partition("-")
+        start = time.perf_counter()
+        fetched, failed = cache.seed(west, south, east, north, int(min_zoom), int(max_zoom or min_zoom), args.workers)
+        print(f"Скачано тайлов: {fetched}, ошибок: {failed}, за {time.perf_counter() - start:.1f} с")
+    stats = cache.stats()
+    print(f"В кэше {stats['tiles']} тайлов, {stats['bytes'] / 1024 / 1024:.1f} из {args.max_mb} МБ")
+
+
+if __name__ == "__main__":
+    main()
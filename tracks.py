@@ -0,0 +1,463 @@
+"""Посещения по записанным GPS-трекам: точки трека сверяются с геозонами мест.
+
+    python tracks.py day1.gpx day2.gpx walk.geojson --db locations.db --workers 8
+
+Геозона — круг радиуса GEOFENCE_RADIUS_M вокруг места. Место считается
+посещённым, если трек пробыл в его геозоне не меньше MIN_DWELL_S секунд
+(сумма интервалов между соседними точками одного сегмента внутри зоны);
+точки без времени засчитывают место самим попаданием в зону.
+
+* Треки читаются кусками по CHUNK_POINTS точек и не загружаются в память
+  целиком. GPX режется на диапазоны байт по началу <trkpt>, и каждый
+  диапазон разбирается регулярными выражениями прямо в процессе пула
+  (ElementTree тратит ~7 мкс на точку и не умеет начать с середины файла).
+  GeoJSON (LineString и MultiLineString, время в properties.coordTimes или
+  properties.times) читается потоково в главном процессе, куски точек
+  отдаются пулу.
+* Места лежат в сетке на единичной сфере с ячейкой в хорду радиуса, как
+  точки KD-дерева в routes: кандидаты для куска точек берутся из 27
+  соседних ячеек через searchsorted, расстояния считаются одним векторным
+  выражением, и точке достаётся ближайшее место в радиусе.
+* Куски обрабатываются пулом процессов, а результаты собираются в порядке
+  кусков; интервал на стыке соседних кусков досчитывается при сборке.
+  Поэтому итог не зависит ни от числа процессов, ни от порядка их работы.
+"""
+import argparse
+import math
+import mmap
+import multiprocessing
+import os
+import re
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import chain, islice
+
+import numpy as np
+
+from importer import read_features
+from instrumentation import traced
+from location_store import DB_PATH, EARTH_RADIUS_KM
+from routes import unit_vectors
+
+GEOFENCE_RADIUS_M = 100
+MIN_DWELL_S = 60
+CHUNK_POINTS = 1 << 16
+GPX_CHUNK_BYTES = 8 << 20  # ~65 тысяч точек GPX с высотой и временем
+
+# Посещение: id места, время первой точки в геозоне (unix, None без времени) и секунды в ней
+TrackVisit = namedtuple("TrackVisit", "place arrived dwell")
+# Итог куска: места с первой точкой в зоне (индекс в куске и время), пребыванием и
+# признаком точек без времени; первая и последняя точки куска (место, время) для
+# стыка; joined — кусок продолжает сегмент предыдущего, broken — после его
+# последней точки сегмент закончился
+ChunkResult = namedtuple("ChunkResult", "places first arrived dwell untimed head tail joined broken")
+
+# Префикс пространства имён у тегов GPX необязателен (<trkpt> и <gpx:trkpt>)
+_TAG = rb"<(?:[\w.-]+:)?"
+GPX_POINT_START = re.compile(_TAG + rb"trkpt[\s/>]")
+GPX_POINT = re.compile(_TAG + rb"trkpt\b([^>]*?)(?:/>|>([^<]*(?:<(?!/(?:[\w.-]+:)?trkpt\b)[^<]*)*)</(?:[\w.-]+:)?trkpt\s*>)")
+# Быстрый разбор: шаблон начинается с постоянной строки, и re ищет её без посимвольного перебора
+GPX_PLAIN_SEGMENT = re.compile(rb"</?trkseg\b")
+GPX_PLAIN_POINT = re.compile(rb'<trkpt\s+lat="([^"]*)"\s+lon="([^"]*)"\s*>(?:[^<]*<(?!time>|/trkpt>))*(?:[^<]*<time>([^<]*)</time>)?')
+GPX_SEGMENT = re.compile(rb"</?(?:[\w.-]+:)?trkseg\b")
+GPX_LAT = re.compile(rb"\blat\s*=\s*[\"']([^\"']*)")
+GPX_LON = re.compile(rb"\blon\s*=\s*[\"']([^\"']*)")
+GPX_TIME = re.compile(_TAG + rb"time>\s*([^<]*?)\s*<")
+# Позиции разделителей и цифр в «ГГГГ-ММ-ДДTчч:мм:сс»
+ISO_SEPARATORS = ((4, "-"), (7, "-"), (10, "T"), (13, ":"), (16, ":"))
+ISO_DIGITS = [column for column in range(19) if column not in dict(ISO_SEPARATORS)]
+
+
+def _ragged_range(starts, counts):
+    # Склеенные диапазоны [start, start + count) для всех пар одним массивом
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class Geofences:
+    """Геозоны мест: сетка по единичным векторам с ячейкой в хорду радиуса."""
+
+    def __init__(self, locations, radius_m=GEOFENCE_RADIUS_M):
+        locations = list(locations)
+        ids = np.fromiter((location.id for location in locations), dtype=np.int64, count=len(locations))
+        lat = np.fromiter((location.latitude for location in locations), dtype=np.float64, count=len(locations))
+        lon = np.fromiter((location.longitude for location in locations), dtype=np.float64, count=len(locations))
+        self.radius_m = radius_m
+        self.chord = 2 * math.sin(radius_m / 1000 / EARTH_RADIUS_KM / 2)
+        # Координаты единичного вектора от -1 до 1; запас в ячейку с каждой стороны
+        self.cells = int(2 / self.chord) + 3
+        if self.cells ** 3 >= 2 ** 63:
+            raise ValueError(f"Слишком маленький радиус геозоны: {radius_m} м")
+        vectors = unit_vectors(lat, lon)
+        keys = self._keys(vectors)
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.ids = keys[order], ids[order]
+        self.axes = [np.ascontiguousarray(vectors[order, axis]) for axis in range(3)]
+        steps = (-1, 0, 1)
+        self.neighbours = np.array([(dx * self.cells + dy) * self.cells + dz for dx in steps for dy in steps for dz in steps])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keys(self, vectors):
+        cell = np.floor((vectors + 1) / self.chord).astype(np.int64) + 1
+        return (cell[:, 0] * self.cells + cell[:, 1]) * self.cells + cell[:, 2]
+
+    def match(self, lat, lon):
+        """id ближайшего места в радиусе для каждой точки; 0 — точка вне геозон."""
+        points = unit_vectors(lat, lon).reshape(-1, 3)
+        result = np.zeros(len(points), dtype=np.int64)
+        if not len(points) or not len(self.ids):
+            return result
+        # Точки трека идут плотно: соседние ячейки ищутся один раз на ячейку, а не на точку
+        cells, inverse = np.unique(self._keys(points), return_inverse=True)
+        # Запросы по каждому соседу идут по возрастанию — так searchsorted быстрее
+        wanted = self.neighbours[:, None] + cells
+        low = np.searchsorted(self.keys, wanted.ravel(), "left").reshape(wanted.shape)
+        counts = np.searchsorted(self.keys, wanted.ravel(), "right").reshape(wanted.shape) - low
+        low, counts = low.T.ravel(), counts.T.ravel()
+        if not counts.any():
+            return result
+        # Кандидаты по ячейкам точек (места ячейки подряд), затем — по самим точкам
+        candidates = _ragged_range(low, counts)
+        per_cell = counts.reshape(len(cells), -1).sum(axis=1)
+        per_point = per_cell[inverse]
+        point = np.repeat(np.arange(len(points)), per_point)
+        place = candidates[_ragged_range((np.cumsum(per_cell) - per_cell)[inverse], per_point)]
+        # Для единичных векторов хорда² = 2 - 2·cos: вместо расстояния сравнивается скалярное произведение
+        cosine = sum(np.take(points[:, axis], point) * np.take(self.axes[axis], place) for axis in range(3))
+        inside = cosine >= 1 - self.chord ** 2 / 2
+        point, place, cosine = point[inside], place[inside], cosine[inside]
+        if not len(point):
+            return result
+        # Пары уже сгруппированы по точкам: ближайшее место группы, при равенстве — меньший id
+        starts = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+        sizes = np.diff(np.r_[starts, len(point)])
+        closest = cosine == np.repeat(np.maximum.reduceat(cosine, starts), sizes)
+        ids = np.where(closest, self.ids[place], np.iinfo(np.int64).max)
+        result[point[starts]] = np.minimum.reduceat(ids, starts)
+        return result
+
+    def summarize(self, lat, lon, times, segments, joined=False, broken=False):
+        """ChunkResult для куска трека; segments — номер сегмента каждой точки."""
+        match = self.match(lat, lon)
+        inside = np.flatnonzero(match)
+        places, first = np.unique(match[inside], return_index=True)
+        first = inside[first]
+        stay = (match[1:] != 0) & (match[1:] == match[:-1]) & (segments[1:] == segments[:-1])
+        interval = np.diff(times)[stay]
+        # Скачок часов назад или точка без времени пребывания не добавляют
+        interval = np.where(interval > 0, interval, 0.0)
+        dwell = np.bincount(np.searchsorted(places, match[1:][stay]), interval, len(places))
+        untimed = np.bincount(np.searchsorted(places, match[inside][np.isnan(times[inside])]), minlength=len(places))
+        return ChunkResult(
+            places, first, times[first], dwell, untimed > 0,
+            (int(match[0]), float(times[0])) if len(match) else None,
+            (int(match[-1]), float(times[-1])) if len(match) else None,
+            joined, broken,
+        )
+
+
+def _floats(values):
+    try:
+        return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+    except ValueError:
+        result = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                result[i] = float(value)
+            except ValueError:
+                pass
+        return result
+
+
+def _iso_seconds(value):
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "replace")
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return math.nan
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)  # В GPX время в UTC
+    return moment.timestamp()
+
+
+def _fixed_width_seconds(raw):
+    # «ГГГГ-ММ-ДДTчч:мм:сс» с «Z» или без — цифры читаются прямо из байтов массива
+    if raw.dtype.itemsize not in (19, 20):
+        return None
+    chars = raw.view(np.uint8).reshape(len(raw), -1)
+    separators = all((chars[:, column] == ord(char)).all() for column, char in ISO_SEPARATORS)
+    if not separators or (raw.dtype.itemsize == 20 and not np.isin(chars[:, 19], (0, ord("Z"))).all()):
+        return None
+    digits = chars[:, ISO_DIGITS].astype(np.int64) - ord("0")
+    if ((digits < 0) | (digits > 9)).any():
+        return None
+
+    def number(first, last):
+        return sum(digits[:, ISO_DIGITS.index(column)] * 10 ** (last - column) for column in range(first, last + 1))
+
+    months = (number(0, 3) - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (number(5, 6) - 1).astype("timedelta64[M]")
+    days = months.astype("datetime64[D]") + (number(8, 9) - 1).astype("timedelta64[D]")
+    return (days.astype(np.int64) * 86400 + number(11, 12) * 3600 + number(14, 15) * 60 + number(17, 18)).astype(np.float64)
+
+
+def timestamps(values):
+    """Секунды unix для строк времени ISO 8601 (или чисел); без времени — NaN."""
+    if not len(values):
+        return np.empty(0)
+    if all(isinstance(value, (int, float)) for value in values):
+        return np.array(values, dtype=np.float64)
+    raw = np.array([value.encode() if isinstance(value, str) else value or b"" for value in values], dtype=np.bytes_)
+    missing = raw == b""
+    # Обычный случай — целые секунды в UTC: весь кусок разбирается векторно
+    seconds = _fixed_width_seconds(raw[~missing]) if missing.any() else _fixed_width_seconds(raw)
+    if seconds is not None:
+        if not missing.any():
+            return seconds
+        result = np.full(len(raw), np.nan)
+        result[~missing] = seconds
+        return result
+    return np.array([_iso_seconds(value) if value else math.nan for value in raw.tolist()])
+
+
+def _points(lat, lon, times, segments):
+    # Точки с неверными координатами выбрасываются
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    if valid.all():
+        return lat, lon, times, segments
+    return lat[valid], lon[valid], times[valid], segments[valid]
+
+
+def _parse_gpx_plain(data):
+    # Точки без пространства имён и с lat перед lon, как пишут почти все трекеры;
+    # None, если хоть одна точка записана иначе
+    if b":trkpt" in data:
+        return None
+    lat, lon, times, segments = [], [], [], []
+    parts = GPX_PLAIN_SEGMENT.split(data)
+    for segment, part in enumerate(parts):
+        points = GPX_PLAIN_POINT.findall(part)
+        if len(points) != part.count(b"<trkpt"):
+            return None
+        if points:
+            part_lat, part_lon, part_times = zip(*points)
+            lat += part_lat
+            lon += part_lon
+            times += part_times
+            segments.append(np.full(len(points), segment))
+    segments = np.concatenate(segments) if segments else np.empty(0, dtype=np.int64)
+    broken = len(parts) > 1 and (not len(segments) or segments[-1] < len(parts) - 1)
+    return lat, lon, times, segments, broken
+
+
+def _parse_gpx(data):
+    lat, lon, times, positions = [], [], [], []
+    for point in GPX_POINT.finditer(data):
+        attributes, body = point.group(1), point.group(2)
+        found_lat, found_lon = GPX_LAT.search(attributes), GPX_LON.search(attributes)
+        found_time = GPX_TIME.search(body) if body else None
+        lat.append(found_lat.group(1) if found_lat else b"nan")
+        lon.append(found_lon.group(1) if found_lon else b"nan")
+        times.append(found_time.group(1) if found_time else b"")
+        positions.append(point.start())
+    # Номер сегмента точки — число тегов <trkseg>/</trkseg> перед ней
+    markers = [marker.start() for marker in GPX_SEGMENT.finditer(data)]
+    segments = np.searchsorted(np.array(markers, dtype=np.int64), np.array(positions, dtype=np.int64))
+    broken = bool(markers) and (not positions or markers[-1] > positions[-1])
+    return lat, lon, times, segments, broken
+
+
+def read_gpx_range(path, start, end):
+    """Точки GPX из байт [start, end): широты, долготы, время, номера сегментов и
+    признак конца сегмента после последней точки.
+
+    start должен указывать на начало <trkpt>: диапазоны режет gpx_ranges.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    lat, lon, times, segments, broken = _parse_gpx_plain(data) or _parse_gpx(data)
+    return _points(_floats(lat), _floats(lon), timestamps(times), segments) + (broken,)
+
+
+def gpx_ranges(path, chunk_bytes=GPX_CHUNK_BYTES):
+    """Диапазоны байт файла GPX примерно по chunk_bytes, каждый с начала <trkpt>."""
+    if not os.path.getsize(path):
+        return []
+    starts = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        found = GPX_POINT_START.search(data)
+        while found is not None:
+            starts.append(found.start())
+            found = GPX_POINT_START.search(data, found.start() + chunk_bytes)
+        return list(zip(starts, starts[1:] + [len(data)]))
+
+
+def _feature_lines(feature):
+    # (координаты, время) каждой линии объекта LineString или MultiLineString
+    geometry = feature.get("geometry") or {}
+    properties = feature.get("properties") or {}
+    times = properties.get("coordTimes") or properties.get("times")
+    if geometry.get("type") == "LineString":
+        yield geometry["coordinates"], times
+    elif geometry.get("type") == "MultiLineString":
+        for index, line in enumerate(geometry["coordinates"]):
+            yield line, times[index] if times and isinstance(times[0], list) else None
+
+
+def _lon_lat(coordinates):
+    # Обычно у всех точек линии одинаково координат (с высотой или без) — тогда массив строится сразу
+    try:
+        return np.array(coordinates, dtype=np.float64)[:, :2]
+    except ValueError:
+        return np.array([point[:2] for point in coordinates], dtype=np.float64)
+
+
+def _geojson_tasks(path):
+    lat, lon, times, segments = [], [], [], []
+    size = segment = 0
+    joined = False
+    for feature in read_features(path):
+        for coordinates, line_times in _feature_lines(feature):
+            if not coordinates:
+                continue
+            if line_times is None or len(line_times) != len(coordinates):
+                line_times = [None] * len(coordinates)
+            segment += 1
+            for start in range(0, len(coordinates), CHUNK_POINTS):
+                piece = _lon_lat(coordinates[start:start + CHUNK_POINTS])
+                lon.append(piece[:, 0])
+                lat.append(piece[:, 1])
+                times.append(timestamps(line_times[start:start + CHUNK_POINTS]))
+                segments.append(np.full(len(piece), segment))
+                size += len(piece)
+                if size >= CHUNK_POINTS:
+                    yield ("points", np.concatenate(lat), np.concatenate(lon), np.concatenate(times),
+                           np.concatenate(segments), joined)
+                    lat, lon, times, segments = [], [], [], []
+                    size = 0
+                    joined = start + CHUNK_POINTS < len(coordinates)
+    if size:
+        yield ("points", np.concatenate(lat), np.concatenate(lon), np.concatenate(times), np.concatenate(segments), joined)
+
+
+def track_tasks(path):
+    """Задания для пула по файлу трека: диапазоны GPX или куски точек GeoJSON."""
+    lower = path.lower()
+    if lower.endswith(".gpx"):
+        return (("gpx", path, start, end, index > 0) for index, (start, end) in enumerate(gpx_ranges(path)))
+    if lower.endswith((".geojson", ".geojsonl", ".geojsons", ".json")):
+        return _geojson_tasks(path)
+    raise ValueError(f"Неизвестный формат трека: {path}")
+
+
+def run_task(fences, task):
+    """ChunkResult для одного задания track_tasks."""
+    if task[0] == "gpx":
+        _, path, start, end, joined = task
+        lat, lon, times, segments, broken = read_gpx_range(path, start, end)
+        return fences.summarize(lat, lon, times, segments, joined, broken)
+    _, lat, lon, times, segments, joined = task
+    return fences.summarize(*_points(lat, lon, times, segments), joined)
+
+
+_fences = None  # Геозоны в процессе пула; передаются один раз при его запуске
+
+
+def _init_worker(fences):
+    global _fences
+    _fences = fences
+
+
+def _run_in_worker(task):
+    return run_task(_fences, task)
+
+
+def _results(tasks, fences, workers):
+    # Результаты строго в порядке заданий; в работе не больше двух заданий на процесс
+    first = list(islice(tasks, 2))
+    tasks = chain(first, tasks)
+    if workers <= 1 or len(first) < 2:
+        for task in tasks:
+            yield run_task(fences, task)
+        return
+    # spawn, а не fork: процесс GUI многопоточный, и fork мог бы унести в потомка захваченные блокировки
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, context, initializer=_init_worker, initargs=(fences,)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_run_in_worker, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@traced("tracks.detect_visits")
+def detect_visits(paths, fences, min_dwell_s=MIN_DWELL_S, workers=None):
+    """Посещения по файлам треков (.gpx, .geojson) в порядке первого входа в геозону.
+
+    Файлы идут друг за другом как один трек; workers — число процессов пула
+    (по умолчанию по числу ядер), на результат оно не влияет.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = chain.from_iterable(track_tasks(path) for path in paths)
+    totals = {}  # место -> [(кусок, индекс первой точки), время входа, пребывание, без времени]
+    previous = None
+    for chunk, result in enumerate(_results(tasks, fences, workers)):
+        if result.head is None:
+            previous = None if result.broken else previous
+            continue
+        if previous is not None and result.joined and not previous.broken:
+            # Интервал между последней точкой прошлого куска и первой точкой этого
+            (place, before), (after_place, after) = previous.tail, result.head
+            if place and place == after_place and after > before:
+                totals[place][2] += after - before
+        for place, first, arrived, dwell, untimed in zip(
+            result.places.tolist(), result.first.tolist(), result.arrived.tolist(),
+            result.dwell.tolist(), result.untimed.tolist(),
+        ):
+            total = totals.get(place)
+            if total is None:
+                totals[place] = [(chunk, first), arrived, dwell, untimed]
+            else:
+                total[2] += dwell
+                total[3] = total[3] or untimed
+        previous = result
+    return [
+        TrackVisit(place, None if math.isnan(arrived) else arrived, dwell)
+        for place, (_, arrived, dwell, untimed) in sorted(totals.items(), key=lambda item: item[1][0])
+        if dwell >= min_dwell_s or untimed
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отметить посещения по GPS-трекам.")
+    parser.add_argument("files", nargs="+", help="файлы .gpx или .geojson")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--radius", type=float, default=GEOFENCE_RADIUS_M, help="радиус геозоны, м")
+    parser.add_argument("--dwell", type=float, default=MIN_DWELL_S, help="сколько секунд пробыть в геозоне")
+    parser.add_argument("--workers", type=int, default=None, help="процессов (по умолчанию по числу ядер)")
+    parser.add_argument("--dry-run", action="store_true", help="только показать посещения, не записывая их")
+    args = parser.parse_args()
+
+    from travel_core import TravelCore
+
+    core = TravelCore(args.db)
+    visits = core.track_job(args.files, args.radius, args.dwell, args.workers)()
+    for visit in visits:
+        location = core.store.get(visit.place)
+        arrived = "—" if visit.arrived is None else datetime.fromtimestamp(visit.arrived).strftime("%Y-%m-%d %H:%M")
+        print(f"{arrived}  {location.name} ({visit.dwell / 60:.0f} мин)")
+    if not args.dry_run:
+        added = core.apply_track_visits(visits)
+        print(f"Новых посещений: {len(added)} из {len(visits)}")
+    core.close()
+
+
+if __name__ == "__main__":
+    main()
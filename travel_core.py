@@ -0,0 +1,382 @@
+"""Логика приложения без Qt: места, посещения, друзья, достижения и сборка карты.
+
+map.html собирается из шаблона без folium, PySide6 не импортируется вовсе,
+поэтому модуль годится для скриптов, тестов и пакетной генерации без дисплея:
+
+    python travel_core.py map --out map.html
+"""
+import argparse
+import os
+import threading
+from functools import partial
+
+import numpy as np
+
+from achievements import AchievementEngine
+from clustering import MarkerClusterer
+from instrumentation import tracer
+from location_store import DB_PATH, LocationStore
+from map_renderer import PageCache, locations_digest, page_key, write_atomic
+from map_server import STATIC_ROOT
+from regions import REGION_MAX_ZOOM, RegionStats
+from routes import PlaceIndex
+from tile_cache import TileCache
+from tracks import GEOFENCE_RADIUS_M, MIN_DWELL_S, Geofences, detect_visits
+from vector_tiles import PREBUILD_MAX_ZOOM, VectorTileCache
+from visit_index import VisitIndex
+from visit_log import VisitLog
+from visit_sync import SyncState, covered, delta_events, encode_delta, merge_events, read_deltas
+
+# Начиная с этого числа мест маркеры не встраиваются в map.html,
+# а подгружаются страницей по видимой области с /api/markers
+LAZY_MARKERS_THRESHOLD = 1000
+
+# Имя, под которым в движке достижений учитываются посещения самого пользователя
+CURRENT_USER = "Я"
+
+FRIENDS_DATA = {
+    "Поручик": {"visited": {1, 3, 5, 7, 8, 2, 4, 13, 12, 15, 16, 20}, "achievements": []},
+    "Бэк": {"visited": {2, 4, 6, 9, 10}, "achievements": []},
+    "Мяу": {"visited": {1, 2, 3, 10, 15}, "achievements": []},
+    "Кутик": {"visited": {4}, "achievements": []},
+    "ЯКурица": {"visited": {1, 5, 9, 13, 15, 16, 2, 3, 4 , 6, 7, 8, 10, 11, 12, 14, 17, 18, 19, 20}, "achievements": []},
+}
+
+
+class TravelCore:
+    """Состояние путешественника и его друзей; интерфейс (Qt или скрипт) работает поверх."""
+
+    def __init__(self, db_path=DB_PATH, friends_data=None, map_filename="map.html"):
+        self.map_filename = map_filename
+        # Места читаются из locations.db через слой доступа с пространственным индексом
+        self.store = LocationStore(db_path)
+        self.store.seed_defaults()
+        self._owner_thread = threading.get_ident()
+        self._local = threading.local()
+        self.total_places = self.store.count()
+        self.clusterer = MarkerClusterer(self.store.all())
+        self._place_index = None
+        self._geofences = None
+        # Собранные страницы карты по ключу содержимого; повтор состояния не пересобирается
+        self.pages = PageCache()
+        self._locations_key = None
+        self._written = {}  # путь -> ключ страницы, записанной туда последней
+        self.tiles = None
+        self.server = None
+        self._sync = None
+
+        # Посещения хранятся в журнале в locations.db и переживают перезапуск
+        self.visit_log = VisitLog(db_path)
+        if self.visit_log.is_empty():
+            # Первый запуск: посещения друзей из встроенного набора попадают в журнал
+            for friend, data in (FRIENDS_DATA if friends_data is None else friends_data).items():
+                self.visit_log.record_many(friend, data["visited"])
+        # Посещения всех пользователей в битовых строках: счётчики и рейтинги считаются векторно
+        self.visits = self.visit_log.load(self.total_places)
+        self.visits.add_user(CURRENT_USER)
+        # Рейтинг, «кто был в месте» и рекомендации обновляются при каждом посещении
+        self.index = VisitIndex(self.visits)
+        self.visited_places = set(self.visits.visited(CURRENT_USER).tolist())
+        # Достижения описаны в achievements.json; все пользователи пересчитываются одним пакетом
+        self.achievements = AchievementEngine.from_config(self.store.all())
+        self.achievements.evaluate_all(self.visits)
+        # Сводки по областям для мелких масштабов карты; посещения дописываются в них по одному
+        self.regions = RegionStats(self.store.all(), self.visits.place_counts, self.visited_places)
+        # Векторные тайлы мест для страницы большого каталога; собираются по запросу сервера
+        self.vector_tiles = VectorTileCache(self.store.all(), self.visited_places)
+
+    @property
+    def friends(self):
+        """Имена друзей (все пользователи журнала, кроме текущего) в порядке появления."""
+        return [name for name in self.visits.names if name != CURRENT_USER]
+
+    def visit_place(self, place):
+        """Отмечает посещение; возвращает место или None, если оно уже было посещено.
+
+        Для id, которого нет в каталоге, — ValueError, и состояние не меняется.
+        """
+        if place in self.visited_places:
+            return None
+        location = self.store.get(place)
+        if location is None:
+            raise ValueError(f"Нет места с id {place}")
+        self.visited_places.add(place)  # Добавляем место в список посещенных
+        self.index.visit(CURRENT_USER, place)
+        self.visit_log.record(CURRENT_USER, place)  # Запись на диск — в фоне, пачкой
+        self.achievements.record_visit(CURRENT_USER, place)  # Пересчитываются только зависящие от места правила
+        self.regions.record_visit(place, own=True)
+        self.vector_tiles.record_visit(place)
+        return location
+
+    def progress(self):
+        """Доля посещённых мест в процентах."""
+        return len(self.visited_places) / self.total_places * 100 if self.total_places else 0.0
+
+    def unlocked_rules(self, user=CURRENT_USER):
+        return self.achievements.unlocked_rules(user)
+
+    def leaderboard(self, k=10):
+        """k пользователей с наибольшим числом мест: пары (имя, число мест)."""
+        return self.index.top(k)
+
+    def rank(self, user=CURRENT_USER):
+        """Место пользователя в рейтинге по числу посещённых мест (1 — первое)."""
+        return self.index.rank(user)
+
+    def place_visitors(self, place):
+        """Имена всех, кто посетил место, в порядке посещений."""
+        return self.index.place_visitors(place)
+
+    def recommendations(self, user=CURRENT_USER, k=20):
+        """Места, где были друзья, а user нет: пары (Location, сколько друзей там были)."""
+        ranked = self.index.recommendations(user, self.visits.names, k)
+        locations = {location.id: location for location in self._thread_store().get_many([place for place, _ in ranked])}
+        return [(locations[place], friends) for place, friends in ranked if place in locations]
+
+    def _thread_store(self):
+        # Соединение sqlite3 привязано к потоку: фоновые задания читают через своё
+        if threading.get_ident() == self._owner_thread:
+            return self.store
+        store = getattr(self._local, "store", None)
+        if store is None or store.path != self.store.path:
+            store = self._local.store = LocationStore(self.store.path)
+        return store
+
+    def friend_places(self, friend):
+        """Места, посещённые другом, по возрастанию id. Можно вызывать из фонового потока."""
+        return self._thread_store().get_many(self.visits.visited(friend).tolist())
+
+    def set_locations(self, locations):
+        """Заменяет набор мест и пересчитывает всё, что от него зависит.
+
+        id мест назначаются заново, поэтому журнал посещений переписывается на
+        новые id (посещения удалённых мест пропадают), и посещения всех
+        пользователей читаются из него заново.
+        """
+        self.visit_log.remap_places(self.store.replace_all(locations))
+        self.total_places = self.store.count()
+        self.clusterer.reset(self.store.all())
+        self._place_index = None
+        self._geofences = None
+        self._locations_key = None
+        self.visits = self.visit_log.load(self.total_places)
+        self.visits.add_user(CURRENT_USER)
+        self.index = VisitIndex(self.visits)
+        self.visited_places = set(self.visits.visited(CURRENT_USER).tolist())
+        self.achievements.load(self.achievements.rules, self.store.all())
+        self.achievements.evaluate_all(self.visits)
+        self.regions.reset(self.store.all(), self.visits.place_counts, self.visited_places)
+        self.vector_tiles.reset(self.store.all(), self.visited_places)
+
+    @property
+    def place_index(self):
+        """KD-дерево мест для поиска соседей; строится при первом запросе."""
+        if self._place_index is None:
+            self._place_index = PlaceIndex(self.store.all())
+        return self._place_index
+
+    def nearest_unvisited(self, lat, lon, k=10):
+        """k ближайших к точке непосещённых мест: пары (Location, расстояние в км)."""
+        return self.place_index.nearest(lat, lon, k, exclude=self.visited_places)
+
+    def search_places(self, text, limit=20, offset=0, near=None):
+        """Поиск мест по названию и описанию: пары (Location, км до near или None).
+
+        Без near — по убыванию рейтинга, с near=(lat, lon) — по расстоянию от точки.
+        """
+        if near is None:
+            return [(location, None) for location in self.store.search(text, limit, offset)]
+        return self.store.search_near(text, *near, limit=limit, offset=offset)
+
+    def geofences(self, radius_m=GEOFENCE_RADIUS_M):
+        """Геозоны мест для сверки с GPS-треками; строятся при первом запросе."""
+        if self._geofences is None or self._geofences.radius_m != radius_m:
+            self._geofences = Geofences(self.store.all(), radius_m)
+        return self._geofences
+
+    def track_job(self, paths, radius_m=GEOFENCE_RADIUS_M, min_dwell_s=MIN_DWELL_S, workers=None):
+        """Функция, находящая посещения в файлах треков; геозоны берутся сразу, разбор можно унести в фон."""
+        return partial(detect_visits, list(paths), self.geofences(radius_m), min_dwell_s, workers)
+
+    def apply_track_visits(self, visits):
+        """Отмечает посещения из трека тем же путём, что visit_place; возвращает новые места."""
+        added = (self.visit_place(visit.place) for visit in visits)
+        return [location for location in added if location is not None]
+
+    def vector_tile_job(self, min_zoom=REGION_MAX_ZOOM + 1, max_zoom=PREBUILD_MAX_ZOOM, workers=None):
+        """Функция, заранее собирающая векторные тайлы уровней min_zoom..max_zoom (пулом процессов)."""
+        return partial(self.vector_tiles.prebuild, min_zoom, max_zoom, workers)
+
+    @property
+    def sync(self):
+        """Версии обмена прогрессом с друзьями; таблицы создаются при первом обращении."""
+        if self._sync is None:
+            self._sync = SyncState(self.store.path)
+        return self._sync
+
+    def export_job(self, peer=None, full=False, user=None):
+        """Функция, собирающая дельту для друзей (см. export_progress).
+
+        Имя и версии обмена берутся сразу, чтение журнала и кодирование можно унести в фон.
+        """
+        if user:
+            self.sync.user = user
+        name = self.sync.user
+        if not name:
+            raise ValueError("Не задано имя, под которым друзья увидят ваши посещения")
+        since = 0 if full else self.sync.acked(peer)
+        origins = None if peer is None else self.sync.origins(peer)
+        return partial(self._encode_progress, name, since, origins, self.sync.device, self.sync.versions())
+
+    def _encode_progress(self, name, since, origins, device, versions):
+        seqs, names, rows, places = self.visit_log.events_since(since)
+        until = int(seqs[-1]) if len(seqs) else since
+        if origins is not None:
+            # Пришедшее от самого друга ему не возвращается
+            mine = ~covered(origins, seqs)
+            rows, places = rows[mine], places[mine]
+        # У друга с тем же именем посещения сольются с вашими — имена в дельте уникальны
+        names = [name if user_name == CURRENT_USER else user_name for user_name in names]
+        unique = {user_name: row for row, user_name in enumerate(dict.fromkeys(names))}
+        rows = np.array([unique[user_name] for user_name in names], dtype=np.int64)[rows]
+        return encode_delta(device, since, until, list(unique), rows, places, versions)
+
+    def export_progress(self, peer=None, full=False, user=None):
+        """Дельта посещений всех пользователей для друзей (см. visit_sync).
+
+        С peer — события, которых нет у этого устройства, без него — которых
+        нет хотя бы у одного из известных; full — весь журнал. Свои посещения
+        уходят под именем user (запоминается) вместо CURRENT_USER.
+        """
+        return self.export_job(peer, full, user)()
+
+    def _import_args(self):
+        # id мест каталога и переименование своего имени у друзей в CURRENT_USER
+        rename = {self.sync.user: CURRENT_USER} if self.sync.user else {}
+        return np.fromiter((location.id for location in self.store.all()), dtype=np.int64), rename
+
+    def import_job(self, paths):
+        """Функция, читающая и разбирающая файлы друзей (visit_sync.read_deltas) для apply_import.
+
+        Каталог и имя берутся сразу, чтение файлов и разбор можно унести в фон.
+        """
+        return partial(read_deltas, list(paths), *self._import_args())
+
+    def import_progress(self, reader):
+        """Сливает дельту друга (DeltaReader); возвращает {имя: новые id мест}, свои — под CURRENT_USER."""
+        return self.apply_import(reader, delta_events(reader, *self._import_args()))
+
+    def apply_import(self, reader, events):
+        """Сливает события, разобранные import_job; возвращает {имя: новые id мест}, свои — под CURRENT_USER."""
+        if reader.device == self.sync.device:
+            return {}
+        added = merge_events(self.index, *events)
+        # Номера новых событий в журнале запоминаются, чтобы не отправлять их обратно
+        after = self.visit_log.last_seq()
+        for name, places in added.items():
+            places = places.tolist()
+            self.visit_log.record_many(name, places)
+            self.achievements.record_visits(name, places)
+        last = self.visit_log.last_seq() if added else after
+        friends = [places for name, places in added.items() if name != CURRENT_USER]
+        if friends:
+            self.regions.record_visits(np.concatenate(friends).tolist())
+        own = added.get(CURRENT_USER)
+        if own is not None:
+            own = own.tolist()
+            self.visited_places.update(own)
+            self.regions.record_visits(own, own=True)
+            self.vector_tiles.record_visits(own)
+        self.sync.record(reader, after, last)
+        return added
+
+    def route_job(self, place_ids, start=None):
+        """Функция, строящая порядок обхода мест; индекс берётся сразу, счёт можно унести в фон."""
+        return partial(self.place_index.route, list(place_ids), start)
+
+    def plan_route(self, place_ids, start=None):
+        """Порядок обхода мест: (список Location по порядку, длина пути в км)."""
+        return self.route_job(place_ids, start)()
+
+    def map_job(self, path=None, theme="light"):
+        """Снимок мест и посещений для сборки map.html.
+
+        Возвращает функцию без аргументов, которую можно выполнить в другом
+        потоке: дальнейшие посещения на уже снятый снимок не влияют. Функция
+        возвращает ключ страницы (см. page_url); страница, уже бывшая в кэше,
+        не собирается заново, а файл не переписывается, если не изменился.
+        """
+        map_path = path or os.path.join(STATIC_ROOT, self.map_filename)
+        # Большой каталог: страница сама запрашивает видимые маркеры у сервера
+        lazy = self.total_places >= LAZY_MARKERS_THRESHOLD
+        locations = [] if lazy else self.store.all()
+        if self._locations_key is None:
+            self._locations_key = locations_digest(self.store.all())
+        visited = frozenset(self.visited_places)
+        key = page_key(self._locations_key, visited, lazy=lazy, theme=theme)
+        return partial(self._write_page, key, locations, visited, map_path, lazy=lazy, theme=theme)
+
+    def _write_page(self, key, locations, visited, path, **options):
+        page = self.pages.render(key, locations, visited, **options)
+        if self._written.get(path) != key or not os.path.exists(path):
+            with tracer.span("map.write"):
+                write_atomic(path, page)
+            self._written[path] = key
+        return key
+
+    def build_map(self, path=None, theme="light"):
+        """Собирает map.html по текущему списку мест и посещений; возвращает путь к файлу."""
+        map_path = path or os.path.join(STATIC_ROOT, self.map_filename)
+        self.map_job(map_path, theme)()
+        return map_path
+
+    def start_server(self, **kwargs):
+        """Запускает локальный сервер карты (тайлы идут через офлайн-кэш)."""
+        from map_server import start_map_server
+
+        # Тайлы карты идут через локальный кэш, чтобы приложение работало без сети
+        self.tiles = TileCache()
+        self.server = start_map_server(
+            self.clusterer, tiles=self.tiles, regions=self.regions, pages=self.pages, vector_tiles=self.vector_tiles,
+            **kwargs,
+        )
+        return self.server
+
+    @property
+    def map_url(self):
+        return f"{self.server.url}/{self.map_filename}"
+
+    def page_url(self, key):
+        """Неизменный адрес собранной страницы: браузер может кэшировать её навсегда."""
+        return f"{self.server.url}/map-{key}.html"
+
+    def close(self):
+        """Дописывает журнал посещений на диск; при длинном хвосте обновляет снимок."""
+        self.visit_log.close(self.visits)
+        if self._sync is not None:
+            self._sync.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Карта путешествий без графического интерфейса.")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("map", help="собрать map.html")
+    build.add_argument("--out", default="map.html")
+    build.add_argument("--visited", default="", help="id посещённых мест через запятую")
+    args = parser.parse_args()
+
+    core = TravelCore(args.db)
+    if args.command == "map":
+        try:
+            for place in filter(None, args.visited.split(",")):
+                core.visit_place(int(place))
+        except ValueError as error:
+            core.close()
+            parser.error(str(error))
+        print(f"Карта сохранена в: {core.build_map(os.path.abspath(args.out))}")
+    core.close()
+
+
+if __name__ == "__main__":
+    main()
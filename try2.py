@@ -1,16 +1,33 @@
-import folium
 import os
 import sys
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QPushButton, QApplication, QLabel, 
-    QHBoxLayout, QProgressBar, QTabWidget, QScrollArea, QFormLayout, QComboBox
+    QHBoxLayout, QProgressBar, QTabWidget, QListView, QComboBox, QLineEdit, QSpinBox,
+    QListWidget, QListWidgetItem, QFileDialog, QInputDialog
 )
 from PySide6.QtWebEngineWidgets import QWebEngineView
-from PySide6.QtCore import QUrl
+from PySide6.QtCore import Qt, QUrl
 from PySide6.QtGui import QFont, QPixmap
 from functools import partial
-from http.server import SimpleHTTPRequestHandler, HTTPServer
-import threading
+
+from background import StallMonitor, TaskRunner
+from debug_panel import DebugPanel
+from friends_view import AvatarCache, FriendDelegate, FriendsModel
+from instrumentation import tracer
+from search_view import PlaceSearchBox
+from travel_core import CURRENT_USER, LAZY_MARKERS_THRESHOLD, TravelCore
+
+# Посещения, сделанные в пределах этого окна, дают одну пересборку карты
+MAP_REBUILD_DELAY_MS = 150
+
+
+def save_progress(job, path):
+    """Собирает дельту (job из TravelCore.export_job) и пишет её в файл; возвращает размер в байтах."""
+    with tracer.span("sync.export"):
+        data = job()
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
 
 class TravelApp(QMainWindow):
     def __init__(self):
@@ -18,21 +35,22 @@ class TravelApp(QMainWindow):
         self.setWindowTitle("Интерактивная карта путешествий")
         self.setGeometry(100, 100, 1000, 800)
 
-        self.visited_places = set()
-        self.total_places = 20
+        # Вся логика (места, посещения, достижения, сборка карты) живёт в ядре без Qt
+        self.core = TravelCore()
         self.dark_mode = False
-
-        self.friends_data = {
-            "Поручик": {"visited": {1, 3, 5, 7, 8, 2, 4, 13, 12, 15, 16, 20}, "achievements": []},
-            "Бэк": {"visited": {2, 4, 6, 9, 10}, "achievements": []},
-            "Мяу": {"visited": {1, 2, 3, 10, 15}, "achievements": []},
-            "Кутик": {"visited": {4}, "achievements": []},
-            "ЯКурица": {"visited": {1, 5, 9, 13, 15, 16, 2, 3, 4 , 6, 7, 8, 10, 11, 12, 14, 17, 18, 19, 20}, "achievements": []},
-        }
+        # Посещения отправляются в уже открытую карту JS-патчами вместо пересборки map.html
+        self.incremental_updates = True
+        self.map_ready = False
+        # Сборка карты и запросы к базе идут в пуле потоков, результаты приходят сигналами
+        self.tasks = TaskRunner(parent=self)
+        self.stall_monitor = StallMonitor(parent=self)
+        self.stall_monitor.start()
 
         self.generate_map()
-        self.initUI()
+        # Сервер стартует до интерфейса: адрес карты зависит от выбранного им порта
         self.start_server()
+        with tracer.span("ui.init"):
+            self.initUI()
 
     def initUI(self):
         main_widget = QWidget()
@@ -81,12 +99,20 @@ class TravelApp(QMainWindow):
         self.progress_bar.setMaximum(100)
         map_layout.addWidget(self.progress_bar)
 
-        # Комбинированный бокс для выбора мест
-        self.place_selector = QComboBox()
-        for index, (_, _, name, _, _) in enumerate(self.locations, start=1):
-            self.place_selector.addItem(f"Посетить {name}")
-        self.place_selector.currentIndexChanged.connect(self.visit_selected_place)
-        map_layout.addWidget(self.place_selector)
+        # Поиск мест по мере ввода; выбранное место отмечается посещённым
+        search_layout = QHBoxLayout()
+        self.place_search = PlaceSearchBox(self.search_places)
+        self.place_search.place_chosen.connect(self.visit_found_place)
+        search_layout.addWidget(self.place_search)
+        self.search_order = QComboBox()
+        self.search_order.addItems(["По рейтингу", "Ближе к точке маршрута"])
+        self.search_order.currentIndexChanged.connect(self.place_search.refresh)
+        search_layout.addWidget(self.search_order)
+        # Посещения по записанным GPS-трекам: разбор и сверка с геозонами идут в фоне
+        self.track_button = QPushButton("Загрузить GPS-трек…")
+        self.track_button.clicked.connect(self.import_tracks)
+        search_layout.addWidget(self.track_button)
+        map_layout.addLayout(search_layout)
 
         # Слот для изображения награды
         self.reward_image_label = QLabel()
@@ -130,52 +156,151 @@ class TravelApp(QMainWindow):
         friends_tab.setLayout(friends_layout)
         self.tabs.addTab(friends_tab, "Друзья")
 
-        # Прокручиваемый список друзей
-        scroll_area = QScrollArea()
-        scroll_widget = QWidget()
-        scroll_layout = QFormLayout()
-        scroll_widget.setLayout(scroll_layout)
-        scroll_area.setWidget(scroll_widget)
-        scroll_area.setWidgetResizable(True)
-        friends_layout.addWidget(scroll_area)
-
-        # Добавление друзей, их аватарок и прогресса
-        for friend, data in self.friends_data.items():
-            friend_layout = QHBoxLayout()
-
-            # Добавление аватарки друга
-            avatar = QLabel()
-            avatar.setPixmap(QPixmap(f"avatars/{friend}.png").scaled(50, 50))  # Замените на реальные пути к изображениям
-            friend_layout.addWidget(avatar)
-
-            # Метка с именем друга и прогрессом
-            friend_label = QLabel(f"{friend}: Прогресс - {len(data['visited'])} мест из {self.total_places}")
-            friend_layout.addWidget(friend_label)
-
-            # Кнопка для просмотра посещенных мест
-            view_places_button = QPushButton("Посмотреть места")
-            view_places_button.clicked.connect(partial(self.show_visited_places, friend))
-            friend_layout.addWidget(view_places_button)
-
-            # Добавление к layout
-            scroll_layout.addRow(friend_layout)
-
-            # Добавление достижений
-            achievements = self.get_achievements(data['visited'])
-            achievement_label = QLabel(f"Достижения: {', '.join(achievements) if achievements else 'Нет'}")
-            scroll_layout.addRow(achievement_label)
+        # Список друзей: рисуются только видимые строки, аватарки грузятся в фоне
+        self.avatar_cache = AvatarCache(parent=self)
+        self.friends_model = FriendsModel(self.core, self.avatar_cache, parent=self)
+        self.friends_delegate = FriendDelegate(self)
+        self.friends_delegate.viewPlacesClicked.connect(self.show_visited_places)
+        self.friends_list = QListView()
+        self.friends_list.setModel(self.friends_model)
+        self.friends_list.setItemDelegate(self.friends_delegate)
+        self.friends_list.setUniformItemSizes(True)  # Высота строк не зависит от данных
+        friends_layout.addWidget(self.friends_list)
+
+        # Рейтинг и места, где были друзья, а пользователь ещё нет
+        self.leaderboard_label = QLabel("")
+        self.leaderboard_label.setWordWrap(True)
+        friends_layout.addWidget(self.leaderboard_label)
+        recommendations_button = QPushButton("Где были друзья, а я нет")
+        recommendations_button.clicked.connect(self.show_recommendations)
+        friends_layout.addWidget(recommendations_button)
+        self.update_leaderboard()
+
+        # Обмен прогрессом файлами: в файле только посещения, которых у друзей ещё нет
+        sync_layout = QHBoxLayout()
+        self.export_button = QPushButton("Сохранить прогресс для друзей")
+        self.export_button.clicked.connect(self.export_progress)
+        sync_layout.addWidget(self.export_button)
+        self.import_button = QPushButton("Загрузить прогресс друзей")
+        self.import_button.clicked.connect(self.import_progress)
+        sync_layout.addWidget(self.import_button)
+        friends_layout.addLayout(sync_layout)
+
+        # Вкладка маршрута: ближайшие непосещённые места и порядок их обхода
+        route_tab = QWidget()
+        route_layout = QVBoxLayout()
+        route_tab.setLayout(route_layout)
+        self.tabs.addTab(route_tab, "Маршрут")
+
+        point_layout = QHBoxLayout()
+        self.route_lat = QLineEdit("55.7558")
+        self.route_lon = QLineEdit("37.6173")
+        self.route_count = QSpinBox()
+        self.route_count.setRange(1, 200)
+        self.route_count.setValue(10)
+        nearby_button = QPushButton("Ближайшие непосещённые")
+        nearby_button.clicked.connect(self.show_nearby_places)
+        point_layout.addWidget(QLabel("Широта:"))
+        point_layout.addWidget(self.route_lat)
+        point_layout.addWidget(QLabel("Долгота:"))
+        point_layout.addWidget(self.route_lon)
+        point_layout.addWidget(QLabel("Сколько:"))
+        point_layout.addWidget(self.route_count)
+        point_layout.addWidget(nearby_button)
+        route_layout.addLayout(point_layout)
+
+        # Найденные места; маршрут строится по отмеченным
+        self.nearby_list = QListWidget()
+        route_layout.addWidget(self.nearby_list)
+
+        route_button = QPushButton("Построить маршрут по отмеченным")
+        route_button.clicked.connect(self.build_route)
+        route_layout.addWidget(route_button)
+
+        self.route_label = QLabel("")
+        self.route_label.setWordWrap(True)
+        route_layout.addWidget(self.route_label)
+
+        # Вкладка с замерами: включается флажком на ней или TRAVEL_TRACE=1
+        self.debug_panel = DebugPanel(self.stall_monitor)
+        self.tabs.addTab(self.debug_panel, "Отладка")
 
     def show_visited_places(self, friend):
         """Отображает места, посещенные другом."""
-        visited_places = self.friends_data[friend]["visited"]
+        self.stall_monitor.mark(f"места друга {friend}")
+        # Запрос к базе и сборка текста — в фоне; окно откроется, когда всё готово
+        self.tasks.submit("friend_places", partial(self.visited_places_text, friend), self.show_message)
+
+    def visited_places_text(self, friend):
+        """Текст со списком мест друга; выполняется в фоновом потоке."""
         places_info = []
 
-        for place in visited_places:
-            place_info = self.locations[place - 1]
-            places_info.append(f"{place_info[2]} (Рейтинг: {place_info[3]}/5): {place_info[4]}")
+        for place_info in self.core.friend_places(friend):
+            places_info.append(f"{place_info.name} (Рейтинг: {place_info.rating}/5): {place_info.description}")
 
         places_text = "\n".join(places_info) if places_info else "Нет посещенных мест."
-        self.show_message(f"{friend} посетил следующие места:\n{places_text}")
+        return f"{friend} посетил следующие места:\n{places_text}"
+
+    def update_leaderboard(self):
+        """Первые места рейтинга и место пользователя; рейтинг уже отсортирован, пересчёта нет."""
+        top = ", ".join(f"{number}. {name} ({count})" for number, (name, count) in enumerate(self.core.leaderboard(5), start=1))
+        self.leaderboard_label.setText(f"Рейтинг: {top}\nВы на {self.core.rank()}-м месте")
+
+    def show_recommendations(self):
+        self.stall_monitor.mark("рекомендации")
+        self.tasks.submit("recommendations", self.recommendations_text, self.show_message)
+
+    def recommendations_text(self):
+        """Текст с рекомендациями; выполняется в фоновом потоке."""
+        lines = [
+            f"{location.name} (Рейтинг: {location.rating}/5) — были друзей: {friends}"
+            for location, friends in self.core.recommendations(k=20)
+        ]
+        return "Где были друзья, а вы ещё нет:\n" + ("\n".join(lines) if lines else "Таких мест нет.")
+
+    def route_start(self):
+        """Точка из полей широты и долготы или None, если ввод некорректен."""
+        try:
+            return float(self.route_lat.text().replace(",", ".")), float(self.route_lon.text().replace(",", "."))
+        except ValueError:
+            self.show_message("Введите широту и долготу числами, например 55.7558 и 37.6173.")
+            return None
+
+    def show_nearby_places(self):
+        """Заполняет список ближайшими к точке непосещёнными местами."""
+        self.stall_monitor.mark("ближайшие места")
+        start = self.route_start()
+        if start is None:
+            return
+        self.nearby_list.clear()
+        for location, distance in self.core.nearest_unvisited(*start, k=self.route_count.value()):
+            item = QListWidgetItem(f"{location.name} — {distance:.2f} км (Рейтинг: {location.rating}/5)")
+            item.setData(Qt.UserRole, location.id)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked)
+            self.nearby_list.addItem(item)
+
+    def build_route(self):
+        """Строит в фоне порядок обхода отмеченных мест от введённой точки."""
+        self.stall_monitor.mark("маршрут")
+        start = self.route_start()
+        if start is None:
+            return
+        places = [
+            self.nearby_list.item(row).data(Qt.UserRole)
+            for row in range(self.nearby_list.count())
+            if self.nearby_list.item(row).checkState() == Qt.Checked
+        ]
+        if not places:
+            self.route_label.setText("Отметьте места для маршрута.")
+            return
+        self.route_label.setText("Маршрут строится...")
+        self.tasks.submit("route", self.core.route_job(places, start), self.show_route)
+
+    def show_route(self, route):
+        locations, length = route
+        steps = "\n".join(f"{number}. {location.name}" for number, location in enumerate(locations, start=1))
+        self.route_label.setText(f"Маршрут: {len(locations)} мест, {length:.1f} км\n{steps}")
 
     def show_message(self, message):
         """Отображает сообщение в диалоговом окне."""
@@ -184,102 +309,172 @@ class TravelApp(QMainWindow):
         msg_box.setText(message)
         msg_box.exec()
 
-    def get_achievements(self, visited_places):
-        achievements = []
-        if len(visited_places) >= 5:
-            achievements.append("Первопроходец: Посетите 5 мест.")
-        if len(visited_places) >= 10:
-            achievements.append("Исследователь: Посетите 10 мест.")
-        if len(visited_places) >= 15:
-            achievements.append("Гурман: Посетите 15 мест.")
-        if len(visited_places) == self.total_places:
-            achievements.append("Совершенный путник: Посетите все места!")
-        return achievements
+    @property
+    def map_theme(self):
+        return "dark" if self.dark_mode else "light"
 
     def generate_map(self):
-        # Генерация карты с местами
-        map_object = folium.Map(location=[55.7558, 37.6173], zoom_start=12)
-
-        self.locations = [
-            (55.75202, 37.61749, "Московский Кремль", 4.9, "Исторический комплекс и резиденция президента России."),
-            (55.75098, 37.61698, "Успенский собор", 4.8, "Один из главных православных соборов России."),
-            (55.75076, 37.61849, "Царь-колокол", 4.7, "Самый большой колокол в мире, который никогда не звонил."),
-            (55.74968, 37.6136, "Оружейная палата", 4.6, "Хранилище уникальных коллекций оружия и доспехов."),
-            (55.760178, 37.618575, "Большой театр", 4.9, "Один из самых известных театров в мире."),
-            (55.73955, 37.6177, "Площадь Революции", 4.7, "Одна из центральных площадей Москвы, где расположены памятники историческим деятелям."),
-            (55.751244, 37.620577, "Красная площадь", 5.0, "Историческое сердце Москвы, место проведения многих значимых событий."),
-            (55.7557, 37.6176, "Мавзолей Ленина", 4.5, "Мавзолей, в котором покоится тело Владимира Ленина."),
-            (55.746047, 37.616264, "Парк Горького", 4.8, "Известный московский парк для отдыха и культурных мероприятий."),
-            (55.74517, 37.61712, "Воробьёвы горы", 4.9, "Одна из самых высоких точек Москвы с панорамным видом на город."),
-            (55.7644, 37.6155, "Третьяковская галерея", 4.9, "Один из крупнейших музеев искусства в России."),
-            (55.7575, 37.6173, "Храм Василия Блаженного", 5.0, "Известный храм на Красной площади, символ Москвы."),
-            (55.7536, 37.616, "ГУМ", 4.8, "Роскошный торговый центр на Красной площади."),
-            (55.756, 37.603, "Станция метро 'Киевская'", 4.7, "Одно из самых известных московских метро, характерное своими архитектурными особенностями."),
-            (55.7677, 37.6347, "Измайловский Кремль", 4.6, "Культурно-развлекательный комплекс в Москве, напоминающий старинную крепость."),
-            (55.7471, 37.595, "ВДНХ", 4.8, "Выставочный комплекс и музей под открытым небом."),
-            (55.7610, 37.5983, "Поклонная гора", 4.7, "Место исторических памятников и мемориалов."),
-            (55.7701, 37.6215, "Музей космонавтики", 4.9, "Музей, посвященный истории освоения космоса."),
-            (55.7237, 37.6727, "Московский зоопарк", 4.6, "Один из крупнейших зоопарков в России."),
-            (55.7579, 37.6641, "Кремль в Измайлово", 4.7, "Культурный комплекс и туристическая достопримечательность.")
-        ]
-
-        # Добавление маркеров на карту
-        for lat, lon, name, rating, description in self.locations:
-            popup_content = f"<b>{name}</b><br>Рейтинг: {rating}/5<br>{description}"
-            folium.Marker([lat, lon], popup=popup_content).add_to(map_object)
-
-        # Сохранение карты как HTML файл
-        self.map_filename = "map.html"
-        map_path = os.path.join(os.getcwd(), self.map_filename)
-        map_object.save(map_path)
-        print(f"Карта сохранена в: {map_path}")
+        # Сохранение карты как HTML файл; ключ страницы задаёт её адрес на сервере
+        self.map_key = self.core.map_job(theme=self.map_theme)()
+        print(f"Карта сохранена в: {self.core.map_filename}")
 
     def update_map(self):
-        map_url = "http://localhost:8000/map.html"
-        self.map_view.setUrl(QUrl(map_url))
+        self.map_ready = False
+        self.map_load_started = tracer.now()
+        # Адрес страницы меняется вместе с содержимым, повторное состояние берётся из кэша
+        self.map_view.setUrl(QUrl(self.core.page_url(self.map_key)))
 
-    def on_map_loaded(self):
+    def on_map_loaded(self, ok=True):
+        tracer.record("map.page_load", self.map_load_started)
         print("Карта успешно загружена!")
-
-    def visit_selected_place(self):
-        place = self.place_selector.currentIndex() + 1
+        self.map_ready = ok
+        # Страница могла загрузиться из старого map.html — досылаем текущие посещения
+        if ok and self.incremental_updates and self.core.visited_places:
+            self.patch_markers(self.core.visited_places)
+
+    def patch_markers(self, places, visited=True):
+        """Перекрашивает маркеры на уже загруженной карте одним JS-вызовом."""
+        ids = ", ".join(str(place) for place in sorted(places))
+        self.map_view.page().runJavaScript(
+            f"setPlacesVisited([{ids}], {'true' if visited else 'false'});"
+        )
+
+    def set_locations(self, locations):
+        """Заменяет набор мест; только в этом случае карта пересобирается целиком."""
+        self.stall_monitor.mark("замена мест")
+        self.core.set_locations(locations)
+        self.update_map_with_progress()
+
+    def search_places(self, text, limit, offset):
+        """Страница результатов поиска в выбранном порядке."""
+        near = None
+        if self.search_order.currentIndex() == 1:
+            near = self.route_start()
+            if near is None:
+                return []
+        return self.core.search_places(text, limit, offset, near=near)
+
+    def visit_found_place(self, place):
+        self.stall_monitor.mark(f"посещение места {place}")
         self.visit_place(place)
 
     def visit_place(self, place):
-        if place not in self.visited_places:
-            self.visited_places.add(place)  # Добавляем место в список посещенных
-            place_info = self.locations[place - 1]  # Получаем информацию о месте
-            name, rating, description = place_info[2], place_info[3], place_info[4]
-            self.show_place_info(name, rating, description)
+        with tracer.span("ui.visit_place"):
+            self.apply_visit(place)
+
+    def apply_visit(self, place):
+        place_info = self.core.visit_place(place)  # None, если место уже посещено
+        if place_info is not None:
+            tracer.count("visits")
+            self.show_place_info(place_info.name, place_info.rating, place_info.description)
             self.update_progress()  # Обновляем прогресс
-            self.update_map_with_progress()  # Обновляем карту с посещенными местами
+            self.update_leaderboard()
+            if not self.incremental_updates:
+                self.update_map_with_progress()  # Обновляем карту с посещенными местами
+            elif self.map_ready:
+                self.patch_markers([place])  # Перекрашиваем только один маркер
+            # Иначе страница ещё грузится: on_map_loaded досинхронизирует посещения
+
+    def import_tracks(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "GPS-треки", "", "Треки (*.gpx *.geojson *.json)")
+        if not paths:
+            return
+        self.stall_monitor.mark("посещения по треку")
+        self.track_button.setEnabled(False)
+        self.tasks.submit("tracks", self.core.track_job(paths), self.apply_track_visits, self.on_track_error)
+
+    def apply_track_visits(self, visits):
+        """Отмечает места из трека; интерфейс обновляется один раз на весь трек."""
+        self.track_button.setEnabled(True)
+        with tracer.span("ui.track_visits"):
+            added = self.core.apply_track_visits(visits)
+            if added:
+                tracer.count("visits", len(added))
+                self.update_progress()
+                self.update_leaderboard()
+                if not self.incremental_updates:
+                    self.update_map_with_progress()
+                elif self.map_ready:
+                    self.patch_markers([location.id for location in added])
+        names = "\n".join(location.name for location in added[:20])
+        more = f"\n… и ещё {len(added) - 20}" if len(added) > 20 else ""
+        self.show_message(f"Мест по треку: {len(visits)}, новых посещений: {len(added)}\n{names}{more}")
+
+    def on_track_error(self, error):
+        self.track_button.setEnabled(True)
+        self.show_message(f"Не удалось прочитать трек: {error}")
+
+    def export_progress(self):
+        user = None
+        if not self.core.sync.user:
+            user, ok = QInputDialog.getText(self, "Обмен прогрессом", "Имя, под которым друзья увидят ваши посещения:")
+            if not ok or not user.strip():
+                return
+            user = user.strip()
+        path, _ = QFileDialog.getSaveFileName(self, "Прогресс для друзей", "progress.tvsd", "Прогресс (*.tvsd)")
+        if not path:
+            return
+        # Чтение журнала, кодирование и запись файла идут в фоне; версии обмена сняты сейчас
+        self.export_button.setEnabled(False)
+        self.tasks.submit(
+            "export_progress", partial(save_progress, self.core.export_job(user=user), path),
+            partial(self.on_progress_exported, path), self.on_export_error,
+        )
+
+    def on_progress_exported(self, path, size):
+        self.export_button.setEnabled(True)
+        self.show_message(f"Сохранено {size:,} байт: {path}")
+
+    def on_export_error(self, error):
+        self.export_button.setEnabled(True)
+        self.show_message(f"Не удалось сохранить прогресс: {error}")
+
+    def import_progress(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Прогресс друзей", "", "Прогресс (*.tvsd)")
+        if not paths:
+            return
+        self.import_button.setEnabled(False)
+        self.tasks.submit("import_progress", self.core.import_job(paths), self.apply_imported_progress, self.on_import_error)
+
+    def apply_imported_progress(self, result):
+        """Сливает файлы друзей, прочитанные в фоне; интерфейс обновляется один раз на все файлы."""
+        self.import_button.setEnabled(True)
+        loaded, failed = result
+        added = {}
+        errors = [f"{os.path.basename(path)}: {error}" for path, error in failed]
+        with tracer.span("ui.import_progress"):
+            for reader, events in loaded:
+                for name, places in self.core.apply_import(reader, events).items():
+                    added.setdefault(name, []).extend(places.tolist())
+            if added:
+                tracer.count("visits", sum(len(places) for places in added.values()))
+                self.friends_model.refresh()
+                self.update_leaderboard()
+                own = added.get(CURRENT_USER)
+                if own:
+                    self.update_progress()
+                    if not self.incremental_updates:
+                        self.update_map_with_progress()
+                    elif self.map_ready:
+                        self.patch_markers(own)
+        lines = [f"{name}: +{len(places)}" for name, places in added.items()]
+        self.show_message("\n".join(lines + errors) or "Новых посещений нет")
+
+    def on_import_error(self, error):
+        self.import_button.setEnabled(True)
+        self.show_message(f"Не удалось загрузить прогресс: {error}")
 
     def show_place_info(self, name, rating, description):
         info_message = f"<b>{name}</b><br>Рейтинг: {rating}/5<br>{description}"
         print(info_message)  # Вывод информации в консоль для теста
 
     def update_progress(self):
-        progress = len(self.visited_places) / self.total_places * 100
+        progress = self.core.progress()
         self.progress_label.setText(f"Прогресс: {progress:.0f}%")
         self.progress_bar.setValue(progress)
 
-        # Проверка и выдача наград
-        achievements = []
-        rewards = {  # Список достижений и связанные изображения
-            "Первопроходец: Посетите 5 мест.": "achievement_5.png",
-            "Исследователь: Посетите 10 мест.": "achievement_10.png",
-            "Гурман: Посетите 15 мест.": "achievement_15.png",
-            "Совершенный путник: Посетите все места!": "achievement_all.png",
-        }
-
-        if len(self.visited_places) >= 5:
-            achievements.append("Первопроходец: Посетите 5 мест.")
-        if len(self.visited_places) >= 10:
-            achievements.append("Исследователь: Посетите 10 мест.")
-        if len(self.visited_places) >= 15:
-            achievements.append("Гурман: Посетите 15 мест.")
-        if len(self.visited_places) == self.total_places:
-            achievements.append("Совершенный путник: Посетите все места!")
+        # Открытые достижения уже посчитаны движком при посещении
+        achievements = self.core.unlocked_rules()
 
         # Добавление достижений
         self.reward_image_label.clear()  # Очистить старые изображения
@@ -290,11 +485,11 @@ class TravelApp(QMainWindow):
                 achievement_layout = QHBoxLayout()
 
                 # Текст достижения
-                achievement_label = QLabel(achievement)
+                achievement_label = QLabel(achievement.title)
                 achievement_layout.addWidget(achievement_label)
 
                 # Изображение достижения
-                image_path = rewards.get(achievement, "reward_placeholder.png")
+                image_path = achievement.image or "reward_placeholder.png"
                 if os.path.exists(image_path):
                     achievement_image = QLabel()
                     achievement_image.setPixmap(QPixmap(image_path).scaled(50, 50))
@@ -305,34 +500,22 @@ class TravelApp(QMainWindow):
             self.reward_label.setText("Нет достижений.")
 
     def update_map_with_progress(self):
-        # Создаем новую карту
-        map_object = folium.Map(location=[55.7558, 37.6173], zoom_start=12)
-
-        # Проходим по всем локациям и добавляем маркеры
-        for i, (lat, lon, name, rating, description) in enumerate(self.locations, start=1):
-            # Если место посещено, маркер зеленый, если нет — красный
-            color = "green" if i in self.visited_places else "red"
-            
-            # Содержимое всплывающего окна
-            popup_content = f"<b>{name}</b><br>Рейтинг: {rating}/5<br>{description}"
-            
-            # Добавляем маркер на карту
-            folium.Marker(
-                [lat, lon],
-                popup=popup_content,
-                icon=folium.Icon(color=color)
-            ).add_to(map_object)
-
-        # Сохраняем карту в файл
-        map_path = os.path.join(os.getcwd(), self.map_filename)
-        map_object.save(map_path)
-
+        # Пересобираем карту целиком в фоне; быстрые повторные вызовы сливаются в одну сборку
+        self.tasks.submit(
+            "map", self.core.map_job(theme=self.map_theme), self.on_map_built, delay_ms=MAP_REBUILD_DELAY_MS
+        )
+
+    def on_map_built(self, key):
+        if key == self.map_key and self.map_ready:
+            return  # Страница не изменилась — перезагружать нечего
+        self.map_key = key
         # Обновляем отображение карты в приложении
         self.update_map()
 
     def toggle_theme(self):
         self.dark_mode = not self.dark_mode
         self.set_theme()
+        self.update_map_with_progress()  # Карта в другой теме — своя страница в кэше
 
     def set_theme(self):
         if self.dark_mode:
@@ -547,15 +730,15 @@ class TravelApp(QMainWindow):
 
 
     def start_server(self):
-        def run_server():
-            handler = SimpleHTTPRequestHandler
-            self.server = HTTPServer(("localhost", 8000), handler)
-            print("HTTP сервер запущен на http://localhost:8000")
-            self.server.serve_forever()
-
-        self.server_thread = threading.Thread(target=run_server)
-        self.server_thread.daemon = True
-        self.server_thread.start()
+        self.core.start_server()
+        if self.core.total_places >= LAZY_MARKERS_THRESHOLD:
+            # Страница большого каталога рисует места из векторных тайлов; частые уровни собираются заранее
+            self.tasks.submit("vector_tiles", self.core.vector_tile_job())
+
+    def closeEvent(self, event):
+        self.tasks.shutdown()
+        self.core.close()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
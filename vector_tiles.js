@@ -0,0 +1,301 @@
+// vector_tiles.js
+// Слой мест из векторных тайлов /vtiles/{z}/{x}/{y}.pbf: точки рисуются на canvas тайла,
+// а не отдельными маркерами, поэтому страница не зависит от числа мест в каталоге.
+(function () {
+    // Protobuf читается вручную: из MVT нужны только слои, точки и их атрибуты
+    function Reader(buffer) {
+        this.bytes = new Uint8Array(buffer);
+        this.view = new DataView(buffer);
+        this.pos = 0;
+    }
+
+    Reader.prototype.varint = function () {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = this.bytes[this.pos++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        return value;
+    };
+
+    Reader.prototype.end = function () {
+        return this.varint() + this.pos;
+    };
+
+    Reader.prototype.skip = function (type) {
+        if (type === 0) {
+            this.varint();
+        } else if (type === 1) {
+            this.pos += 8;
+        } else if (type === 2) {
+            this.pos = this.end();
+        } else if (type === 5) {
+            this.pos += 4;
+        }
+    };
+
+    const decoder = new TextDecoder();
+
+    function readValue(reader, end) {
+        let value = null;
+        while (reader.pos < end) {
+            const tag = reader.varint();
+            const field = tag >> 3;
+            if (field === 1) {
+                const stop = reader.end();
+                value = decoder.decode(reader.bytes.subarray(reader.pos, stop));
+                reader.pos = stop;
+            } else if (field === 3) {
+                value = reader.view.getFloat64(reader.pos, true);
+                reader.pos += 8;
+            } else if (field === 5) {
+                value = reader.varint();
+            } else {
+                reader.skip(tag & 7);
+            }
+        }
+        return value;
+    }
+
+    function readPacked(reader) {
+        const stop = reader.end();
+        const values = [];
+        while (reader.pos < stop) {
+            values.push(reader.varint());
+        }
+        return values;
+    }
+
+    function zigzag(value) {
+        return value % 2 ? -(value + 1) / 2 : value / 2;
+    }
+
+    function readFeature(reader, end) {
+        const feature = { id: 0, tags: [], x: 0, y: 0 };
+        while (reader.pos < end) {
+            const tag = reader.varint();
+            const field = tag >> 3;
+            if (field === 1) {
+                feature.id = reader.varint();
+            } else if (field === 2) {
+                feature.tags = readPacked(reader);
+            } else if (field === 4) {
+                // Точка — одна команда MoveTo: [команда, dx, dy]
+                const geometry = readPacked(reader);
+                feature.x = zigzag(geometry[1]);
+                feature.y = zigzag(geometry[2]);
+            } else {
+                reader.skip(tag & 7);
+            }
+        }
+        return feature;
+    }
+
+    function readLayer(reader, end) {
+        const layer = { name: "", extent: 4096, keys: [], values: [], features: [] };
+        while (reader.pos < end) {
+            const tag = reader.varint();
+            const field = tag >> 3;
+            if (field === 1) {
+                const stop = reader.end();
+                layer.name = decoder.decode(reader.bytes.subarray(reader.pos, stop));
+                reader.pos = stop;
+            } else if (field === 2) {
+                const stop = reader.end();
+                layer.features.push(readFeature(reader, stop));
+            } else if (field === 3) {
+                const stop = reader.end();
+                layer.keys.push(decoder.decode(reader.bytes.subarray(reader.pos, stop)));
+                reader.pos = stop;
+            } else if (field === 4) {
+                const stop = reader.end();
+                layer.values.push(readValue(reader, stop));
+            } else if (field === 5) {
+                layer.extent = reader.varint();
+            } else {
+                reader.skip(tag & 7);
+            }
+        }
+        // Атрибуты раскладываются по точкам один раз, при отрисовке и клике они уже готовы
+        layer.features.forEach((feature) => {
+            feature.properties = { count: 1 };
+            for (let i = 0; i < feature.tags.length; i += 2) {
+                feature.properties[layer.keys[feature.tags[i]]] = layer.values[feature.tags[i + 1]];
+            }
+            delete feature.tags;
+        });
+        return layer;
+    }
+
+    function decodeTile(buffer) {
+        const reader = new Reader(buffer);
+        const layers = {};
+        while (reader.pos < reader.bytes.length) {
+            const tag = reader.varint();
+            if (tag >> 3 === 3) {
+                const layer = readLayer(reader, reader.end());
+                layers[layer.name] = layer;
+            } else {
+                reader.skip(tag & 7);
+            }
+        }
+        return layers;
+    }
+
+    // Как у маркеров: посещённое место зелёное, остальные красные; у слитых точек
+    // цвет — доля посещённых, размер растёт с числом мест
+    function pointStyle(properties) {
+        const share = properties.visited / properties.count;
+        const radius = properties.count > 1 ? Math.min(8, 4 + Math.log2(properties.count)) : 6;
+        return { radius: radius, color: "hsl(" + Math.round(120 * share) + ", 80%, 40%)" };
+    }
+
+    // Содержимое — DOM-узлы из lazy_markers.js: название и описание не разбираются как HTML
+    function placePopup(place, count) {
+        const more = count > 1 ? `И ещё мест в этой точке: ${count - 1}` : "";
+        return window.travelPlacePopup(place.name, place.rating, place.description, more);
+    }
+
+    const VectorPlaces = L.GridLayer.extend({
+        options: { layer: "places" },
+
+        initialize: function (url, options) {
+            this._url = url;
+            this._features = {};
+            L.GridLayer.prototype.initialize.call(this, options);
+            // Точки хранятся по ключу тайла в координатах createTile (с учётом повторов мира)
+            this.on("tileunload", function (event) {
+                delete this._features[this._tileCoordsToKey(this._wrapCoords(event.coords))];
+            });
+        },
+
+        onAdd: function (map) {
+            L.GridLayer.prototype.onAdd.call(this, map);
+            map.on("click", this._onClick, this);
+        },
+
+        onRemove: function (map) {
+            map.off("click", this._onClick, this);
+            L.GridLayer.prototype.onRemove.call(this, map);
+        },
+
+        createTile: function (coords, done) {
+            const canvas = L.DomUtil.create("canvas", "travel-vector-tile");
+            const size = this.getTileSize();
+            const ratio = window.devicePixelRatio || 1;
+            canvas.width = size.x * ratio;
+            canvas.height = size.y * ratio;
+            this._load(canvas, coords, done);
+            return canvas;
+        },
+
+        _load: function (canvas, coords, done) {
+            const key = this._tileCoordsToKey(coords);
+            fetch(L.Util.template(this._url, coords))
+                .then((response) => {
+                    if (!response.ok) {
+                        throw new Error("HTTP " + response.status);
+                    }
+                    return response.arrayBuffer();
+                })
+                .then((buffer) => {
+                    const layer = decodeTile(buffer)[this.options.layer];
+                    const features = layer ? layer.features : [];
+                    const scale = canvas.width / (layer ? layer.extent : 4096);
+                    if (this._map) {
+                        this._features[key] = { features: features, extent: layer ? layer.extent : 4096 };
+                    }
+                    this._draw(canvas, features, scale);
+                    if (done) {
+                        done(null, canvas);
+                    }
+                })
+                .catch((error) => {
+                    if (done) {
+                        done(error, canvas);
+                    }
+                });
+        },
+
+        _draw: function (canvas, features, scale) {
+            const context = canvas.getContext("2d");
+            const ratio = window.devicePixelRatio || 1;
+            context.clearRect(0, 0, canvas.width, canvas.height);
+            context.lineWidth = ratio;
+            features.forEach((feature) => {
+                const style = pointStyle(feature.properties);
+                context.beginPath();
+                context.arc(feature.x * scale, feature.y * scale, style.radius * ratio, 0, 2 * Math.PI);
+                context.globalAlpha = 0.8;
+                context.fillStyle = style.color;
+                context.fill();
+                context.globalAlpha = 1;
+                context.strokeStyle = style.color;
+                context.stroke();
+            });
+        },
+
+        // Тайлы перечитываются поверх старых canvas: сервер отвечает 304 на неизменившиеся
+        refresh: function () {
+            if (!this._map) {
+                return;
+            }
+            Object.keys(this._tiles).forEach((key) => {
+                const tile = this._tiles[key];
+                if (tile.current) {
+                    this._load(tile.el, this._wrapCoords(tile.coords));
+                }
+            });
+        },
+
+        _onClick: function (event) {
+            const map = this._map;
+            const zoom = this._tileZoom;
+            if (zoom === undefined) {
+                return;
+            }
+            const size = this.getTileSize();
+            const point = map.project(event.latlng, zoom);
+            const coords = point.unscaleBy(size).floor();
+            coords.z = zoom;
+            const tile = this._features[this._tileCoordsToKey(this._wrapCoords(coords))];
+            if (!tile) {
+                return;
+            }
+            // Ближайшая точка в пределах её кружка (+2 px на промах пальцем)
+            const scale = size.x / tile.extent;
+            const local = point.subtract(coords.scaleBy(size));
+            let best = null;
+            let bestDistance = Infinity;
+            tile.features.forEach((feature) => {
+                const distance = local.distanceTo(L.point(feature.x * scale, feature.y * scale));
+                if (distance <= pointStyle(feature.properties).radius + 2 && distance < bestDistance) {
+                    best = feature;
+                    bestDistance = distance;
+                }
+            });
+            if (!best) {
+                return;
+            }
+            const latLng = map.unproject(coords.scaleBy(size).add(L.point(best.x * scale, best.y * scale)), zoom);
+            const count = best.properties.count;
+            if (count > 1 && zoom < map.getMaxZoom()) {
+                map.setView(latLng, Math.min(zoom + 2, map.getMaxZoom()));
+                return;
+            }
+            // Названия и описания в тайлах нет — место запрашивается по id
+            fetch("/api/place?id=" + best.id)
+                .then((response) => response.json())
+                .then((place) => {
+                    L.popup().setLatLng(latLng).setContent(placePopup(place, count)).openOn(map);
+                });
+        },
+    });
+
+    window.travelVectorTiles = function (url, options) {
+        return new VectorPlaces(url, options);
+    };
+})();
@@ -0,0 +1,340 @@
+"""Векторные тайлы мест (Mapbox Vector Tile 2.1) для карты большого каталога.
+
+Тайл z/x/y — слой LAYER_NAME с точками мест в координатах 0..EXTENT: id
+места, rating и visited (посещено ли место текущим пользователем). Места,
+попавшие в одну ячейку CELL_PX x CELL_PX пикселей, сливаются в точку с
+атрибутом count, средним рейтингом и числом посещённых: мельче кружка
+маркера их всё равно не различить, а размер тайла ограничен числом ячеек
+(не больше 4096 точек), а не числом мест. Название и описание в тайл не
+входят — страница запрашивает их у /api/place по id при клике.
+
+* Protobuf кодируется вручную: схема MVT — три вложенных сообщения, и
+  зависимость ради них не нужна.
+* Места отсортированы по коду Мортона на уровне MAX_TILE_ZOOM, так что
+  места любого тайла — непрерывный отрезок массива (два searchsorted).
+  Тайл включает поле BUFFER вокруг себя, чтобы кружки на стыке тайлов
+  рисовались целиком.
+* Тайлы собираются по запросу и хранятся в LRU-кэше. Посещение сбрасывает
+  только тайлы, чьё поле задевает место (по одному-два на уровень), замена
+  мест — весь кэш. Уровни можно собрать заранее пулом процессов (prebuild).
+"""
+import gzip
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from clustering import project
+from instrumentation import tracer, traced
+
+LAYER_NAME = "places"
+EXTENT = 4096
+TILE_SIZE = 256  # пикселей в тайле на экране
+PIXEL = EXTENT // TILE_SIZE
+CELL_PX = 4
+BUFFER = 8 * PIXEL  # радиус кружка на странице
+MAX_TILE_ZOOM = 24  # 2 * 24 бита кода Мортона помещаются в int64
+PREBUILD_MAX_ZOOM = 13
+VECTOR_TILE_CACHE_SIZE = 16384  # тайлов в памяти
+MVT_VERSION = 2
+# Типы значений атрибутов в сообщении Value
+VALUE_DOUBLE, VALUE_UINT = 3, 5
+POINT = 1
+MOVE_TO_ONE = (1 << 3) | 1  # команда MoveTo с одной точкой
+KEYS = ("count", "rating", "visited")
+
+# Готовый тайл: тело, оно же в gzip (None, если сжимать нечего) и ETag
+VectorTile = namedtuple("VectorTile", "data gzipped etag")
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# Координаты в тайле с полем, номера тегов и длины точек меньше 2 ** 14 — их varint берутся из таблицы
+_VARINTS = [_encode_varint(value) for value in range(1 << 14)]
+
+
+def _varint(value):
+    return _VARINTS[value] if value < 16384 else _encode_varint(value)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, payload):
+    # Поле с длиной (wire type 2): вложенное сообщение, строка или упакованный массив
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _value(value):
+    if isinstance(value, float):
+        return bytes([(VALUE_DOUBLE << 3) | 1]) + np.float64(value).tobytes()
+    return bytes([VALUE_UINT << 3]) + _varint(value)
+
+
+def _spread_bits(values):
+    # Биты числа через один: b2 b1 b0 -> b2 0 b1 0 b0
+    values = values.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(tx, ty):
+    """Код Мортона тайлов: биты x на нечётных позициях, y — на чётных."""
+    return ((_spread_bits(np.asarray(tx)) << np.uint64(1)) | _spread_bits(np.asarray(ty))).astype(np.int64)
+
+
+class TileIndex:
+    """Места в порядке кодов Мортона и сборка тайлов по ним; без блокировок, поэтому передаётся в процессы пула."""
+
+    def __init__(self, locations=(), visited=()):
+        locations = list(locations)
+        lat = np.fromiter((location.latitude for location in locations), dtype=np.float64, count=len(locations))
+        lon = np.fromiter((location.longitude for location in locations), dtype=np.float64, count=len(locations))
+        x, y = project(lat, lon)
+        scale = 1 << MAX_TILE_ZOOM
+        codes = morton_codes((x * scale).astype(np.int64), (y * scale).astype(np.int64))
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.x, self.y = x[order], y[order]
+        self.ids = np.fromiter((location.id for location in locations), dtype=np.int64, count=len(locations))[order]
+        self.rating = np.fromiter((location.rating for location in locations), dtype=np.float64,
+                                  count=len(locations))[order]
+        self.position = {place: i for i, place in enumerate(self.ids.tolist())}
+        self.visited = np.zeros(len(locations), dtype=bool)
+        self.mark_visited(visited)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mark_visited(self, places):
+        """Отмечает места посещёнными; возвращает позиции тех, что есть в индексе."""
+        positions = [self.position[place] for place in places if place in self.position]
+        self.visited[positions] = True
+        return positions
+
+    def tiles(self, zoom):
+        """Непустые тайлы уровня: массивы x и y по возрастанию кода Мортона."""
+        prefixes = self.codes >> (2 * (MAX_TILE_ZOOM - zoom))
+        # Первое место с каждым префиксом даёт координаты его тайла
+        first = np.flatnonzero(np.r_[True, prefixes[1:] != prefixes[:-1]]) if len(prefixes) else prefixes
+        n = 1 << zoom
+        return (self.x[first] * n).astype(np.int64), (self.y[first] * n).astype(np.int64)
+
+    def covering(self, position):
+        """Тайлы всех уровней, в поле которых попадает место: список (z, x, y)."""
+        keys = []
+        for zoom in range(MAX_TILE_ZOOM + 1):
+            n = 1 << zoom
+            px, py = self.x[position] * n * EXTENT, self.y[position] * n * EXTENT
+            xs = range(max(int((px - BUFFER) // EXTENT), 0), min(int((px + BUFFER) // EXTENT), n - 1) + 1)
+            ys = range(max(int((py - BUFFER) // EXTENT), 0), min(int((py + BUFFER) // EXTENT), n - 1) + 1)
+            keys.extend((zoom, x, y) for x in xs for y in ys)
+        return keys
+
+    def _candidates(self, z, x, y):
+        # Отрезки массива для тайла и восьми соседей (из соседей нужно только поле BUFFER)
+        n = 1 << z
+        shift = 2 * (MAX_TILE_ZOOM - z)
+        neighbours = [(x + dx, y + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                      if 0 <= x + dx < n and 0 <= y + dy < n]
+        tx = np.array([t[0] for t in neighbours], dtype=np.int64)
+        ty = np.array([t[1] for t in neighbours], dtype=np.int64)
+        low = morton_codes(tx, ty) << shift
+        starts = np.searchsorted(self.codes, low)
+        ends = np.searchsorted(self.codes, low + (1 << shift))
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts.tolist(), ends.tolist())])
+
+    def encode(self, z, x, y):
+        """Тайл z/x/y в формате MVT; пустой тайл — пустая строка байт."""
+        n = 1 << z
+        candidates = self._candidates(z, x, y)
+        px = np.floor((self.x[candidates] * n - x) * EXTENT).astype(np.int64)
+        py = np.floor((self.y[candidates] * n - y) * EXTENT).astype(np.int64)
+        inside = (px >= -BUFFER) & (px < EXTENT + BUFFER) & (py >= -BUFFER) & (py < EXTENT + BUFFER)
+        candidates, px, py = candidates[inside], px[inside], py[inside]
+        if not len(candidates):
+            return b""
+        # Места одной ячейки сливаются в точку места с меньшим id
+        by_id = np.argsort(self.ids[candidates], kind="stable")
+        candidates, px, py = candidates[by_id], px[by_id], py[by_id]
+        cell = CELL_PX * PIXEL
+        span = (EXTENT + 2 * BUFFER) // cell + 1
+        cells = ((px + BUFFER) // cell) * span + (py + BUFFER) // cell
+        _, first, inverse, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+        rating = np.bincount(inverse, weights=self.rating[candidates]) / counts
+        visited = np.bincount(inverse, weights=self.visited[candidates]).astype(np.int64)
+        return self._layer(candidates[first], px[first], py[first], counts, rating, visited)
+
+    def _layer(self, places, px, py, counts, rating, visited):
+        values = {}
+        value_list = []
+
+        def value_index(value):
+            # Ключ с типом: для dict 1 и 1.0 равны, а в тайле это разные значения
+            key = (type(value), value)
+            index = values.get(key)
+            if index is None:
+                index = values[key] = len(value_list)
+                value_list.append(value)
+            return index
+
+        features = []
+        for place, x, y, count, mean, seen in zip(places.tolist(), px.tolist(), py.tolist(), counts.tolist(),
+                                                  np.round(rating, 1).tolist(), visited.tolist()):
+            tags = [1, value_index(mean), 2, value_index(seen)]
+            if count > 1:
+                tags += [0, value_index(count)]
+            geometry = _varint(MOVE_TO_ONE) + _varint(_zigzag(x)) + _varint(_zigzag(y))
+            feature = (
+                b"\x08" + _varint(int(self.ids[place]))
+                + _field(2, b"".join(_varint(tag) for tag in tags))
+                + b"\x18" + _varint(POINT)
+                + _field(4, geometry)
+            )
+            features.append(_field(2, feature))
+        layer = (
+            _field(1, LAYER_NAME.encode("ascii"))
+            + b"".join(features)
+            + b"".join(_field(3, key.encode("ascii")) for key in KEYS)
+            + b"".join(_field(4, _value(value)) for value in value_list)
+            + b"\x28" + _varint(EXTENT)
+            + b"\x78" + _varint(MVT_VERSION)
+        )
+        return _field(3, layer)
+
+
+def pack_tile(data):
+    """VectorTile из тела тайла: сжатие и ETag считаются один раз при сборке."""
+    gzipped = gzip.compress(data, compresslevel=6, mtime=0) if len(data) > 256 else None
+    return VectorTile(data, gzipped, '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"')
+
+
+_index = None
+
+
+def _init_worker(index):
+    global _index
+    _index = index
+
+
+def _encode_in_worker(tile):
+    return tile, _index.encode(*tile)
+
+
+class VectorTileCache:
+    """Тайлы по запросу с LRU-кэшем на capacity тайлов.
+
+    Тайлы запрашивают потоки сервера, посещения приходят из приложения.
+    Каждое изменение увеличивает номер поколения; тайл, собранный по
+    данным прошлого поколения, в кэш не кладётся.
+    """
+
+    def __init__(self, locations=(), visited=(), capacity=VECTOR_TILE_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()
+        self._generation = 0
+        self.reset(locations, visited)
+
+    def reset(self, locations, visited=()):
+        """Новый набор мест и посещённых текущим пользователем; кэш очищается."""
+        index = TileIndex(locations, visited)
+        with self._lock:
+            self._index = index
+            self._tiles.clear()
+            self._generation += 1
+
+    def record_visits(self, places):
+        """Отмечает посещения текущего пользователя и сбрасывает задетые ими тайлы."""
+        with self._lock:
+            for position in self._index.mark_visited(places):
+                for key in self._index.covering(position):
+                    self._tiles.pop(key, None)
+            self._generation += 1
+
+    def record_visit(self, place):
+        self.record_visits((place,))
+
+    def _store(self, key, tile, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            if len(self._tiles) > self.capacity:
+                self._tiles.popitem(last=False)
+
+    def get(self, z, x, y):
+        """VectorTile для z/x/y или None, если такого тайла нет."""
+        if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return None
+        key = (z, x, y)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            index, generation = self._index, self._generation
+        if tile is not None:
+            tracer.count("vtiles.cache_hits")
+            return tile
+        with tracer.span("vtiles.render"):
+            tile = pack_tile(index.encode(z, x, y))
+        self._store(key, tile, generation)
+        return tile
+
+    @traced("vtiles.prebuild")
+    def prebuild(self, min_zoom=0, max_zoom=PREBUILD_MAX_ZOOM, workers=None):
+        """Собирает непустые тайлы уровней min_zoom..max_zoom; возвращает их число.
+
+        Собирается не больше capacity тайлов, начиная с мелких уровней: больше
+        кэш не удержит, и лишние тайлы только вытеснили бы уже собранные.
+        При workers > 1 тайлы кодируются пулом процессов. Если места или
+        посещения изменились во время сборки, оставшиеся тайлы отбрасываются —
+        их соберёт запрос.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        with self._lock:
+            index, generation = self._index, self._generation
+        tiles = list(islice((
+            (zoom, x, y)
+            for zoom in range(min_zoom, min(max_zoom, MAX_TILE_ZOOM) + 1)
+            for x, y in zip(*(axis.tolist() for axis in index.tiles(zoom)))
+        ), self.capacity))
+        if workers <= 1 or len(tiles) < 2:
+            results = ((tile, index.encode(*tile)) for tile in tiles)
+            return self._collect(results, generation)
+        # spawn, как в tracks: fork из многопоточного процесса GUI небезопасен
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, context, initializer=_init_worker, initargs=(index,)) as pool:
+            chunksize = max(1, min(64, len(tiles) // (4 * workers)))
+            return self._collect(pool.map(_encode_in_worker, tiles, chunksize=chunksize), generation)
+
+    def _collect(self, results, generation):
+        built = 0
+        for key, data in results:
+            if generation != self._generation:
+                break
+            self._store(key, pack_tile(data), generation)
+            built += 1
+        return built
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._tiles), "bytes": sum(len(tile.data) for tile in self._tiles.values())}
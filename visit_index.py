@@ -0,0 +1,245 @@
+"""Индексы поверх VisitMatrix: рейтинг пользователей, посетители мест и рекомендации от друзей.
+
+VisitIndex меняет матрицу сам (visit/visit_many) и сразу обновляет:
+
+* Leaderboard — пользователи, разложенные по числу мест, и дерево Фенвика
+  по этому числу. Посещение переносит пользователя в соседнюю корзину и
+  обновляет дерево за O(log P), где P — число мест; место в рейтинге — одна
+  префиксная сумма, первые k — проход по непустым корзинам сверху.
+* обратный индекс «место → строки посетителей» — массивы array('i'), которые
+  только дописываются (посещения не отменяются).
+* рекомендации «где были друзья, а я нет» — кэш по пользователю; запись
+  действительна, пока не изменились версии его строки и строк друзей.
+"""
+import bisect
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+RECOMMENDATION_CACHE_SIZE = 1024  # пользователей
+
+
+class Leaderboard:
+    """Пользователи, упорядоченные по числу посещённых мест.
+
+    Равные по числу мест идут в порядке, в котором они этого числа достигли.
+    """
+
+    def __init__(self, max_count):
+        self.max_count = max_count
+        self.buckets = {}  # число мест -> {строка: None}, упорядочено по времени попадания
+        self.levels = []  # непустые значения числа мест по возрастанию
+        self.tree = [0] * (max_count + 2)  # дерево Фенвика: пользователей с данным числом мест
+        self.total = 0
+
+    def _add(self, count, delta):
+        i = count + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _at_most(self, count):
+        """Число пользователей, у которых не больше count мест."""
+        i, total = min(count, self.max_count) + 1, 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def insert(self, row, count):
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            bucket = self.buckets[count] = {}
+            bisect.insort(self.levels, count)
+        bucket[row] = None
+        self._add(count, 1)
+        self.total += 1
+
+    def move(self, row, old, new):
+        """Пользователь row перешёл с old на new мест."""
+        bucket = self.buckets[old]
+        del bucket[row]
+        if not bucket:
+            del self.buckets[old]
+            del self.levels[bisect.bisect_left(self.levels, old)]
+        self._add(old, -1)
+        self.total -= 1
+        self.insert(row, new)
+
+    def move_many(self, moves):
+        """Переходы (строка, было, стало) по порядку; большой пакет пересобирает дерево целиком."""
+        if len(moves) * self.max_count.bit_length() < self.max_count:
+            for row, old, new in moves:
+                self.move(row, old, new)
+            return
+        for row, old, new in moves:
+            bucket = self.buckets[old]
+            del bucket[row]
+            if not bucket:
+                del self.buckets[old]
+            self.buckets.setdefault(new, {})[row] = None
+        self.levels = sorted(self.buckets)
+        # Дерево Фенвика строится за линейное время из размеров корзин
+        tree = [0] * len(self.tree)
+        for count, bucket in self.buckets.items():
+            tree[count + 1] = len(bucket)
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def rank(self, count):
+        """Место в рейтинге для count мест: 1 + число пользователей, у которых мест больше."""
+        return self.total - self._at_most(count) + 1
+
+    def top(self, k):
+        """Строки первых k пользователей и их число мест."""
+        result = []
+        for level in reversed(self.levels):
+            for row in self.buckets[level]:
+                if len(result) == k:
+                    return result
+                result.append((row, level))
+        return result
+
+
+class VisitIndex:
+    """Рейтинг, обратный индекс и рекомендации для VisitMatrix.
+
+    Посещения нужно отмечать через visit/visit_many индекса, а не матрицы
+    напрямую, иначе индекс отстанет. После замены матрицы (resized) индекс
+    строится заново.
+    """
+
+    def __init__(self, matrix, cache_size=RECOMMENDATION_CACHE_SIZE):
+        self.matrix = matrix
+        self.cache_size = cache_size
+        self.leaderboard = Leaderboard(matrix.num_places)
+        self.visitors = [array("i") for _ in range(matrix.num_places + 1)]
+        self.versions = np.zeros(len(matrix.bits), dtype=np.int64)
+        self._recommendations = OrderedDict()
+        counts = matrix.counts()
+        for row in np.argsort(-counts, kind="stable"):
+            self.leaderboard.insert(int(row), int(counts[row]))
+        rows, places = self._nonzero(matrix._rows())
+        order = np.argsort(places, kind="stable")
+        rows, places = rows[order].astype(np.int32), places[order]
+        bounds = np.searchsorted(places, np.arange(matrix.num_places + 2))
+        for place in np.flatnonzero(np.diff(bounds)):
+            self.visitors[place].frombytes(rows[bounds[place]:bounds[place + 1]].tobytes())
+
+    @staticmethod
+    def _nonzero(bits):
+        """Пары (строка, id места) всех установленных бит; разбираются только ненулевые слова."""
+        rows, words = np.nonzero(bits)
+        unpacked = np.unpackbits(bits[rows, words].astype("<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        hits, offsets = np.nonzero(unpacked)
+        return rows[hits].astype(np.int64), words[hits].astype(np.int64) * 64 + offsets
+
+    def add_user(self, name):
+        """Строка пользователя; новый попадает в рейтинг с нулём мест."""
+        row = self.matrix.index.get(name)
+        if row is None:
+            row = self.matrix.add_user(name)
+            if len(self.versions) < len(self.matrix.bits):
+                self.versions = np.concatenate([self.versions, np.zeros(len(self.matrix.bits) - len(self.versions), dtype=np.int64)])
+            self.leaderboard.insert(row, 0)
+        return row
+
+    def visit(self, name, place):
+        return self.visit_many(name, (place,))
+
+    def visit_many(self, name, places):
+        """Отмечает посещения; возвращает список мест, которые посещены впервые."""
+        row = self.add_user(name)
+        added = [place for place in dict.fromkeys(places) if not self.matrix.has_visited(name, place)]
+        if not added:
+            return added
+        old = self.matrix.count(name)
+        self.matrix.visit_many(name, added)
+        self.leaderboard.move(row, old, old + len(added))
+        for place in added:
+            self.visitors[place].append(row)
+        self.versions[row] += 1
+        return added
+
+    def visit_batch(self, rows, places):
+        """Пакет посещений: rows[i] (строки из add_user) посетил places[i].
+
+        Возвращает новые пары (строки и места), упорядоченные по строке и месту;
+        уже отмеченные посещения и повторы отбрасываются.
+        """
+        matrix = self.matrix
+        stride = matrix.words * 64
+        rows, places = np.divmod(np.unique(np.asarray(rows, dtype=np.int64) * stride + places), stride)
+        bits = matrix.bits[rows, places >> 6] >> (places & 63).astype(np.uint64)
+        new = (bits & np.uint64(1)) == 0
+        rows, places = rows[new], places[new]
+        if not len(rows):
+            return rows, places
+        touched, added = np.unique(rows, return_counts=True)
+        old = matrix.user_counts[touched].tolist()
+        matrix.visit_batch(rows, places)
+        self.leaderboard.move_many([
+            (row, before, before + count) for row, before, count in zip(touched.tolist(), old, added.tolist())
+        ])
+        self.versions[touched] += 1
+        for row, place in zip(rows.tolist(), places.tolist()):
+            self.visitors[place].append(row)
+        return rows, places
+
+    def rank(self, name):
+        """Место пользователя в рейтинге (1 — больше всех мест) или None, если его нет."""
+        if name not in self.matrix.index:
+            return None
+        return self.leaderboard.rank(self.matrix.count(name))
+
+    def top(self, k=10):
+        """k пользователей с наибольшим числом мест: список пар (имя, число мест)."""
+        return [(self.matrix.names[row], count) for row, count in self.leaderboard.top(k)]
+
+    def place_visitors(self, place, offset=0, limit=None):
+        """Имена посетивших место в порядке их посещений; offset и limit — страница списка."""
+        if not 1 <= place <= self.matrix.num_places:
+            return []
+        names = self.matrix.names
+        rows = self.visitors[place][offset:None if limit is None else offset + limit]
+        return [names[row] for row in rows]
+
+    def recommendations(self, name, friends, k=20):
+        """Места, где были друзья, а пользователь нет: пары (id места, сколько друзей там были).
+
+        Сначала места, где побывало больше друзей, при равенстве — меньший id.
+        """
+        index = self.matrix.index
+        rows = np.array([index[friend] for friend in friends if friend in index and friend != name], dtype=np.int64)
+        own = index.get(name)
+        key = (name, rows.tobytes())
+        stamp = np.append(self.versions[rows], -1 if own is None else self.versions[own])
+        cached = self._recommendations.get(name)
+        if cached is not None and cached[0] == key and np.array_equal(cached[1], stamp) and (cached[3] or len(cached[2]) >= k):
+            self._recommendations.move_to_end(name)
+            return cached[2][:k]
+
+        counts = np.zeros(self.matrix.num_places + 1, dtype=np.int64)
+        if len(rows):
+            _, places = self._nonzero(self.matrix.bits[rows])
+            counts = np.bincount(places, minlength=len(counts))
+        if own is not None:
+            counts[self.matrix.visited(name)] = 0
+        candidates = np.flatnonzero(counts)
+        # В кэш идёт с запасом, чтобы запрос с другим k не пересчитывал всё заново
+        limit = max(k, 100)
+        complete = len(candidates) <= limit
+        if not complete:
+            threshold = np.partition(counts[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[counts[candidates] >= threshold]
+        candidates = candidates[np.lexsort((candidates, -counts[candidates]))][:limit]
+        result = [(int(place), int(counts[place])) for place in candidates]
+        self._recommendations[name] = (key, stamp, result, complete)
+        self._recommendations.move_to_end(name)
+        if len(self._recommendations) > self.cache_size:
+            self._recommendations.popitem(last=False)
+        return result[:k]
@@ -0,0 +1,222 @@
+"""Журнал посещений в locations.db: события только дописываются, состояние — снимок + хвост.
+
+Запись идёт через очередь: record() лишь кладёт событие в память, а фоновый
+поток пишет накопленное одной транзакцией раз в flush_interval секунд или как
+только в очереди набралось batch_size событий. База работает в режиме WAL с
+synchronous=NORMAL: зафиксированная транзакция переживает падение процесса,
+теряются только события последнего неполного интервала.
+
+Состояние «кто где был» при запуске не пересчитывается по всем событиям:
+visit_snapshot хранит битовые строки пользователей на момент события seq, и
+поверх них проигрывается только хвост журнала. Когда хвост вырастает больше
+SNAPSHOT_EVERY событий, снимок переписывается. Сами события не удаляются.
+"""
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from location_store import DB_PATH
+from visits_bitset import VisitMatrix
+
+FLUSH_INTERVAL = 1.0  # секунд
+BATCH_SIZE = 5000
+SNAPSHOT_EVERY = 100_000  # событий в хвосте журнала
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visit_events (
+    seq INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    place_id INTEGER NOT NULL,
+    visited_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS visit_snapshot (
+    user TEXT PRIMARY KEY,
+    places BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS visit_snapshot_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL,
+    place_counts BLOB
+);
+"""
+
+
+class VisitLog:
+    def __init__(self, path=DB_PATH, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        # Соединением пользуются вызывающий поток и поток записи, поочерёдно под _write_lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.tail = 0  # событий после снимка
+        self._queue = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, name="visit-log", daemon=True)
+        self._writer.start()
+
+    def is_empty(self):
+        """True, если в журнале ещё нет ни одного посещения (первый запуск)."""
+        self.flush()
+        with self._write_lock:
+            (empty,) = self.conn.execute(
+                "SELECT NOT EXISTS (SELECT 1 FROM visit_events) AND NOT EXISTS (SELECT 1 FROM visit_snapshot)"
+            ).fetchone()
+        return bool(empty)
+
+    def record(self, user, place):
+        """Ставит посещение в очередь на запись; не ждёт диска."""
+        self.record_many(user, (place,))
+
+    def record_many(self, user, places):
+        now = time.time()
+        with self._cond:
+            self._queue.extend((user, int(place), now) for place in places)
+            self.tail += len(places)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Записывает очередь одной транзакцией; возвращает число записанных событий."""
+        with self._write_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        with self._cond:
+            batch, self._queue = self._queue, []
+        if batch:
+            with self.conn:
+                self.conn.executemany("INSERT INTO visit_events (user, place_id, visited_at) VALUES (?, ?, ?)", batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._queue) >= self.batch_size, self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def load(self, num_places):
+        """Посещения всех пользователей: снимок плюс хвост журнала, в виде VisitMatrix."""
+        self.flush()
+        with self._write_lock:
+            row = self.conn.execute("SELECT seq, place_counts FROM visit_snapshot_meta WHERE id = 1").fetchone()
+            base, place_counts = row if row else (0, None)
+            # Битовые строки снимка копируются в матрицу как есть, без разбора по местам
+            snapshot = self.conn.execute("SELECT user, places FROM visit_snapshot ORDER BY rowid").fetchall()
+            words = max((len(blob) // 8 for _, blob in snapshot), default=0)
+            bits = np.zeros((len(snapshot), words), dtype=np.uint64)
+            for i, (_, blob) in enumerate(snapshot):
+                bits[i, :len(blob) // 8] = np.frombuffer(blob, dtype="<u8")
+            if place_counts is not None:
+                place_counts = np.frombuffer(place_counts, dtype="<i8")
+            matrix = VisitMatrix.from_bits(num_places, [user for user, _ in snapshot], bits, place_counts)
+            # Хвост журнала: пользователи добавляются в порядке первого события
+            rows, places, seq = [], [], base
+            for seq, user, place in self.conn.execute(
+                "SELECT seq, user, place_id FROM visit_events WHERE seq > ? ORDER BY seq", (base,)
+            ):
+                row = matrix.index.get(user)
+                rows.append(matrix.add_user(user) if row is None else row)
+                places.append(place)
+            if places:
+                rows = np.array(rows, dtype=np.int64)
+                places = np.array(places, dtype=np.int64)
+                valid = (places >= 1) & (places <= num_places)
+                matrix.visit_batch(rows[valid], places[valid])
+            self.tail = len(places)
+            if self.tail >= self.snapshot_every:
+                self._write_snapshot(matrix, seq)
+        return matrix
+
+    def remap_places(self, mapping):
+        """Переписывает id мест в журнале после замены каталога: mapping — {старый id: новый id}.
+
+        Посещения мест, которых нет в mapping, получают id 0 и дальше
+        пропускаются: события не удаляются, чтобы номера seq не переиспользовались
+        (по ним друзья узнают, что уже получили). Снимок сбрасывается, и следующий
+        load проигрывает журнал целиком.
+        """
+        self.flush()
+        with self._write_lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE place_map (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+            self.conn.executemany("INSERT INTO place_map VALUES (?, ?)", mapping.items())
+            self.conn.execute(
+                "UPDATE visit_events SET place_id = coalesce((SELECT new FROM place_map WHERE old = place_id), 0) "
+                "WHERE place_id != 0"
+            )
+            self.conn.execute("DROP TABLE place_map")
+            self.conn.execute("DELETE FROM visit_snapshot")
+            self.conn.execute("DELETE FROM visit_snapshot_meta")
+
+    def last_seq(self):
+        """Номер последнего записанного события (очередь сначала дописывается)."""
+        self.flush()
+        with self._write_lock:
+            (seq,) = self.conn.execute("SELECT coalesce(max(seq), 0) FROM visit_events").fetchone()
+        return seq
+
+    def events_since(self, seq):
+        """События после seq по порядку: (номера событий, имена пользователей, строки, id мест).
+
+        Строки — номера в списке имён.
+        """
+        self.flush()
+        with self._write_lock:
+            events = self.conn.execute(
+                "SELECT seq, user, place_id FROM visit_events WHERE seq > ? AND place_id != 0 ORDER BY seq", (seq,)
+            ).fetchall()
+        names, index, rows = [], {}, np.empty(len(events), dtype=np.int64)
+        for i, (_, user, _) in enumerate(events):
+            row = index.get(user)
+            if row is None:
+                row = index[user] = len(names)
+                names.append(user)
+            rows[i] = row
+        seqs = np.fromiter((event[0] for event in events), dtype=np.int64, count=len(events))
+        places = np.fromiter((event[2] for event in events), dtype=np.int64, count=len(events))
+        return seqs, names, rows, places
+
+    def snapshot(self, matrix):
+        """Сохраняет matrix как состояние на последнее записанное событие.
+
+        matrix должна содержать все события, переданные в record().
+        """
+        with self._write_lock:
+            self._flush_locked()
+            (seq,) = self.conn.execute("SELECT coalesce(max(seq), 0) FROM visit_events").fetchone()
+            self._write_snapshot(matrix, seq)
+
+    def _write_snapshot(self, matrix, seq):
+        rows = matrix._rows().astype("<u8", copy=False)
+        with self.conn:
+            self.conn.execute("DELETE FROM visit_snapshot")
+            self.conn.executemany(
+                "INSERT INTO visit_snapshot (user, places) VALUES (?, ?)",
+                ((name, rows[row].tobytes()) for row, name in enumerate(matrix.names)),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO visit_snapshot_meta (id, seq, place_counts) VALUES (1, ?, ?)",
+                (seq, matrix.place_counts.astype("<i8").tobytes()),
+            )
+        self.tail = 0
+
+    def close(self, matrix=None):
+        """Останавливает поток записи, дописывает очередь и при длинном хвосте обновляет снимок."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+        if matrix is not None and self.tail >= self.snapshot_every:
+            self.snapshot(matrix)
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,367 @@
+"""Обмен прогрессом с друзьями: компактные дельты посещений и их слияние.
+
+    python visit_sync.py export progress.tvsd --as Вася
+    python visit_sync.py export for-petya.tvsd --peer 3f2a…  (только то, чего у друга ещё нет)
+    python visit_sync.py import friend.tvsd
+
+Посещения — множество пар (пользователь, id места), которые только
+добавляются, поэтому слияние — объединение множеств (G-Set CRDT): оно
+коммутативно, ассоциативно и идемпотентно, и устройства приходят к одному
+состоянию при любом порядке обмена, повторах и потерянных файлах.
+
+Версия — номер события в журнале посещений устройства (visit_events.seq).
+Дельта несёт события отправителя из интервала (base, until] и вектор
+версий: до какого события отправитель уже получил журналы других
+устройств. По этому вектору получатель узнаёт, что у друга уже есть, и
+следующая дельта для него начинается с этой версии. Полученные события,
+которые что-то добавили, дописываются в свой журнал и уходят дальше, так
+что друзья друзей получают их транзитивно; номера, под которыми они
+записаны, запоминаются (sync_origins), и в дельту для устройства, от
+которого они пришли, они не попадают. Дельту с пропуском (base больше
+полученной версии) тоже можно слить, но версия не сдвигается — пропуск
+закроет следующая дельта, начатая с версии из вектора.
+
+Формат файла (little-endian):
+
+    заголовок   HEADER: магия, версия формата, флаги, id устройства (16 байт),
+                base, until, устройств в векторе, пользователей, событий
+    вектор      id устройств по 16 байт, затем их версии u64
+    имена       смещения u32 (пользователей + 1) и UTF-8, выравнивание до 4 байт
+    счётчики    u32 на пользователя: число его событий
+    места       u32 на событие: id мест пользователя по возрастанию, первое
+                как есть, остальные — разностью с предыдущим
+
+Счётчики и места записаны по байтам: сначала младшие байты всех чисел,
+затем вторые и т. д. Разности id — небольшие числа, их старшие байты —
+длинные серии нулей, и zlib (флаг FLAG_ZLIB, сжимается всё после
+заголовка) их почти убирает. DeltaReader разбирает буфер (bytes, memoryview,
+mmap) целыми массивами через np.frombuffer, без разбора по записям, но
+результат — копии: zlib распаковывается в память, а числа собираются из
+плоскостей в новые массивы. Поэтому читатель не держит буфер, и load_delta
+закрывает отображение файла сразу после разбора.
+"""
+import argparse
+import mmap
+import sqlite3
+import struct
+import uuid
+import zlib
+
+import numpy as np
+
+from location_store import DB_PATH
+
+MAGIC = b"TVSD"
+FORMAT_VERSION = 1
+FLAG_ZLIB = 1
+DEVICE_BYTES = 16
+HEADER = struct.Struct("<4sHH16sQQIII")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_device (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    device BLOB NOT NULL,
+    user TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_peers (
+    device BLOB PRIMARY KEY,
+    received INTEGER NOT NULL DEFAULT 0,
+    acked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sync_origins (
+    after INTEGER PRIMARY KEY,
+    last INTEGER NOT NULL,
+    device BLOB NOT NULL
+);
+"""
+
+
+def _planes(values):
+    """u32 по байтам: младшие байты всех чисел, затем вторые и т. д."""
+    return np.ascontiguousarray(values, dtype="<u4").view(np.uint8).reshape(-1, 4).T.tobytes()
+
+
+def encode_delta(device, base, until, names, rows, places, versions=None, compress=True):
+    """Дельта в байтах: события rows[i] -> places[i] (строки — номера в names) из интервала (base, until].
+
+    versions — словарь id устройства -> полученная от него версия. Повторы
+    событий и пользователи без событий в файл не попадают.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    places = np.asarray(places, dtype=np.int64)
+    stride = int(places.max()) + 1 if len(places) else 1
+    rows, places = np.divmod(np.unique(rows * stride + places), stride)
+    # Строки пересчитываются по тем, у кого есть события
+    used, rows = np.unique(rows, return_inverse=True)
+    names = [names[row] for row in used.tolist()]
+    counts = np.bincount(rows.reshape(-1), minlength=len(names))
+    deltas = places.copy()
+    same = np.flatnonzero(rows[1:] == rows[:-1]) + 1
+    deltas[same] -= places[same - 1]
+
+    versions = sorted((versions or {}).items())
+    encoded = [name.encode("utf-8") for name in names]
+    offsets = np.cumsum([0] + [len(name) for name in encoded])
+    blob = b"".join(encoded)
+    body = b"".join([
+        b"".join(device for device, _ in versions),
+        np.array([version for _, version in versions], dtype="<u8").tobytes(),
+        offsets.astype("<u4").tobytes(),
+        blob + b"\0" * (-len(blob) % 4),
+        _planes(counts),
+        _planes(deltas),
+    ])
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, FLAG_ZLIB if compress else 0, device, base, until,
+                         len(versions), len(names), len(places))
+    return header + (zlib.compress(body, 6) if compress else body)
+
+
+class DeltaReader:
+    """Разобранная дельта: заголовок, вектор версий, имена и массивы счётчиков и разностей.
+
+    Массивы собираются из байтовых плоскостей в новые, так что после разбора
+    буфер можно освободить.
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise ValueError("Файл обмена обрезан")
+        magic, version, flags, device, base, until, peers, users, events = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Это не файл обмена прогрессом")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Неизвестная версия формата обмена: {version}")
+        self.device, self.base, self.until = device, base, until
+        body = view[HEADER.size:]
+        if flags & FLAG_ZLIB:
+            try:
+                body = memoryview(zlib.decompress(body))
+            except zlib.error as error:
+                raise ValueError(f"Файл обмена повреждён: {error}") from error
+        offset = 0
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        def take_planes(count):
+            return take(np.uint8, 4 * count).reshape(4, count).T.copy().view("<u4").reshape(count)
+
+        try:
+            devices = bytes(body[:peers * DEVICE_BYTES])
+            offset = len(devices)
+            seqs = take("<u8", peers)
+            offsets = take("<u4", users + 1)
+            blob = body[offset:offset + int(offsets[-1])]
+            offset += int(offsets[-1]) + (-int(offsets[-1]) % 4)
+            self.counts = take_planes(users)
+            self._deltas = take_planes(events)
+        except ValueError as error:
+            raise ValueError("Файл обмена обрезан") from error
+        if len(devices) != peers * DEVICE_BYTES or int(self.counts.sum(dtype=np.int64)) != events:
+            raise ValueError("Файл обмена повреждён: размеры не сходятся")
+        self.versions = {
+            devices[i * DEVICE_BYTES:(i + 1) * DEVICE_BYTES]: seq for i, seq in enumerate(seqs.tolist())
+        }
+        self.names = [str(blob[a:b], "utf-8") for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def rows(self):
+        """Номер пользователя (в names) для каждого события."""
+        return np.repeat(np.arange(len(self.names), dtype=np.int64), self.counts)
+
+    def places(self):
+        """id мест событий: разности внутри пользователя складываются обратно."""
+        total = np.cumsum(self._deltas, dtype=np.int64)
+        if not len(total):
+            return total
+        # Из накопленной суммы вычитается накопленное до первого события пользователя
+        ends = np.cumsum(self.counts, dtype=np.int64)
+        before = np.r_[0, total][ends - self.counts]
+        return total - np.repeat(before, self.counts)
+
+
+def load_delta(path):
+    """Читает и разбирает файл обмена в DeltaReader; данные читателя — копии.
+
+    Файл отображается в память, а не читается в bytes, чтобы не держать
+    второй экземпляр несжатого файла; после разбора отображение закрывается.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        reader = DeltaReader(data)
+    except ValueError as error:
+        # Кадры трассировки держат представления буфера: закрыть его можно только после except
+        message, reader = str(error), None
+    data.close()
+    if reader is None:
+        raise ValueError(message)
+    return reader
+
+
+def delta_events(reader, place_ids, rename=None):
+    """События дельты: (имена, строки в них, id мест); индекс не нужен, поэтому разбор можно унести в фон.
+
+    rename переименовывает пользователей дельты (например, своё имя у друзей
+    в CURRENT_USER). Места, которых нет среди place_ids (id мест каталога), пропускаются.
+    """
+    rename = rename or {}
+    names = [rename.get(name, name) for name in reader.names]
+    rows, places = reader.rows(), reader.places()
+    valid = np.isin(places, place_ids)
+    return names, rows[valid], places[valid]
+
+
+def read_deltas(paths, place_ids, rename=None):
+    """Читает и разбирает файлы обмена: ([(DeltaReader, delta_events)], [(путь, текст ошибки)])."""
+    loaded, errors = [], []
+    for path in paths:
+        try:
+            reader = load_delta(path)
+        except (OSError, ValueError) as error:
+            errors.append((path, str(error)))
+            continue
+        loaded.append((reader, delta_events(reader, place_ids, rename)))
+    return loaded, errors
+
+
+def merge_events(index, names, rows, places):
+    """Сливает события (см. delta_events) в VisitIndex (объединение множеств); возвращает {имя: новые id мест}."""
+    user_rows = np.array([index.add_user(name) for name in names], dtype=np.int64)
+    rows, places = index.visit_batch(user_rows[rows], places)
+    bounds = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else rows
+    return {
+        index.matrix.names[row]: places[start:end]
+        for row, start, end in zip(rows[bounds].tolist(), bounds.tolist(), np.r_[bounds[1:], len(rows)].tolist())
+    }
+
+
+def merge_delta(index, reader, place_ids, rename=None):
+    """Сливает дельту в VisitIndex; возвращает {имя: новые id мест} (см. delta_events и merge_events)."""
+    return merge_events(index, *delta_events(reader, place_ids, rename))
+
+
+def covered(ranges, seqs):
+    """Маска номеров seqs, попавших в интервалы (after, last] из ranges (массив пар по возрастанию after)."""
+    if not len(ranges):
+        return np.zeros(len(seqs), bool)
+    found = np.searchsorted(ranges[:, 0], seqs, side="left") - 1
+    return (found >= 0) & (seqs <= ranges[np.maximum(found, 0), 1])
+
+
+class SyncState:
+    """id устройства, имя владельца для друзей и версии обмена с каждым устройством (в locations.db)."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO sync_device (id, device) VALUES (1, ?)", (uuid.uuid4().bytes,))
+        self.device, self._user = self.conn.execute("SELECT device, user FROM sync_device WHERE id = 1").fetchone()
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def user(self):
+        """Имя, под которым свои посещения видят друзья; None, пока не задано."""
+        return self._user
+
+    @user.setter
+    def user(self, name):
+        with self.conn:
+            self.conn.execute("UPDATE sync_device SET user = ? WHERE id = 1", (name,))
+        self._user = name
+
+    def versions(self):
+        """Полученные версии всех известных устройств: id -> seq."""
+        return dict(self.conn.execute("SELECT device, received FROM sync_peers"))
+
+    def received(self, device):
+        row = self.conn.execute("SELECT received FROM sync_peers WHERE device = ?", (device,)).fetchone()
+        return row[0] if row else 0
+
+    def acked(self, device=None):
+        """Версия своего журнала, которая уже есть у устройства; без device — минимум по всем друзьям."""
+        if device is None:
+            (version,) = self.conn.execute("SELECT coalesce(min(acked), 0) FROM sync_peers").fetchone()
+            return version
+        row = self.conn.execute("SELECT acked FROM sync_peers WHERE device = ?", (device,)).fetchone()
+        return row[0] if row else 0
+
+    def peers(self):
+        """Известные устройства: список (id, полученная версия, подтверждённая версия)."""
+        return self.conn.execute("SELECT device, received, acked FROM sync_peers ORDER BY rowid").fetchall()
+
+    def origins(self, device):
+        """Интервалы (after, last] номеров своего журнала, пришедших от device: массив пар по возрастанию."""
+        return np.array(
+            self.conn.execute("SELECT after, last FROM sync_origins WHERE device = ? ORDER BY after", (device,)).fetchall(),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+    def record(self, reader, after=0, last=0):
+        """Запоминает версии после слияния дельты; возвращает False, если в ней был пропуск.
+
+        (after, last] — номера, под которыми новые посещения из дельты записаны в свой журнал.
+        """
+        contiguous = reader.base <= self.received(reader.device)
+        with self.conn:
+            if last > after:
+                self.conn.execute("INSERT INTO sync_origins (after, last, device) VALUES (?, ?, ?)",
+                                  (after, last, reader.device))
+            self.conn.execute(
+                "INSERT INTO sync_peers (device, received, acked) VALUES (?, ?, ?) "
+                "ON CONFLICT (device) DO UPDATE SET received = max(received, excluded.received), "
+                "acked = max(acked, excluded.acked)",
+                (reader.device, reader.until if contiguous else 0, reader.versions.get(self.device, 0)),
+            )
+        return contiguous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обмен прогрессом с друзьями через файлы.")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="выгрузить посещения в файл")
+    export.add_argument("out")
+    export.add_argument("--as", dest="user", help="своё имя для друзей (запоминается)")
+    export.add_argument("--peer", help="id устройства друга: только то, чего у него ещё нет")
+    export.add_argument("--full", action="store_true", help="все посещения, а не дельта")
+    load = commands.add_parser("import", help="слить посещения из файлов друзей")
+    load.add_argument("files", nargs="+")
+    commands.add_parser("peers", help="известные устройства и версии")
+    args = parser.parse_args()
+
+    from travel_core import TravelCore
+
+    core = TravelCore(args.db)
+    if args.command == "export":
+        peer = bytes.fromhex(args.peer) if args.peer else None
+        data = core.export_progress(peer, full=args.full, user=args.user)
+        with open(args.out, "wb") as f:
+            f.write(data)
+        reader = DeltaReader(data)
+        print(f"Устройство {reader.device.hex()}: события {reader.base + 1}..{reader.until}, "
+              f"пользователей {len(reader.names)}, посещений {len(reader)}, {len(data):,} байт")
+    elif args.command == "import":
+        for path in args.files:
+            added = core.import_progress(load_delta(path))
+            print(f"{path}: новых посещений {sum(len(places) for places in added.values())} "
+                  f"у {len(added)} пользователей")
+    else:
+        print(f"Это устройство: {core.sync.device.hex()} ({core.sync.user or 'имя не задано'})")
+        for device, received, acked in core.sync.peers():
+            print(f"{device.hex()}: получено до {received}, у него есть до {acked}")
+    core.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import numpy as np
+
+
+def popcount(words):
+    """Число единичных бит в каждой строке массива uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def _bits_to_ids(words):
+    """Номера установленных бит строки — id посещённых мест."""
+    return np.flatnonzero(np.unpackbits(words.astype("<u8", copy=False).view(np.uint8), bitorder="little"))
+
+
+class VisitMatrix:
+    """Посещения «пользователи × места» в виде битовых строк из слов uint64.
+
+    Бит place_id строки пользователя установлен, если место посещено. Строка на
+    100 тыс. мест занимает 12.5 КБ, а пересечения считаются как AND + popcount
+    сразу для многих пар. Число мест у каждого пользователя и число посетителей
+    каждого места поддерживаются при записи, поэтому таблицы лидеров и рейтинги
+    мест не требуют прохода по битам.
+    """
+
+    def __init__(self, num_places, users=None):
+        self.num_places = num_places
+        self.words = (num_places + 1 + 63) // 64  # бит 0 не используется: id мест с 1
+        self.names = []
+        self.index = {}
+        self.bits = np.zeros((max(len(users or ()), 16), self.words), dtype=np.uint64)
+        self.user_counts = np.zeros(len(self.bits), dtype=np.int64)
+        self.place_counts = np.zeros(num_places + 1, dtype=np.int64)
+        for name, visited in (users or {}).items():
+            self.add_user(name, visited)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _rows(self):
+        return self.bits[:len(self.names)]
+
+    @classmethod
+    def from_bits(cls, num_places, names, bits, place_counts=None):
+        """Матрица из готовых битовых строк (например, снимка журнала посещений).
+
+        Строки bits обрезаются или дополняются до нужного числа слов; биты мест
+        вне 1..num_places сбрасываются. place_counts можно передать, если они
+        сохранены вместе со строками, иначе они считаются по битам.
+        """
+        matrix = cls(num_places)
+        bits = np.asarray(bits, dtype=np.uint64)
+        width = min(matrix.words, bits.shape[1]) if bits.ndim == 2 else 0
+        matrix.bits = np.zeros((max(len(names), 16), matrix.words), dtype=np.uint64)
+        matrix.bits[:len(names), :width] = bits[:len(names), :width]
+        matrix.bits[:, 0] &= ~np.uint64(1)
+        tail = (num_places + 1) & 63
+        if tail:
+            matrix.bits[:, -1] &= np.uint64((1 << tail) - 1)
+        matrix.names = list(names)
+        matrix.index = {name: row for row, name in enumerate(matrix.names)}
+        matrix.user_counts = np.zeros(len(matrix.bits), dtype=np.int64)
+        matrix.user_counts[:len(names)] = popcount(matrix._rows())
+        if place_counts is not None and len(place_counts) == num_places + 1:
+            matrix.place_counts = np.array(place_counts, dtype=np.int64)
+        else:
+            for start in range(0, len(names), 1024):
+                chunk = matrix.bits[start:min(start + 1024, len(names))].astype("<u8", copy=False)
+                unpacked = np.unpackbits(chunk.view(np.uint8), axis=1, bitorder="little")
+                matrix.place_counts += unpacked.sum(axis=0, dtype=np.int64)[:num_places + 1]
+        return matrix
+
+    def resized(self, num_places):
+        """Копия матрицы на num_places мест; посещения мест с большими id отбрасываются."""
+        matrix = VisitMatrix(num_places)
+        for name in self.names:
+            ids = self.visited(name)
+            matrix.add_user(name, ids[ids <= num_places])
+        return matrix
+
+    def add_user(self, name, visited=()):
+        if name in self.index:
+            return self.index[name]
+        row = len(self.names)
+        if row == len(self.bits):
+            grown = np.zeros((2 * len(self.bits), self.words), dtype=np.uint64)
+            grown[:row] = self.bits
+            self.bits = grown
+            self.user_counts = np.concatenate([self.user_counts, np.zeros(row, dtype=np.int64)])
+        self.names.append(name)
+        self.index[name] = row
+        self.visit_many(name, visited)
+        return row
+
+    def visit(self, name, place):
+        self.visit_batch([self.add_user(name)], [place])
+
+    def visit_many(self, name, places):
+        places = np.fromiter(places, dtype=np.int64) if not isinstance(places, np.ndarray) else places
+        if len(places):
+            self.visit_batch(np.full(len(places), self.add_user(name), dtype=np.int64), places)
+
+    def visit_batch(self, rows, places):
+        """Пакетная отметка посещений: rows[i] посетил places[i]."""
+        rows = np.asarray(rows, dtype=np.int64)
+        places = np.asarray(places, dtype=np.int64)
+        if len(places) and (places.min() < 1 or places.max() > self.num_places):
+            raise ValueError("id места вне диапазона 1..num_places")
+        # Повторы внутри пакета и уже отмеченные посещения не должны менять счётчики
+        stride = self.words * 64
+        rows, places = np.divmod(np.unique(rows * stride + places), stride)
+        words = places >> 6
+        masks = np.left_shift(np.uint64(1), (places & 63).astype(np.uint64))
+        new = (self.bits[rows, words] & masks) == 0
+        rows, places, words, masks = rows[new], places[new], words[new], masks[new]
+        np.bitwise_or.at(self.bits, (rows, words), masks)
+        np.add.at(self.user_counts, rows, 1)
+        np.add.at(self.place_counts, places, 1)
+
+    def has_visited(self, name, place):
+        row = self.index.get(name)
+        if row is None:
+            return False
+        return bool(self.bits[row, place >> 6] >> np.uint64(place & 63) & np.uint64(1))
+
+    def visited(self, name):
+        """id посещённых мест пользователя (массив по возрастанию)."""
+        row = self.index.get(name)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        return _bits_to_ids(self.bits[row])
+
+    def count(self, name):
+        row = self.index.get(name)
+        return 0 if row is None else int(self.user_counts[row])
+
+    def counts(self):
+        """Число посещённых мест у каждого пользователя в порядке self.names."""
+        return self.user_counts[:len(self.names)].copy()
+
+    def common(self, a, b):
+        """id мест, которые посетили оба пользователя."""
+        if a not in self.index or b not in self.index:
+            return np.empty(0, dtype=np.int64)
+        return _bits_to_ids(self.bits[self.index[a]] & self.bits[self.index[b]])
+
+    def common_counts(self, pairs):
+        """Размеры пересечений для массива пар строк пользователей формы (n, 2)."""
+        pairs = np.asarray(pairs, dtype=np.int64)
+        return popcount(self.bits[pairs[:, 0]] & self.bits[pairs[:, 1]])
+
+    def place_popularity(self):
+        """Число посетителей каждого места; индекс массива — id места."""
+        return self.place_counts.copy()
+
+    def most_visited(self, k=10):
+        """k самых посещаемых мест: список пар (id места, число посетителей)."""
+        popularity = self.place_counts
+        k = min(k, self.num_places)
+        top = np.argpartition(-popularity[1:], k - 1)[:k] + 1 if k > 0 else np.empty(0, dtype=np.int64)
+        top = top[np.lexsort((top, -popularity[top]))]
+        return [(int(place), int(popularity[place])) for place in top]
+
+    def leaderboard(self, k=10):
+        """k пользователей с наибольшим числом мест: список пар (имя, число мест)."""
+        counts = self.user_counts[:len(self.names)]
+        k = min(k, len(counts))
+        if k == 0:
+            return []
+        top = np.argpartition(-counts, k - 1)[:k]
+        top = top[np.lexsort((top, -counts[top]))]
+        return [(self.names[row], int(counts[row])) for row in top]